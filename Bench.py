@@ -0,0 +1,184 @@
+"""
+Bench: search a fixed suite of tactical positions with every combination of
+the selective search options (the null move pruning and the late move
+reductions) and compare how many nodes each one needs with how many of the
+positions it still solves. The positions are the first ones of the "Win at
+Chess" suite, each with the move that wins. A faster setting that solves
+fewer of them isn't worth it.
+
+    python3 Bench.py                      every setting at the default depth
+    python3 Bench.py --depth 4 --config none --config both
+    python3 Bench.py --position wac001 --depth 5
+"""
+import argparse
+import time
+
+import SmartMoveFinder
+from ChessEngine import GameState
+from PGN import moveFromSAN, moveToSAN
+
+# (name, FEN, the best move in SAN)
+positions = [
+    (
+        "wac001",
+        "2rr3k/pp3pp1/1nnqbN1p/3pN3/2pP4/2P3Q1/PPB4P/R4RK1 w - - 0 1",
+        "Qg6",
+    ),
+    ("wac002", "8/7p/5k2/5p2/p1p2P2/Pr1pPK2/1P1R3P/8 b - - 0 1", "Rxb2"),
+    (
+        "wac003",
+        "5rk1/1ppb3p/p1pb4/6q1/3P1p1r/2P1R2P/PP1BQ1P1/5RKN w - - 0 1",
+        "Rg3",
+    ),
+    (
+        "wac004",
+        "r1bq2rk/pp3pbp/2p1p1pQ/7P/3P4/2PB1N2/PP3PPR/2KR4 w - - 0 1",
+        "Qxh7+",
+    ),
+    ("wac005", "5k2/6pp/p1qN4/1p1p4/3P4/2PKP2Q/PP3r2/3R4 b - - 0 1", "Qc4+"),
+    ("wac006", "7k/p7/1R5K/6r1/6p1/6P1/8/8 w - - 0 1", "Rb7"),
+    (
+        "wac007",
+        "rnbqkb1r/pppp1ppp/8/4P3/6n1/7P/PPPNPPP1/R1BQKBNR b KQkq - 0 1",
+        "Ne3",
+    ),
+    (
+        "wac008",
+        "r4q1k/p2bR1rp/2p2Q1N/5p2/5p2/2P5/PP3PPP/R5K1 w - - 0 1",
+        "Rf7",
+    ),
+    (
+        "wac009",
+        "3q1rk1/p4pp1/2pb3p/3p4/6Pr/1PNQ4/P1PB1PP1/4RRK1 b - - 0 1",
+        "Bh2+",
+    ),
+    (
+        "wac010",
+        "2br2k1/2q3rn/p2NppQ1/2p1P3/Pp5R/4P3/1P3PPP/3R2K1 w - - 0 1",
+        "Rxh7",
+    ),
+]
+
+# the name of each setting and its (USE_NULL_MOVE, USE_LMR)
+configs = {
+    "none": (False, False),
+    "nullmove": (True, False),
+    "lmr": (False, True),
+    "both": (True, True),
+}
+
+DEFAULT_DEPTH = 3
+
+
+"""
+search one position with the options as they're set now, from an empty
+transposition table and empty evaluation caches, and return (the move in SAN,
+if it's the best one, nodes, seconds)
+"""
+
+
+def searchPosition(fen, bestSAN, depth, useBitboards=True):
+    gs = GameState.fromFEN(fen, useBitboards, underpromotions=True)
+    validMoves = gs.getValidMoves()
+    bestMove = moveFromSAN(bestSAN, validMoves)
+    if bestMove is None:
+        raise ValueError("%s isn't a legal move in %s" % (bestSAN, fen))
+    SmartMoveFinder.transpositionTable.clear()
+    SmartMoveFinder.clearEvaluationCaches()
+    info = SmartMoveFinder.findBestMoveMinMax(
+        gs, validMoves, None, depth, verbose=False, useBook=False
+    )
+    san = "-" if info.bestMove is None else moveToSAN(gs, info.bestMove, validMoves)
+    return san, info.bestMove == bestMove, info.nodes, info.elapsed()
+
+
+""" run every setting on the positions and return {setting: (solved, nodes, seconds)} """
+
+
+def runBench(depth, configNames, names=None, useBitboards=True):
+    selected = [p for p in positions if names is None or p[0] in names]
+    saved = SmartMoveFinder.USE_NULL_MOVE, SmartMoveFinder.USE_LMR
+    # the tablebases would answer the endgames without a search
+    savedTablebases = SmartMoveFinder.USE_TABLEBASES
+    SmartMoveFinder.USE_TABLEBASES = False
+    totals = {}
+    try:
+        for configName in configNames:
+            SmartMoveFinder.USE_NULL_MOVE, SmartMoveFinder.USE_LMR = configs[configName]
+            solved = nodes = 0
+            seconds = 0.0
+            for name, fen, bestSAN in selected:
+                san, found, n, elapsed = searchPosition(
+                    fen, bestSAN, depth, useBitboards
+                )
+                solved += found
+                nodes += n
+                seconds += elapsed
+                print(
+                    "%-9s %-8s %-7s %-7s %9d nodes %7.2fs  %s"
+                    % (
+                        configName,
+                        name,
+                        san,
+                        bestSAN,
+                        n,
+                        elapsed,
+                        "ok" if found else "missed",
+                    )
+                )
+            totals[configName] = (solved, nodes, seconds)
+    finally:
+        SmartMoveFinder.USE_NULL_MOVE, SmartMoveFinder.USE_LMR = saved
+        SmartMoveFinder.USE_TABLEBASES = savedTablebases
+    print()
+    baseline = totals.get("none")
+    for configName, (solved, nodes, seconds) in totals.items():
+        reduction = ""
+        if baseline is not None and baseline[1]:
+            reduction = ", %+.0f%% nodes" % (100 * (nodes / baseline[1] - 1))
+        print(
+            "%-9s solved %d/%d, %d nodes in %.2fs, %d nodes/s%s"
+            % (
+                configName,
+                solved,
+                len(selected),
+                nodes,
+                seconds,
+                nodes / seconds if seconds > 0 else 0,
+                reduction,
+            )
+        )
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="the selective search options on a suite"
+    )
+    parser.add_argument("--depth", type=int, default=DEFAULT_DEPTH)
+    parser.add_argument(
+        "--config",
+        action="append",
+        choices=list(configs),
+        help="run only this setting, can be given more than once",
+    )
+    parser.add_argument(
+        "--position",
+        action="append",
+        choices=[name for name, _, _ in positions],
+        help="run only this position of the suite, can be given more than once",
+    )
+    parser.add_argument(
+        "--no-bitboards", action="store_true", help="search on the board alone"
+    )
+    args = parser.parse_args()
+    start = time.perf_counter()
+    runBench(
+        args.depth, args.config or list(configs), args.position, not args.no_bitboards
+    )
+    print("total %.1fs" % (time.perf_counter() - start))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
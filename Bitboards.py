@@ -0,0 +1,411 @@
+"""
+This is the bitboard backend for the GameState. Instead of looking at the
+8x8 list of strings square by square, every set of squares is stored as one
+python int (a 64-bit set) where the bit number (row * 8 + col) stands for
+the square (row, col) of the board. So a8 is the bit 0 and h1 is the bit 63,
+which is the same order we read the GameState.board in.
+"""
+import ChessEngine
+
+# the 8 directions as (row, col) steps, the first 4 are the rock ones
+# and the last 4 are the bishop ones
+rockDirections = ((-1, 0), (0, -1), (1, 0), (0, 1))
+bishopDirections = ((-1, -1), (-1, 1), (1, -1), (1, 1))
+allDirections = rockDirections + bishopDirections
+knightSteps = ((-1, -2), (-1, 2), (-2, -1), (-2, 1), (1, -2), (1, 2), (2, -1), (2, 1))
+
+FULL = (1 << 64) - 1  # every square on the board
+
+
+def square(r, c):
+    return r * 8 + c
+
+
+def bit(r, c):
+    return 1 << (r * 8 + c)
+
+
+""" all the squares of a given set as a list of square numbers """
+
+
+def squaresOf(bb):
+    squares = []
+    while bb:
+        lsb = bb & -bb
+        squares.append(lsb.bit_length() - 1)
+        bb ^= lsb
+    return squares
+
+
+""" build a table of the squares that a short range piece can reach from every square """
+
+
+def _stepAttacks(steps):
+    table = []
+    for sq in range(64):
+        r, c = divmod(sq, 8)
+        attacks = 0
+        for dr, dc in steps:
+            if 0 <= r + dr < 8 and 0 <= c + dc < 8:
+                attacks |= bit(r + dr, c + dc)
+        table.append(attacks)
+    return table
+
+
+knightAttacks = _stepAttacks(knightSteps)
+kingAttacks = _stepAttacks(allDirections)
+# the squares a pawn of the given color is attacking (not where it moves to)
+pawnAttacks = {
+    "w": _stepAttacks(((-1, -1), (-1, 1))),
+    "b": _stepAttacks(((1, -1), (1, 1))),
+}
+
+# rays[d][sq]: all the squares from sq (not included) to the edge of the board
+# in the direction d. A direction is "positive" if walking it makes the square
+# number bigger, so the nearest blocker is the lowest set bit, otherwise it's
+# the highest set bit
+rays = {}
+positiveDirection = {}
+for _d in allDirections:
+    positiveDirection[_d] = _d[0] * 8 + _d[1] > 0
+    rays[_d] = []
+    for _sq in range(64):
+        _r, _c = divmod(_sq, 8)
+        _ray = 0
+        for _i in range(1, 8):
+            if 0 <= _r + _d[0] * _i < 8 and 0 <= _c + _d[1] * _i < 8:
+                _ray |= bit(_r + _d[0] * _i, _c + _d[1] * _i)
+        rays[_d].append(_ray)
+
+""" the nearest set square of blockers when walking in the direction d """
+
+
+def _nearest(blockers, d):
+    if positiveDirection[d]:
+        return (blockers & -blockers).bit_length() - 1
+    return blockers.bit_length() - 1
+
+
+""" the squares a sliding piece on sq attacks in the given directions, stopping at the first blocker """
+
+
+def slidingAttacks(sq, occupied, directions):
+    attacks = 0
+    for d in directions:
+        ray = rays[d][sq]
+        blockers = ray & occupied
+        if blockers:
+            # everything behind the nearest blocker can't be reached
+            ray ^= rays[d][_nearest(blockers, d)]
+        attacks |= ray
+    return attacks
+
+
+"""
+the attacks of the sliders looked up instead of walked: a rock or a bishop
+on sq moves along two lines (the rank and the file, or the two diagonals),
+and what it reaches along a line only depends on the pieces on that line.
+So for every square and line there's a dict from the blockers on the line to
+the attacks along it. The squares at the ends of a line never block anything
+behind them, so they're left out of its mask, which keeps every dict at 64
+entries or less
+"""
+
+
+def _lineTables(directions):
+    tables = []
+    for sq in range(64):
+        lines = []
+        for first, second in (directions[0::2], directions[1::2]):
+            mask = 0
+            for d in (first, second):
+                for target in squaresOf(rays[d][sq]):
+                    if rays[d][target]:  # not the last square of the ray
+                        mask |= 1 << target
+            attacks = {}
+            blockers = 0
+            while True:
+                attacks[blockers] = slidingAttacks(sq, blockers, (first, second))
+                # the next subset of the mask
+                blockers = (blockers - mask) & mask
+                if not blockers:
+                    break
+            lines.append((mask, attacks))
+        tables.append(tuple(lines))
+    return tables
+
+
+# rockLines[sq] is ((file mask, file attacks), (rank mask, rank attacks)), and
+# bishopLines[sq] the same for the two diagonals
+rockLines = _lineTables(rockDirections)
+bishopLines = _lineTables(bishopDirections)
+
+
+def bishopAttacks(sq, occupied):
+    (firstMask, first), (secondMask, second) = bishopLines[sq]
+    return first[occupied & firstMask] | second[occupied & secondMask]
+
+
+def rockAttacks(sq, occupied):
+    (firstMask, first), (secondMask, second) = rockLines[sq]
+    return first[occupied & firstMask] | second[occupied & secondMask]
+
+
+def queenAttacks(sq, occupied):
+    return rockAttacks(sq, occupied) | bishopAttacks(sq, occupied)
+
+
+class BitboardSet:
+    """
+    The per piece and per color occupancy sets of one position.
+    pieces["wN"] is the set of the white knights, colors["b"] is the set of
+    every black piece and so on. It's updated by the GameState on every
+    makeMove() and undoMove(), so it always matches GameState.board.
+    """
+
+    pieceNames = tuple(color + piece for color in "wb" for piece in "pNBRQK")
+
+    def __init__(self, board):
+        self.pieces = {piece: 0 for piece in self.pieceNames}
+        self.colors = {"w": 0, "b": 0}
+        for r in range(8):
+            for c in range(8):
+                if board[r][c] != "--":
+                    self.add(board[r][c], square(r, c))
+
+    def add(self, piece, sq):
+        self.pieces[piece] |= 1 << sq
+        self.colors[piece[0]] |= 1 << sq
+
+    def remove(self, piece, sq):
+        self.pieces[piece] &= ~(1 << sq)
+        self.colors[piece[0]] &= ~(1 << sq)
+
+    def occupied(self):
+        return self.colors["w"] | self.colors["b"]
+
+    """ the compatibility view: the same 8x8 list of strings as GameState.board """
+
+    def toBoard(self):
+        board = [["--"] * 8 for _ in range(8)]
+        for piece, bb in self.pieces.items():
+            for sq in squaresOf(bb):
+                board[sq // 8][sq % 8] = piece
+        return board
+
+    """ mirror what GameState.makeMove() did on the board """
+
+    def applyMove(self, move):
+        startSq = move.moveID & 63
+        endSq = move.moveID >> 6 & 63
+        self.remove(move.pieceMoved, startSq)
+        if move.isEnpassantMove:
+            self.remove(move.pieceCaptured, square(move.startRow, move.endCol))
+        elif move.pieceCaptured != "--":
+            self.remove(move.pieceCaptured, endSq)
+        if move.isPawnPromotion:
+            self.add(move.pieceMoved[0] + move.promotionChoice, endSq)
+        else:
+            self.add(move.pieceMoved, endSq)
+        if move.isCastleMove:
+            rock = move.pieceMoved[0] + "R"
+            if move.endCol - move.startCol == 2:  # king side castle
+                self.remove(rock, endSq + 1)
+                self.add(rock, endSq - 1)
+            else:  # queen side castle
+                self.remove(rock, endSq - 2)
+                self.add(rock, endSq + 1)
+
+    """ mirror what GameState.undoMove() did on the board """
+
+    def undoMove(self, move):
+        startSq = move.moveID & 63
+        endSq = move.moveID >> 6 & 63
+        if move.isPawnPromotion:
+            self.remove(move.pieceMoved[0] + move.promotionChoice, endSq)
+        else:
+            self.remove(move.pieceMoved, endSq)
+        self.add(move.pieceMoved, startSq)
+        if move.isEnpassantMove:
+            self.add(move.pieceCaptured, square(move.startRow, move.endCol))
+        elif move.pieceCaptured != "--":
+            self.add(move.pieceCaptured, endSq)
+        if move.isCastleMove:
+            rock = move.pieceMoved[0] + "R"
+            if move.endCol - move.startCol == 2:  # king side castle
+                self.remove(rock, endSq - 1)
+                self.add(rock, endSq + 1)
+            else:  # queen side castle
+                self.remove(rock, endSq + 1)
+                self.add(rock, endSq - 2)
+
+    """ the set of the pieces of the given color that attack sq """
+
+    def attackersOf(self, sq, color, occupied=None):
+        if occupied is None:
+            occupied = self.occupied()
+        pieces = self.pieces
+        enemy = "b" if color == "w" else "w"
+        # look outward from the square: a white pawn attacks sq if it stands
+        # where a black pawn on sq would be attacking
+        attackers = pawnAttacks[enemy][sq] & pieces[color + "p"]
+        attackers |= knightAttacks[sq] & pieces[color + "N"]
+        attackers |= kingAttacks[sq] & pieces[color + "K"]
+        queens = pieces[color + "Q"]
+        diagonal = pieces[color + "B"] | queens
+        if diagonal:
+            attackers |= bishopAttacks(sq, occupied) & diagonal
+        straight = pieces[color + "R"] | queens
+        if straight:
+            attackers |= rockAttacks(sq, occupied) & straight
+        return attackers
+
+    def isAttacked(self, sq, color):
+        return self.attackersOf(sq, color) != 0
+
+    """
+    the same as GameState.checkForPinsAndChecks() for the king of color on kingSq:
+    (number of checks, the squares that stop the check, {pinned square: squares it can go to})
+    """
+
+    def pinsAndChecks(self, kingSq, color):
+        enemy = "b" if color == "w" else "w"
+        pieces = self.pieces
+        own = self.colors[color]
+        occupied = own | self.colors[enemy]
+        checkers = self.attackersOf(kingSq, enemy, occupied)
+        checks = bin(checkers).count("1")
+        if checks == 0:
+            checkMask = FULL
+        elif checks == 1:
+            # capture the checker, or step in between if it's a sliding one
+            checker = checkers.bit_length() - 1
+            checkMask = checkers
+            for d in allDirections:
+                if rays[d][kingSq] >> checker & 1:
+                    checkMask = rays[d][kingSq] ^ rays[d][checker]
+                    break
+        else:  # double check, so only the king can move
+            checkMask = 0
+        pins = {}
+        queens = pieces[enemy + "Q"]
+        for d in allDirections:
+            if d in rockDirections:
+                sliders = pieces[enemy + "R"] | queens
+            else:
+                sliders = pieces[enemy + "B"] | queens
+            ray = rays[d][kingSq]
+            if not ray & sliders:
+                continue
+            # a pin is: our piece first on the ray and an enemy slider right behind it
+            blockers = ray & occupied
+            first = _nearest(blockers, d)
+            if not own >> first & 1:
+                continue
+            behind = blockers & rays[d][first]
+            if not behind:
+                continue
+            second = _nearest(behind, d)
+            if sliders >> second & 1:
+                pins[first] = ray ^ rays[d][second]
+        return checks, checkMask, pins
+
+    """
+    all the moves of the side to move without considering checks, but while
+    GameState.getValidMoves() is running it follows its pins and checks
+    restrictions, so every move that comes out of here is a legal one
+    """
+
+    def generateMoves(self, gs, moves):
+        Move = ChessEngine.Move
+        board = gs.board
+        color = "w" if gs.whiteToMove else "b"
+        enemyColor = "b" if color == "w" else "w"
+        pieces = self.pieces
+        own = self.colors[color]
+        enemy = self.colors[enemyColor]
+        occupied = own | enemy
+        empty = ~occupied & FULL
+        legalOnly = gs.pins is not None
+        pins = gs.pins if legalOnly else {}
+        checkMask = gs.checkMask
+        if gs.capturesOnly:
+            # only the enemy squares, but the pawns can still push to promote
+            pushMask = checkMask & 0xFF000000000000FF
+            checkMask &= enemy
+        else:
+            pushMask = checkMask
+
+        # pawns: the pushes are done for all the pawns at once by shifting the set
+        pawns = pieces[color + "p"]
+        if color == "w":
+            singles = (pawns >> 8) & empty
+            doubles = ((singles & 0xFF0000000000) >> 8) & empty  # from the 3rd rank
+            step = 8
+        else:
+            singles = (pawns << 8) & empty
+            doubles = ((singles & 0xFF0000) << 8) & empty  # from the 6th rank
+            step = -8
+        for sq in squaresOf(singles & pushMask):
+            if pins.get(sq + step, FULL) >> sq & 1:
+                moves.append(Move.fromSquares(sq + step, sq, board))
+        for sq in squaresOf(doubles & pushMask):
+            if pins.get(sq + 2 * step, FULL) >> sq & 1:
+                moves.append(Move.fromSquares(sq + 2 * step, sq, board))
+        enpassant = bit(*gs.enpassantPossible) if gs.enpassantPossible != () else 0
+        for sq in squaresOf(pawns):
+            attacks = pawnAttacks[color][sq]
+            allowed = pins.get(sq, FULL) & checkMask
+            for target in squaresOf(attacks & enemy & allowed):
+                moves.append(Move.fromSquares(sq, target, board))
+            if attacks & enpassant and (
+                not legalOnly or self._enpassantIsLegal(sq, gs.enpassantPossible, color)
+            ):
+                moves.append(
+                    Move(
+                        divmod(sq, 8), gs.enpassantPossible, board, isEnpassantMove=True
+                    )
+                )
+
+        # every other piece is just its attack set minus our own pieces
+        notOwn = ~own & checkMask
+        for sq in squaresOf(pieces[color + "N"]):
+            if sq not in pins:  # a pinned knight can never move
+                self._appendMoves(sq, knightAttacks[sq] & notOwn, board, moves)
+        for sq in squaresOf(pieces[color + "B"]):
+            targets = bishopAttacks(sq, occupied) & notOwn & pins.get(sq, FULL)
+            self._appendMoves(sq, targets, board, moves)
+        for sq in squaresOf(pieces[color + "R"]):
+            targets = rockAttacks(sq, occupied) & notOwn & pins.get(sq, FULL)
+            self._appendMoves(sq, targets, board, moves)
+        for sq in squaresOf(pieces[color + "Q"]):
+            targets = queenAttacks(sq, occupied) & notOwn
+            self._appendMoves(sq, targets & pins.get(sq, FULL), board, moves)
+        for sq in squaresOf(pieces[color + "K"]):
+            targets = kingAttacks[sq] & ~own
+            if gs.capturesOnly:
+                targets &= enemy
+            if legalOnly:
+                # the king can't hide behind itself from a slider, so take it off
+                withoutKing = occupied & ~(1 << sq)
+                for target in squaresOf(targets):
+                    if self.attackersOf(target, enemyColor, withoutKing):
+                        targets &= ~(1 << target)
+            self._appendMoves(sq, targets, board, moves)
+        return moves
+
+    """ an enpassant capture takes two pawns off the same row, so see if it uncovers our king """
+
+    def _enpassantIsLegal(self, sq, enpassantSquare, color):
+        enemyColor = "b" if color == "w" else "w"
+        target = square(*enpassantSquare)
+        captured = target + (8 if color == "w" else -8)
+        occupied = self.occupied() ^ (1 << sq) ^ (1 << target) ^ (1 << captured)
+        kingSq = self.pieces[color + "K"].bit_length() - 1
+        attackers = self.attackersOf(kingSq, enemyColor, occupied)
+        return attackers & ~(1 << captured) == 0
+
+    def _appendMoves(self, sq, targets, board, moves):
+        fromSquares = ChessEngine.Move.fromSquares
+        for target in squaresOf(targets):
+            moves.append(fromSquares(sq, target, board))
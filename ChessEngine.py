@@ -3,10 +3,56 @@ This is responsiwle for storing all the information about the current state
 of the chess game. Also, be responsible for determining the valid moves at
 the current state. And it'll keep a move log.
 """
+import Bitboards
+import Evaluation
+import Zobrist
+
+# the castling rights are kept as the bits of an int, in the same order as
+# Zobrist.castleIndex(), so they cost nothing to copy and to restore
+WKS, BKS, WQS, BQS = 1, 2, 4, 8
+ALL_CASTLE_RIGHTS = WKS | BKS | WQS | BQS
+# the rights that are still there after a move from or to each square: a king
+# or a rock leaving its starting square, or a rock captured on it, ends them
+castleRightsMasks = [ALL_CASTLE_RIGHTS] * 64
+castleRightsMasks[0] = ALL_CASTLE_RIGHTS & ~BQS  # a8
+castleRightsMasks[4] = ALL_CASTLE_RIGHTS & ~(BKS | BQS)  # e8
+castleRightsMasks[7] = ALL_CASTLE_RIGHTS & ~BKS  # h8
+castleRightsMasks[56] = ALL_CASTLE_RIGHTS & ~WQS  # a1
+castleRightsMasks[60] = ALL_CASTLE_RIGHTS & ~(WKS | WQS)  # e1
+castleRightsMasks[63] = ALL_CASTLE_RIGHTS & ~WKS  # h1
+
+# the FEN letters of the pieces and of the castling rights
+fenPieces = {
+    "P": "wp",
+    "N": "wN",
+    "B": "wB",
+    "R": "wR",
+    "Q": "wQ",
+    "K": "wK",
+    "p": "bp",
+    "n": "bN",
+    "b": "bB",
+    "r": "bR",
+    "q": "bQ",
+    "k": "bK",
+}
+pieceToFEN = {piece: letter for letter, piece in fenPieces.items()}
+fenCastleRights = {"K": WKS, "Q": WQS, "k": BKS, "q": BQS}
+STARTING_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+
+# the packed position is 34 bytes: the 64 squares as 4 bits each (2 squares
+# per byte, a8 first), then the side to move and the castling rights
+# (white to move | castleRights << 1), then the enpassant file + 1 (0 for none)
+PACKED_SIZE = 34
+pieceCodes = {"--": 0}
+for _i, _piece in enumerate("pNBRQK"):
+    pieceCodes["w" + _piece] = 1 + _i
+    pieceCodes["b" + _piece] = 9 + _i
+codePieces = {code: piece for piece, code in pieceCodes.items()}
 
 
 class GameState:
-    def __init__(self):
+    def __init__(self, useBitboards=False, underpromotions=False):
         # this is a 2d representation of the board from white prespective
         # to gain some more speed, we might use numpy library instead
         # the representation is pretty easy:
@@ -43,16 +89,230 @@ class GameState:
         self.stalemate = False
         # the corrdinates where an enpassant capture is possible
         self.enpassantPossible = ()
-        self.enpassantPossibleLog = [self.enpassantPossible]
-        self.currentCastlingRights = CastleRights(True, True, True, True)
-        self.castleRightLog = [
-            CastleRights(
-                self.currentCastlingRights.wks,
-                self.currentCastlingRights.bks,
-                self.currentCastlingRights.wqs,
-                self.currentCastlingRights.bqs,
+        self.castleRights = ALL_CASTLE_RIGHTS
+        # the bitboard backend keeps the same position as 64-bit sets per piece and
+        # per color, so the move generation and the attack checks don't have to
+        # walk the board square by square. The board above is still updated
+        # on every move, so it stays as a view for the drawing and the scoring
+        self.bitboards = Bitboards.BitboardSet(self.board) if useBitboards else None
+        # the restrictions on the moves while generating the valid moves, the
+        # squares that stop a check and the lines where the pinned pieces can go
+        self.checkMask = Bitboards.FULL
+        self.pins = None
+        # set while generating only the captures (and the promotions)
+        self.capturesOnly = False
+        # the game only promotes to a queen, but the perft counts of the standard
+        # test positions include the promotions to a rock, a bishop and a knight too
+        self.underpromotions = underpromotions
+        # the zobrist key of the position, updated by every makeMove() and undoMove()
+        # so the search can recognize the positions it has already seen
+        self.zobristKey = Zobrist.hashPosition(self)
+        # the key of the pawns alone, for the pawn hash table of the evaluation: the
+        # pawn structure is the same in a lot of the positions the search sees
+        self.pawnKey = Zobrist.hashPawns(self)
+        # the running totals of the static evaluation (white minus black, in
+        # Evaluation.SCORE_UNITS), each move only adds what it changed
+        self.materialScore, self.positionScore = Evaluation.evaluateBoard(self.board)
+        # how many pieces are on the board, kings included, so the search can
+        # tell without looking at the board when the tablebases might know it
+        self.pieceCount = 32
+        # the knights, bishops, rocks and queens of each side, the null move
+        # pruning of the search needs the side to move to have some
+        self.nonPawnCount = {"w": 7, "b": 7}
+        # one record for every move in the moveLog, with what the move can't give
+        # back by itself: (castleRights, enpassantPossible, zobristKey, pawnKey,
+        # materialScore, positionScore, halfmoveClock) from before the move
+        self.undoStack = []
+        # the halfmoves since the last capture or pawn move, for the fifty move rule
+        self.halfmoveClock = 0
+        # the zobrist keys of the positions before this one, the oldest first, to
+        # find the repetitions. It can go back further than the moveLog, to the
+        # positions before the one the GameState was set up with
+        self.keyHistory = []
+        # the full move number of the position the game started from, for toFEN()
+        self.startFullmoveNumber = 1
+
+    """ a GameState of the position in the FEN string, like STARTING_FEN """
+
+    @classmethod
+    def fromFEN(cls, fen, useBitboards=False, underpromotions=False):
+        fields = fen.split()
+        if len(fields) < 4:
+            raise ValueError("not a FEN string: %r" % fen)
+        board = []
+        for rank in fields[0].split("/"):
+            row = []
+            for letter in rank:
+                if letter.isdigit():
+                    row += ["--"] * int(letter)
+                elif letter in fenPieces:
+                    row.append(fenPieces[letter])
+                else:
+                    raise ValueError("unknown piece %r in FEN: %r" % (letter, fen))
+            if len(row) != 8:
+                raise ValueError("a rank without 8 squares in FEN: %r" % fen)
+            board.append(row)
+        if len(board) != 8 or fields[1] not in ("w", "b"):
+            raise ValueError("not a FEN string: %r" % fen)
+        castleRights = 0
+        for letter in fields[2].replace("-", ""):
+            if letter not in fenCastleRights:
+                raise ValueError("unknown castling right %r in FEN: %r" % (letter, fen))
+            castleRights |= fenCastleRights[letter]
+        enpassant = fields[3]
+        if enpassant == "-":
+            enpassantPossible = ()
+        elif enpassant[0] in Move.fileToCols and enpassant[1:] in ("3", "6"):
+            enpassantPossible = (
+                Move.ranksToRows[enpassant[1]],
+                Move.fileToCols[enpassant[0]],
             )
-        ]
+        else:
+            raise ValueError("bad enpassant square %r in FEN: %r" % (enpassant, fen))
+        gs = cls(useBitboards, underpromotions)
+        gs.setPosition(board, fields[1] == "w", castleRights, enpassantPossible)
+        if len(fields) >= 6:
+            gs.halfmoveClock = int(fields[4])
+            gs.startFullmoveNumber = int(fields[5])
+        return gs
+
+    """ the FEN string of the current position """
+
+    def toFEN(self):
+        ranks = []
+        for row in self.board:
+            rank = ""
+            empty = 0
+            for piece in row:
+                if piece == "--":
+                    empty += 1
+                    continue
+                if empty:
+                    rank += str(empty)
+                    empty = 0
+                rank += pieceToFEN[piece]
+            if empty:
+                rank += str(empty)
+            ranks.append(rank)
+        castling = ""
+        for letter in "KQkq":
+            if self.castleRights & fenCastleRights[letter]:
+                castling += letter
+        if self.enpassantPossible == ():
+            enpassant = "-"
+        else:
+            enpassant = Move.colsToFiles[self.enpassantPossible[1]]
+            enpassant += Move.rowsToRanks[self.enpassantPossible[0]]
+        # the full move number goes up after every black move
+        startedWithBlack = self.whiteToMove == (len(self.moveLog) % 2 == 1)
+        fullmoveNumber = self.startFullmoveNumber
+        fullmoveNumber += (len(self.moveLog) + startedWithBlack) // 2
+        return "%s %s %s %s %d %d" % (
+            "/".join(ranks),
+            "w" if self.whiteToMove else "b",
+            castling or "-",
+            enpassant,
+            self.halfmoveClock,
+            fullmoveNumber,
+        )
+
+    """
+    the position as PACKED_SIZE bytes, to send it to another process or to use it
+    as a key, it has the board, the side to move, the castling rights and the
+    enpassant square, but not the move log or the move counters
+    """
+
+    def pack(self):
+        codes = [pieceCodes[piece] for row in self.board for piece in row]
+        data = bytearray(codes[i] | codes[i + 1] << 4 for i in range(0, 64, 2))
+        data.append(self.whiteToMove | self.castleRights << 1)
+        if self.enpassantPossible == ():
+            data.append(0)
+        else:
+            data.append(self.enpassantPossible[1] + 1)
+        return bytes(data)
+
+    """ a GameState of a position made by pack() """
+
+    @classmethod
+    def unpack(cls, data, useBitboards=False, underpromotions=False):
+        if len(data) != PACKED_SIZE:
+            raise ValueError(
+                "a packed position is %d bytes, not %d" % (PACKED_SIZE, len(data))
+            )
+        board = [["--"] * 8 for _ in range(8)]
+        for i in range(32):
+            board[i // 4][i % 4 * 2] = codePieces[data[i] & 15]
+            board[i // 4][i % 4 * 2 + 1] = codePieces[data[i] >> 4]
+        whiteToMove = bool(data[32] & 1)
+        enpassantPossible = ()
+        if data[33]:
+            # the pawn that can be taken enpassant is always the one that just moved
+            enpassantPossible = (2 if whiteToMove else 5, data[33] - 1)
+        gs = cls(useBitboards, underpromotions)
+        gs.setPosition(board, whiteToMove, data[32] >> 1, enpassantPossible)
+        return gs
+
+    """
+    start over from the given position: the board as 8 rows of 8 pieces, the
+    castling rights as bits (WKS | BKS | WQS | BQS) and the enpassant square as
+    (row, col) or (), everything computed from the position is redone
+    """
+
+    def setPosition(self, board, whiteToMove, castleRights, enpassantPossible):
+        kings = {}
+        for r in range(8):
+            for c in range(8):
+                if board[r][c][1] == "K":
+                    kings.setdefault(board[r][c], []).append((r, c))
+        if len(kings.get("wK", ())) != 1 or len(kings.get("bK", ())) != 1:
+            raise ValueError("a position needs exactly one king of each color")
+        self.board = [list(row) for row in board]
+        self.whiteToMove = whiteToMove
+        self.whiteKingLocation = kings["wK"][0]
+        self.blackKingLocation = kings["bK"][0]
+        self.castleRights = castleRights
+        self.enpassantPossible = enpassantPossible
+        self.moveLog = []
+        self.undoStack = []
+        self.checkmate = False
+        self.stalemate = False
+        if self.bitboards is not None:
+            self.bitboards = Bitboards.BitboardSet(self.board)
+        self.zobristKey = Zobrist.hashPosition(self)
+        self.pawnKey = Zobrist.hashPawns(self)
+        self.materialScore, self.positionScore = Evaluation.evaluateBoard(self.board)
+        self.pieceCount = sum(piece != "--" for row in self.board for piece in row)
+        self.nonPawnCount = {
+            color: sum(
+                piece[0] == color and piece[1] in "NBRQ"
+                for row in self.board
+                for piece in row
+            )
+            for color in "wb"
+        }
+        self.halfmoveClock = 0
+        self.keyHistory = []
+        self.startFullmoveNumber = 1
+
+    """
+    the castling rights as a CastleRights object, for the code that reads them by
+    name, the GameState itself only uses the castleRights bits
+    """
+
+    @property
+    def currentCastlingRights(self):
+        rights = self.castleRights
+        return CastleRights(
+            bool(rights & WKS),
+            bool(rights & BKS),
+            bool(rights & WQS),
+            bool(rights & BQS),
+        )
+
+    @currentCastlingRights.setter
+    def currentCastlingRights(self, castleRights):
+        self.castleRights = Zobrist.castleIndex(castleRights)
 
     """
     This functions takes a move as a parameter and executes it
@@ -60,6 +320,21 @@ class GameState:
     """
 
     def makeMove(self, move):
+        # what the zobrist key needs to xor out after the move
+        oldCastleRights = self.castleRights
+        oldEnpassant = self.enpassantPossible
+        self.undoStack.append(
+            (
+                oldCastleRights,
+                oldEnpassant,
+                self.zobristKey,
+                self.pawnKey,
+                self.materialScore,
+                self.positionScore,
+                self.halfmoveClock,
+            )
+        )
+        self.keyHistory.append(self.zobristKey)
         self.board[move.startRow][move.startCol] = "--"
         self.board[move.endRow][move.endCol] = move.pieceMoved
         # log the move, so we can undo it later or print a PNG for the game
@@ -70,9 +345,11 @@ class GameState:
             self.whiteKingLocation = (move.endRow, move.endCol)
         elif move.pieceMoved == "bK":
             self.blackKingLocation = (move.endRow, move.endCol)
-        # about pawn promotions, we'll consider the queen promotion at first:
+        # about pawn promotions, it's the queen unless the move says otherwise
         if move.isPawnPromotion:
-            self.board[move.endRow][move.endCol] = move.pieceMoved[0] + "Q"
+            self.board[move.endRow][move.endCol] = (
+                move.pieceMoved[0] + move.promotionChoice
+            )
         # about enpassant move
         if move.isEnpassantMove:
             self.board[move.startRow][move.endCol] = "--"  # capturing the pawn
@@ -97,18 +374,74 @@ class GameState:
                     move.endCol - 2
                 ]
                 self.board[move.endRow][move.endCol - 2] = "--"  # remove the old rook
-        # update the enpassantPossibleLog
-        self.enpassantPossibleLog.append(self.enpassantPossible)
         # update the castling rights whenever its a rook or a king move
         self.updateCastlRights(move)
-        self.castleRightLog.append(
-            CastleRights(
-                self.currentCastlingRights.wks,
-                self.currentCastlingRights.bks,
-                self.currentCastlingRights.wqs,
-                self.currentCastlingRights.bqs,
+        if self.bitboards is not None:
+            self.bitboards.applyMove(move)
+        self.zobristKey = self._updateZobristKey(move, oldCastleRights, oldEnpassant)
+        if move.pieceMoved[1] == "p" or move.pieceCaptured[1] == "p":
+            self.pawnKey = self._updatePawnKey(move)
+        material, position = Evaluation.moveDelta(move)
+        self.materialScore += material
+        self.positionScore += position
+        if move.isCapture:
+            self.pieceCount -= 1
+            if move.pieceCaptured[1] != "p":
+                self.nonPawnCount[move.pieceCaptured[0]] -= 1
+        if move.isPawnPromotion:
+            self.nonPawnCount[move.pieceMoved[0]] += 1
+        # a capture or a pawn move can't be taken back, so no position before it can come again
+        if move.isCapture or move.pieceMoved[1] == "p":
+            self.halfmoveClock = 0
+        else:
+            self.halfmoveClock += 1
+
+    """ the new zobrist key after the move, only xor-ing the pieces that changed """
+
+    def _updateZobristKey(self, move, oldCastleRights, oldEnpassant):
+        pieceKeys = Zobrist.pieceKeys
+        startSq = move.moveID & 63
+        endSq = move.moveID >> 6 & 63
+        key = self.zobristKey ^ Zobrist.sideKey
+        key ^= pieceKeys[move.pieceMoved][startSq]
+        key ^= pieceKeys[self.board[move.endRow][move.endCol]][endSq]  # after promotion
+        if move.isEnpassantMove:
+            key ^= pieceKeys[move.pieceCaptured][move.startRow * 8 + move.endCol]
+        elif move.pieceCaptured != "--":
+            key ^= pieceKeys[move.pieceCaptured][endSq]
+        if move.isCastleMove:
+            rock = pieceKeys[move.pieceMoved[0] + "R"]
+            if move.endCol - move.startCol == 2:  # king side castle
+                key ^= rock[endSq + 1] ^ rock[endSq - 1]
+            else:  # queen side castle
+                key ^= rock[endSq - 2] ^ rock[endSq + 1]
+        if self.castleRights != oldCastleRights:
+            key ^= (
+                Zobrist.castleKeys[oldCastleRights]
+                ^ Zobrist.castleKeys[self.castleRights]
             )
-        )
+        if oldEnpassant != ():
+            key ^= Zobrist.enpassantKeys[oldEnpassant[1]]
+        if self.enpassantPossible != ():
+            key ^= Zobrist.enpassantKeys[self.enpassantPossible[1]]
+        return key
+
+    """ the new pawn key after a move that moved or captured a pawn """
+
+    def _updatePawnKey(self, move):
+        pieceKeys = Zobrist.pieceKeys
+        endSq = move.moveID >> 6 & 63
+        key = self.pawnKey
+        if move.pieceMoved[1] == "p":
+            key ^= pieceKeys[move.pieceMoved][move.moveID & 63]
+            if not move.isPawnPromotion:  # a promoted pawn isn't a pawn anymore
+                key ^= pieceKeys[move.pieceMoved][endSq]
+        if move.pieceCaptured[1] == "p":
+            if move.isEnpassantMove:
+                key ^= pieceKeys[move.pieceCaptured][move.startRow * 8 + move.endCol]
+            else:
+                key ^= pieceKeys[move.pieceCaptured][endSq]
+        return key
 
     """ undo the last move made on the board """
 
@@ -132,16 +465,19 @@ class GameState:
                 # we make the landing square blank as it was
                 self.board[move.endRow][move.endCol] = "--"
                 self.board[move.startRow][move.endCol] = move.pieceCaptured
-            self.enpassantPossibleLog.pop()
-            self.enpassantPossible = self.enpassantPossibleLog[-1]
-            # undo the castle rights
-            # first get rid of the new castle rights from the move we're undoing
-            self.castleRightLog.pop()
-            # then set the currentCastlingRights to last one we have now on the log list
-            newRights = self.castleRightLog[-1]
-            self.currentCastlingRights = CastleRights(
-                newRights.wks, newRights.bks, newRights.wqs, newRights.bqs
-            )
+            # the castle rights, the enpassant square, the zobrist keys, the
+            # scores and the halfmove clock all come back as they were from the
+            # undo record of the move
+            (
+                self.castleRights,
+                self.enpassantPossible,
+                self.zobristKey,
+                self.pawnKey,
+                self.materialScore,
+                self.positionScore,
+                self.halfmoveClock,
+            ) = self.undoStack.pop()
+            self.keyHistory.pop()
             # undo the castle move
             if move.isCastleMove:
                 # we need to check to see if it castles to left or right
@@ -164,92 +500,283 @@ class GameState:
             # undo the checkmate and stalemate
             self.checkmate = False
             self.stalemate = False
+            if self.bitboards is not None:
+                self.bitboards.undoMove(move)
+            if move.isCapture:
+                self.pieceCount += 1
+                if move.pieceCaptured[1] != "p":
+                    self.nonPawnCount[move.pieceCaptured[0]] += 1
+            if move.isPawnPromotion:
+                self.nonPawnCount[move.pieceMoved[0]] -= 1
+
+    """
+    pass the turn to the other side without moving, for the null move pruning of
+    the search. It goes in the moveLog as None. The positions before it can't
+    come again after it, so the halfmove clock starts over (until undoNullMove())
+    """
+
+    def makeNullMove(self):
+        self.undoStack.append(
+            (
+                self.castleRights,
+                self.enpassantPossible,
+                self.zobristKey,
+                self.pawnKey,
+                self.materialScore,
+                self.positionScore,
+                self.halfmoveClock,
+            )
+        )
+        self.keyHistory.append(self.zobristKey)
+        self.moveLog.append(None)
+        self.whiteToMove = not self.whiteToMove
+        self.zobristKey ^= Zobrist.sideKey
+        if self.enpassantPossible != ():
+            self.zobristKey ^= Zobrist.enpassantKeys[self.enpassantPossible[1]]
+            self.enpassantPossible = ()
+        self.halfmoveClock = 0
+
+    def undoNullMove(self):
+        self.moveLog.pop()
+        self.keyHistory.pop()
+        self.whiteToMove = not self.whiteToMove
+        (
+            self.castleRights,
+            self.enpassantPossible,
+            self.zobristKey,
+            self.pawnKey,
+            self.materialScore,
+            self.positionScore,
+            self.halfmoveClock,
+        ) = self.undoStack.pop()
+        self.checkmate = False
+        self.stalemate = False
+
+    """
+    if the position was already there before, times times, with the same side to
+    move. Only the positions since the last capture or pawn move are looked at,
+    the ones before can't be the same
+    """
+
+    def isRepetition(self, times=1):
+        key = self.zobristKey
+        history = self.keyHistory
+        oldest = max(len(history) - self.halfmoveClock, 0)
+        seen = 0
+        # two plies ago it was the same side to move, but a position needs at
+        # least four plies to come back
+        for i in range(len(history) - 4, oldest - 1, -2):
+            if history[i] == key:
+                seen += 1
+                if seen >= times:
+                    return True
+        return False
+
+    """ a draw by the fifty move rule or by the third time the same position comes """
+
+    def isDraw(self):
+        return self.halfmoveClock >= 100 or self.isRepetition(2)
 
     """ update the casle rights given a move """
 
     def updateCastlRights(self, move):
-        # check if the king moved or the rock moved
-        if move.pieceMoved == "wK":
-            self.currentCastlingRights.wks = False
-            self.currentCastlingRights.wqs = False
-        elif move.pieceMoved == "bK":
-            self.currentCastlingRights.bks = False
-            self.currentCastlingRights.bqs = False
-        elif move.pieceMoved == "wR":
-            if move.startRow == 7:
-                if move.startCol == 0:  # whites left rock
-                    self.currentCastlingRights.wqs = False
-                if move.startCol == 7:  # whites right rock
-                    self.currentCastlingRights.wks = False
-        elif move.pieceMoved == "bR":
-            if move.startRow == 0:
-                if move.startCol == 0:  # black left rock
-                    self.currentCastlingRights.bqs = False
-                if move.startCol == 7:  # black right rock
-                    self.currentCastlingRights.bks = False
-        # check if the rock is captured
-        if move.pieceCaptured == "wR":
-            if move.endRow == 7:
-                if move.endCol == 0:
-                    self.currentCastlingRights.wqs = False
-                elif move.endCol == 7:
-                    self.currentCastlingRights.wks = False
-        elif move.pieceCaptured == "bR":
-            if move.endRow == 0:
-                if move.endCol == 0:
-                    self.currentCastlingRights.bqs = False
-                elif move.endCol == 7:
-                    self.currentCastlingRights.bks = False
-
-    """ all moves considering even if the king is in check """
+        # a move from or to the square of a king or a rock takes the rights away
+        self.castleRights &= (
+            castleRightsMasks[move.moveID & 63]
+            & castleRightsMasks[move.moveID >> 6 & 63]
+        )
+
+    """ all the legal moves, so the ones that don't leave our king in check """
 
     def getValidMoves(self):
-        tempEnpassantPossible = self.enpassantPossible
-        tempCastleRights = CastleRights(
-            self.currentCastlingRights.wks,
-            self.currentCastlingRights.bks,
-            self.currentCastlingRights.wqs,
-            self.currentCastlingRights.bqs,
-        )
-        # the easy, but not efficient solution is:
-        # 1. let's generate all the possible moves and don't worry about the kings state
+        # the easy, but not efficient solution was to make every possible move,
+        # generate all the opponent's moves after it and see if any of them hits our king.
+        # Instead, we look only once around our king for the enemy pieces checking it
+        # and for our pieces pinned to it. Then the piece generators only emit moves that:
+        # 1. move a pinned piece along the line between the king and the pinner
+        # 2. capture the checking piece or block its line when we're in check
+        #    (in a double check, only the king itself can move)
+        # 3. don't put the king on a square that the enemy attacks
+        checks, self.checkMask, self.pins = self.checkForPinsAndChecks()
         moves = self.getAllPossibleMoves()
-        # 2. for each move found, make that move
-        # when removing from the list, go backwords :)
-        for i in range(len(moves) - 1, -1, -1):
-            self.makeMove(moves[i])
-            # 3. generate all opponent's moves
-            # 4. for each of those moves, check if they attack your king
-            # we need this as the makeMove() did swap the players once
-            self.whiteToMove = not self.whiteToMove
-            if self.inCheck():
-                # 5. if they do, it's not a valid move
-                moves.remove(moves[i])
-            # we need this to return every thing as before
-            self.whiteToMove = not self.whiteToMove
-            self.undoMove()
+        if self.underpromotions:
+            self._addUnderpromotions(moves)
+        # to generate castle moves, but the king can't escape a check by castling
+        if checks == 0:
+            if self.whiteToMove:
+                self.getCastleMoves(
+                    self.whiteKingLocation[0], self.whiteKingLocation[1], moves
+                )
+            else:
+                self.getCastleMoves(
+                    self.blackKingLocation[0], self.blackKingLocation[1], moves
+                )
+        # back to the plain "all possible moves" generation
+        self.checkMask = Bitboards.FULL
+        self.pins = None
         # do we have a checkmate |:) or stalemate (:|
         if len(moves) == 0:
-            if self.inCheck():
+            if checks > 0:
                 self.checkmate = True
             else:
                 self.stalemate = True
         else:
             self.checkmate = False
             self.stalemate = False
-        # to generate castle moves
-        if self.whiteToMove:
-            self.getCastleMoves(
-                self.whiteKingLocation[0], self.whiteKingLocation[1], moves
-            )
-        else:
-            self.getCastleMoves(
-                self.blackKingLocation[0], self.blackKingLocation[1], moves
-            )
-        self.enpassantPossible = tempEnpassantPossible
-        self.currentCastlingRights = tempCastleRights
         return moves
 
+    """
+    only the legal captures and promotions, for the quiescence search. It skips
+    the quiet moves while generating instead of filtering them out afterwards,
+    and it doesn't look for castling, checkmate or stalemate
+    """
+
+    def getCaptureMoves(self):
+        _, self.checkMask, self.pins = self.checkForPinsAndChecks()
+        self.capturesOnly = True
+        moves = self.getAllPossibleMoves()
+        if self.underpromotions:
+            self._addUnderpromotions(moves)
+        self.capturesOnly = False
+        self.checkMask = Bitboards.FULL
+        self.pins = None
+        return moves
+
+    """ the generators emit a queen promotion, so add the other three pieces next to it """
+
+    def _addUnderpromotions(self, moves):
+        for i in range(len(moves)):
+            move = moves[i]
+            if move.isPawnPromotion:
+                for piece in Move.promotionPieces[1:]:
+                    moves.append(
+                        Move(
+                            (move.startRow, move.startCol),
+                            (move.endRow, move.endCol),
+                            self.board,
+                            promotionChoice=piece,
+                        )
+                    )
+
+    """
+    look around the king of the side to move for the enemy pieces that check it
+    and for its own pieces that are pinned to it, it returns:
+    (number of checks, the squares that stop the check, {pinned square: squares it can go to})
+    """
+
+    def checkForPinsAndChecks(self):
+        allyColor = "w" if self.whiteToMove else "b"
+        r, c = self.whiteKingLocation if self.whiteToMove else self.blackKingLocation
+        if self.bitboards is not None:
+            return self.bitboards.pinsAndChecks(r * 8 + c, allyColor)
+        return self._scanFrom(r, c, allyColor)
+
+    """
+    walk outward from the square(r, c) as if the king of allyColor was standing there,
+    all the squares are represented as bits (row * 8 + col) of a python int
+    """
+
+    def _scanFrom(self, r, c, allyColor):
+        enemyColor = "b" if allyColor == "w" else "w"
+        checks = 0
+        checkMask = 0
+        pins = {}
+        for d in Bitboards.allDirections:
+            straight = d[0] == 0 or d[1] == 0
+            # the squares from the king up to the piece we hit, they are where a
+            # pinned piece can still go or where we can block a check
+            ray = 0
+            possiblePin = None
+            for i in range(1, 8):
+                endRow = r + d[0] * i
+                endCol = c + d[1] * i
+                if not (0 <= endRow < 8 and 0 <= endCol < 8):
+                    break
+                ray |= 1 << (endRow * 8 + endCol)
+                endPiece = self.board[endRow][endCol]
+                if endPiece == "--":
+                    continue
+                if endPiece[0] == allyColor:
+                    if possiblePin is None:  # the first friendly piece might be pinned
+                        possiblePin = endRow * 8 + endCol
+                        continue
+                    break  # two friendly pieces in the way, so no pins or checks here
+                piece = endPiece[1]
+                if piece == "Q" or piece == ("R" if straight else "B"):
+                    if possiblePin is None:
+                        checks += 1
+                        checkMask |= ray
+                    else:
+                        pins[possiblePin] = ray
+                elif i == 1 and possiblePin is None:
+                    # the short range ones: the enemy king next to us, or a pawn
+                    # diagonally in front of us (black pawns go down the rows)
+                    if piece == "K" or (
+                        piece == "p"
+                        and not straight
+                        and d[0] == (-1 if enemyColor == "b" else 1)
+                    ):
+                        checks += 1
+                        checkMask |= ray
+                break
+        for m in Bitboards.knightSteps:
+            endRow = r + m[0]
+            endCol = c + m[1]
+            if 0 <= endRow < 8 and 0 <= endCol < 8:
+                if self.board[endRow][endCol] == enemyColor + "N":
+                    checks += 1
+                    checkMask |= 1 << (endRow * 8 + endCol)
+        if checks == 0:
+            checkMask = Bitboards.FULL  # not in check, so every square is fine
+        elif checks > 1:
+            checkMask = 0  # double check, so only the king can move
+        return checks, checkMask, pins
+
+    """ the squares that the piece at (r, c) is allowed to move to, because of pins and checks """
+
+    def _allowedTargets(self, r, c):
+        # we're not generating the valid moves, so no restrictions
+        if self.pins is None:
+            return Bitboards.FULL
+        return self.pins.get(r * 8 + c, Bitboards.FULL) & self.checkMask
+
+    """ to see if the king can go to the square(r, c), so the enemy doesn't attack it from there """
+
+    def _kingCanGoTo(self, kingRow, kingCol, r, c):
+        if self.pins is None:
+            return True
+        # lift the king from its square, as it can't hide behind itself from a slider
+        king = self.board[kingRow][kingCol]
+        self.board[kingRow][kingCol] = "--"
+        enemyColor = "b" if king[0] == "w" else "w"
+        safe = not self._lookForAttackers(r, c, enemyColor)
+        self.board[kingRow][kingCol] = king
+        return safe
+
+    """
+    the enpassant capture takes away two pawns from the same row at once, so the
+    simple pin logic can miss a check from a rock or a queen along that row,
+    this one is rare enough so we just try it on the board and look at our king
+    """
+
+    def _enpassantIsLegal(self, r, c, endRow, endCol):
+        if self.pins is None:
+            return True
+        pawn = self.board[r][c]
+        captured = self.board[r][endCol]
+        self.board[r][c] = "--"
+        self.board[r][endCol] = "--"
+        self.board[endRow][endCol] = pawn
+        kingRow, kingCol = (
+            self.whiteKingLocation if pawn[0] == "w" else self.blackKingLocation
+        )
+        enemyColor = "b" if pawn[0] == "w" else "w"
+        legal = not self._lookForAttackers(kingRow, kingCol, enemyColor)
+        self.board[endRow][endCol] = "--"
+        self.board[r][endCol] = captured
+        self.board[r][c] = pawn
+        return legal
+
     """ to determine if the current player is in check """
 
     def inCheck(self):
@@ -265,22 +792,80 @@ class GameState:
     """ to determine if the enemy can attack the square(r, c) """
 
     def squareUnderAttack(self, r, c):
-        # first switch to the opponents move
-        self.whiteToMove = not self.whiteToMove
-        # generate all of its moves
-        oppMoves = self.getAllPossibleMoves()
-        self.whiteToMove = not self.whiteToMove  # switch the turns back
-        # check if any of those moves is attacking my kings location
-        for move in oppMoves:
-            if move.endRow == r and move.endCol == c:  # now my king is under attack
-                # note: we have done the move on our back end, so no need to undoMove() it
-                return True
-        return False  # none of my opponents move will be attacking my king
+        enemyColor = "b" if self.whiteToMove else "w"
+        if self.bitboards is not None:
+            return self.bitboards.isAttacked(r * 8 + c, enemyColor)
+        return self._lookForAttackers(r, c, enemyColor)
+
+    """ all the pieces of the given color attacking the square(r, c) as a list of (row, col) """
+
+    def attackersOf(self, square, color):
+        r, c = square
+        if self.bitboards is not None:
+            attackers = self.bitboards.attackersOf(r * 8 + c, color)
+            return [divmod(sq, 8) for sq in Bitboards.squaresOf(attackers)]
+        found = []
+        self._lookForAttackers(r, c, color, found)
+        return found
+
+    """
+    instead of generating all the moves of the enemy and looking for one that ends
+    on (r, c), we look outward from (r, c) itself: where a knight, a king or a pawn
+    of color would have to stand to hit it, and along every ray for the first piece
+    that is a sliding one of color. It stops at the first attacker it finds unless
+    we give it a list to collect all of them into
+    """
+
+    def _lookForAttackers(self, r, c, color, found=None):
+        board = self.board
+        # a pawn of color hits (r, c) from one row behind it, and black pawns go down the rows
+        pawnRow = r + 1 if color == "w" else r - 1
+        if 0 <= pawnRow < 8:
+            pawn = color + "p"
+            if c - 1 >= 0 and board[pawnRow][c - 1] == pawn:
+                if found is None:
+                    return True
+                found.append((pawnRow, c - 1))
+            if c + 1 <= 7 and board[pawnRow][c + 1] == pawn:
+                if found is None:
+                    return True
+                found.append((pawnRow, c + 1))
+        knight = color + "N"
+        for m in Bitboards.knightSteps:
+            endRow = r + m[0]
+            endCol = c + m[1]
+            if 0 <= endRow < 8 and 0 <= endCol < 8 and board[endRow][endCol] == knight:
+                if found is None:
+                    return True
+                found.append((endRow, endCol))
+        for d in Bitboards.allDirections:
+            # the rock directions come first in allDirections
+            slider = "R" if d[0] == 0 or d[1] == 0 else "B"
+            for i in range(1, 8):
+                endRow = r + d[0] * i
+                endCol = c + d[1] * i
+                if not (0 <= endRow < 8 and 0 <= endCol < 8):
+                    break
+                endPiece = board[endRow][endCol]
+                if endPiece == "--":
+                    continue
+                if endPiece[0] == color and (
+                    endPiece[1] == "Q"
+                    or endPiece[1] == slider
+                    or (i == 1 and endPiece[1] == "K")
+                ):
+                    if found is None:
+                        return True
+                    found.append((endRow, endCol))
+                break  # any piece blocks the rest of the ray
+        return bool(found)
 
     """ all moves without considering checks """
 
     def getAllPossibleMoves(self):
         moves = []
+        if self.bitboards is not None:
+            return self.bitboards.generateMoves(self, moves)
         for r in range(len(self.board)):  # number of rows
             # number of columns in a given row
             for c in range(len(self.board[r])):
@@ -298,57 +883,89 @@ class GameState:
     then this move to the list """
 
     def getPawnMove(self, r, c, moves):
+        # the squares this pawn may land on because of pins and checks
+        allowed = self._allowedTargets(r, c)
+        # when only the captures are wanted, a push is still fine if it promotes
+        quiet = not self.capturesOnly
         if self.whiteToMove:  # white pawn move
             if self.board[r - 1][c] == "--":  # the square in front of a pawn is empty
                 # startSquare, endSquare, board
-                moves.append(Move((r, c), (r - 1, c), self.board))
+                if allowed >> ((r - 1) * 8 + c) & 1 and (quiet or r - 1 == 0):
+                    moves.append(Move((r, c), (r - 1, c), self.board))
                 # check if it possible to advance to squares in the first move
-                if r == 6 and self.board[r - 2][c] == "--":
+                if (
+                    quiet
+                    and r == 6
+                    and self.board[r - 2][c] == "--"
+                    and allowed >> ((r - 2) * 8 + c) & 1
+                ):
                     moves.append(Move((r, c), (r - 2, c), self.board))
             if c - 1 >= 0:  # don't go outside the board from the left :)
                 if (
                     self.board[r - 1][c - 1][0] == "b"
                 ):  # there's an enemy piece to capture
-                    moves.append(Move((r, c), (r - 1, c - 1), self.board))
+                    if allowed >> ((r - 1) * 8 + c - 1) & 1:
+                        moves.append(Move((r, c), (r - 1, c - 1), self.board))
                 elif (r - 1, c - 1) == self.enpassantPossible:
-                    moves.append(
-                        Move((r, c), (r - 1, c - 1), self.board, isEnpassantMove=True)
-                    )
+                    if self._enpassantIsLegal(r, c, r - 1, c - 1):
+                        moves.append(
+                            Move(
+                                (r, c), (r - 1, c - 1), self.board, isEnpassantMove=True
+                            )
+                        )
             if c + 1 <= 7:  # don't go outside the board from the right :)
                 if (
                     self.board[r - 1][c + 1][0] == "b"
                 ):  # there's an enemy piece to capture
-                    moves.append(Move((r, c), (r - 1, c + 1), self.board))
+                    if allowed >> ((r - 1) * 8 + c + 1) & 1:
+                        moves.append(Move((r, c), (r - 1, c + 1), self.board))
                 elif (r - 1, c + 1) == self.enpassantPossible:
-                    moves.append(
-                        Move((r, c), (r - 1, c + 1), self.board, isEnpassantMove=True)
-                    )
+                    if self._enpassantIsLegal(r, c, r - 1, c + 1):
+                        moves.append(
+                            Move(
+                                (r, c), (r - 1, c + 1), self.board, isEnpassantMove=True
+                            )
+                        )
 
         else:  # black pawn move
             if self.board[r + 1][c] == "--":  # the square in front of a pawn is empty
                 # startSquare, endSquare, board
-                moves.append(Move((r, c), (r + 1, c), self.board))
+                if allowed >> ((r + 1) * 8 + c) & 1 and (quiet or r + 1 == 7):
+                    moves.append(Move((r, c), (r + 1, c), self.board))
                 # check if it possible to advance to squares in the first move
-                if r == 1 and self.board[r + 2][c] == "--":
+                if (
+                    quiet
+                    and r == 1
+                    and self.board[r + 2][c] == "--"
+                    and allowed >> ((r + 2) * 8 + c) & 1
+                ):
                     moves.append(Move((r, c), (r + 2, c), self.board))
             if c - 1 >= 0:  # don't go outside the board from the left :)
                 if (
                     self.board[r + 1][c - 1][0] == "w"
                 ):  # there's an enemy piece to capture
-                    moves.append(Move((r, c), (r + 1, c - 1), self.board))
+                    if allowed >> ((r + 1) * 8 + c - 1) & 1:
+                        moves.append(Move((r, c), (r + 1, c - 1), self.board))
                 elif (r + 1, c - 1) == self.enpassantPossible:
-                    moves.append(
-                        Move((r, c), (r + 1, c - 1), self.board, isEnpassantMove=True)
-                    )
+                    if self._enpassantIsLegal(r, c, r + 1, c - 1):
+                        moves.append(
+                            Move(
+                                (r, c), (r + 1, c - 1), self.board, isEnpassantMove=True
+                            )
+                        )
             if c + 1 <= 7:  # don't go outside the board from the right :)
                 if (
                     self.board[r + 1][c + 1][0] == "w"
                 ):  # there's an enemy piece to capture
-                    moves.append(Move((r, c), (r + 1, c + 1), self.board))
+                    if allowed >> ((r + 1) * 8 + c + 1) & 1:
+                        moves.append(Move((r, c), (r + 1, c + 1), self.board))
                 elif (r + 1, c + 1) == self.enpassantPossible:
-                    moves.append(
-                        Move((r, c), (r + 1, c + 1), self.board, isEnpassantMove=True)
-                    )
+                    if self._enpassantIsLegal(r, c, r + 1, c + 1):
+                        moves.append(
+                            Move(
+                                (r, c), (r + 1, c + 1), self.board, isEnpassantMove=True
+                            )
+                        )
 
         # paw promotions will be added later..
 
@@ -370,12 +987,20 @@ class GameState:
             (2, 1),
         )
         allyColor = "w" if self.whiteToMove else "b"
+        allowed = self._allowedTargets(r, c)
+        if allowed == 0:  # a pinned knight can never move
+            return
+        quiet = not self.capturesOnly
         for m in knightMoves:
             endRow = r + m[0]
             endCol = c + m[1]
             if 0 <= endRow < 8 and 0 <= endCol < 8:
                 endPiece = self.board[endRow][endCol]
-                if endPiece[0] != allyColor:
+                if (
+                    endPiece[0] != allyColor
+                    and (quiet or endPiece != "--")
+                    and allowed >> (endRow * 8 + endCol) & 1
+                ):
                     moves.append(Move((r, c), (endRow, endCol), self.board))
 
     """ all moves for a bishop located at row:r and column:c
@@ -385,6 +1010,10 @@ class GameState:
         # (row, col) representation for the 4 diaganol moves
         directions = ((-1, -1), (-1, 1), (1, -1), (1, 1))
         enemyColor = "b" if self.whiteToMove else "w"
+        allowed = self._allowedTargets(r, c)
+        if allowed == 0:
+            return
+        quiet = not self.capturesOnly
         for d in directions:
             for i in range(1, 8):
                 endRow = r + d[0] * i
@@ -396,10 +1025,12 @@ class GameState:
                     if endPiece == "--":
                         # empty square, so we can reach it and check \
                         # if we can reach more squares after that
-                        moves.append(Move((r, c), (endRow, endCol), self.board))
+                        if quiet and allowed >> (endRow * 8 + endCol) & 1:
+                            moves.append(Move((r, c), (endRow, endCol), self.board))
                     elif endPiece[0] == enemyColor:
                         # that's our enemy, so we can still capture
-                        moves.append(Move((r, c), (endRow, endCol), self.board))
+                        if allowed >> (endRow * 8 + endCol) & 1:
+                            moves.append(Move((r, c), (endRow, endCol), self.board))
                         # but if we had to capture, then we can't check for more moves
                         # in that direction
                         break
@@ -418,6 +1049,10 @@ class GameState:
         # up, left, down, right
         directions = ((-1, 0), (0, -1), (1, 0), (0, 1))
         enemyColor = "b" if self.whiteToMove else "w"
+        allowed = self._allowedTargets(r, c)
+        if allowed == 0:
+            return
+        quiet = not self.capturesOnly
         for d in directions:
             for i in range(1, 8):
                 endRow = r + d[0] * i
@@ -429,10 +1064,12 @@ class GameState:
                     if endPiece == "--":
                         # empty square, so we can reach it and check \
                         # if we can reach more squares after that
-                        moves.append(Move((r, c), (endRow, endCol), self.board))
+                        if quiet and allowed >> (endRow * 8 + endCol) & 1:
+                            moves.append(Move((r, c), (endRow, endCol), self.board))
                     elif endPiece[0] == enemyColor:
                         # that's our enemy, so we can still capture
-                        moves.append(Move((r, c), (endRow, endCol), self.board))
+                        if allowed >> (endRow * 8 + endCol) & 1:
+                            moves.append(Move((r, c), (endRow, endCol), self.board))
                         # but if we had to capture, then we can't check for more moves
                         # in that direction
                         break
@@ -466,12 +1103,17 @@ class GameState:
             (1, 1),
         )  # from the bishop
         allyColor = "w" if self.whiteToMove else "b"
+        quiet = not self.capturesOnly
         for i in range(8):
             endRow = r + kingMoves[i][0]
             endCol = c + kingMoves[i][1]
             if 0 <= endRow < 8 and 0 <= endCol < 8:
                 endPiece = self.board[endRow][endCol]
-                if endPiece[0] != allyColor:
+                if (
+                    endPiece[0] != allyColor
+                    and (quiet or endPiece != "--")
+                    and self._kingCanGoTo(r, c, endRow, endCol)
+                ):
                     moves.append(Move((r, c), (endRow, endCol), self.board))
         # self.getCastleMoves(r, c, moves, allyColor)
 
@@ -483,13 +1125,9 @@ class GameState:
             return
         # 2nd check if the squares in between the king and the rook is vacated or not
         # 3rd check to see if any of those squares are under attack
-        if (self.whiteToMove and self.currentCastlingRights.wks) or (
-            not self.whiteToMove and self.currentCastlingRights.bks
-        ):
+        if self.castleRights & (WKS if self.whiteToMove else BKS):
             self.getKingSideCastleMoves(r, c, moves)
-        if (self.whiteToMove and self.currentCastlingRights.wqs) or (
-            not self.whiteToMove and self.currentCastlingRights.bqs
-        ):
+        if self.castleRights & (WQS if self.whiteToMove else BQS):
             self.getQueenSideCastleMoves(r, c, moves)
 
     def getKingSideCastleMoves(self, r, c, moves):
@@ -522,7 +1160,24 @@ class CastleRights:
 
 
 class Move:
-    ranksToRows = {"1": 7, "2": 6, "3": 5, "4": 4, "5": 3, "6": 2, "7": 1, "0": 0}
+    # the search makes thousands of these for every node, so no __dict__ for
+    # each of them, the attributes live in fixed slots instead
+    __slots__ = (
+        "startRow",
+        "startCol",
+        "endRow",
+        "endCol",
+        "pieceMoved",
+        "pieceCaptured",
+        "isEnpassantMove",
+        "isPawnPromotion",
+        "promotionChoice",
+        "isCastleMove",
+        "isCapture",
+        "moveID",
+    )
+
+    ranksToRows = {"1": 7, "2": 6, "3": 5, "4": 4, "5": 3, "6": 2, "7": 1, "8": 0}
 
     rowsToRanks = {v: k for k, v in ranksToRows.items()}
 
@@ -530,23 +1185,29 @@ class Move:
 
     colsToFiles = {v: k for k, v in fileToCols.items()}
 
+    # what a pawn can promote to, the first one is the default
+    promotionPieces = ("Q", "R", "B", "N")
+    promotionIndex = {piece: i for i, piece in enumerate(promotionPieces)}
+
     def __init__(
-        self, startSq, endSq, board, isEnpassantMove=False, isCastleMove=False
+        self,
+        startSq,
+        endSq,
+        board,
+        isEnpassantMove=False,
+        isCastleMove=False,
+        promotionChoice="Q",
     ):
-        self.startRow, self.startCol = startSq
-        self.endRow, self.endCol = endSq
-        self.pieceMoved = board[self.startRow][self.startCol]
-        self.pieceCaptured = board[self.endRow][self.endCol]
+        self.startRow, self.startCol = startRow, startCol = startSq
+        self.endRow, self.endCol = endRow, endCol = endSq
+        self.pieceMoved = pieceMoved = board[startRow][startCol]
 
         # enpassant move
         self.isEnpassantMove = isEnpassantMove
-        if self.isEnpassantMove:
-            self.pieceCaptured = "wp" if self.pieceMoved == "bp" else "bp"
-
-        # pawn promotion move
-        self.isPawnPromotion = (self.pieceMoved == "wp" and self.endRow == 0) or (
-            self.pieceMoved == "bp" and self.endRow == 7
-        )
+        if isEnpassantMove:
+            self.pieceCaptured = "wp" if pieceMoved == "bp" else "bp"
+        else:
+            self.pieceCaptured = board[endRow][endCol]
 
         # castle move
         self.isCastleMove = isCastleMove
@@ -554,11 +1215,41 @@ class Move:
         # see if the move was a capture move or not
         self.isCapture = self.pieceCaptured != "--"
 
-        # a unique id for each move in the range of 0 and 7777
-        self.moveID = (
-            self.startRow * 1000 + self.startCol * 100 + self.endRow * 10 + self.endCol
-        )
-        # print(self.moveID) # for debugging
+        # a unique id for each move packed in an int:
+        #   bits  0-5   the start square (row * 8 + col)
+        #   bits  6-11  the end square
+        #   bits 12-13  the promotion piece, an index into promotionPieces
+        # so "moveID & 0xFFF" is the (start, end) pair and the id fits in 14 bits
+        self.moveID = startRow * 8 + startCol | (endRow * 8 + endCol) << 6
+
+        # pawn promotion move, a pawn can only get to the last row of its own side
+        self.promotionChoice = promotionChoice
+        self.isPawnPromotion = pieceMoved[1] == "p" and (endRow == 0 or endRow == 7)
+        if self.isPawnPromotion:
+            self.moveID |= self.promotionIndex[promotionChoice] << 12
+
+    """
+    the same as Move((startSq // 8, startSq % 8), (endSq // 8, endSq % 8), board) for an
+    ordinary move (not an enpassant or a castle one), but straight from the square
+    numbers, so the bitboard generator doesn't build two tuples for every move
+    """
+
+    @classmethod
+    def fromSquares(cls, startSq, endSq, board):
+        move = cls.__new__(cls)
+        move.startRow = startRow = startSq >> 3
+        move.startCol = startCol = startSq & 7
+        move.endRow = endRow = endSq >> 3
+        move.endCol = endCol = endSq & 7
+        move.pieceMoved = pieceMoved = board[startRow][startCol]
+        move.pieceCaptured = pieceCaptured = board[endRow][endCol]
+        move.isEnpassantMove = False
+        move.isCastleMove = False
+        move.isCapture = pieceCaptured != "--"
+        move.moveID = startSq | endSq << 6
+        move.promotionChoice = "Q"
+        move.isPawnPromotion = pieceMoved[1] == "p" and (endRow == 0 or endRow == 7)
+        return move
 
     """ overriding the equals method: maybe like copy or move constructors """
 
@@ -567,11 +1258,18 @@ class Move:
             return self.moveID == other.moveID
         return False
 
+    # equal moves need equal hashes, so the moves can go in sets and dicts too
+    def __hash__(self):
+        return self.moveID
+
     def getChessNotation(self):
         # this can be modified to be a more real chess notation
-        return self.getRankFile(self.startRow, self.startCol) + self.getRankFile(
+        notation = self.getRankFile(self.startRow, self.startCol) + self.getRankFile(
             self.endRow, self.endCol
         )
+        if self.isPawnPromotion:
+            notation += self.promotionChoice.lower()  # like e7e8q
+        return notation
 
     def getRankFile(self, r, c):
         return self.colsToFiles[c] + self.rowsToRanks[r]
@@ -583,11 +1281,14 @@ class Move:
         endSquare = self.getRankFile(self.endRow, self.endCol)
         # pawn moves, captures, promotion
         if self.pieceMoved[1] == "p":
+            moveString = endSquare
             if self.isCapture:
-                return self.colsToFiles[self.startCol] + "x" + endSquare
-            else:
-                return endSquare
-        # TODO add promotion, + sign for check, # for checkmate and two pieces can move to same square
+                moveString = self.colsToFiles[self.startCol] + "x" + endSquare
+            if self.isPawnPromotion:
+                moveString += "=" + self.promotionChoice
+            return moveString
+        # the + and # signs and the file or the rank when two pieces can move to the
+        # same square need the position, PGN.moveToSAN() gives the full SAN
         # other piece moves, captures
         moveString = self.pieceMoved[1]
         if self.isCapture:
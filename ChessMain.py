@@ -10,12 +10,12 @@ sys.path.append(".")
 # from Chess import ChessEngine, SmartMoveFinder
 import ChessEngine
 import SmartMoveFinder
+from EngineWorker import EngineWorker
 
 from ChessEngine import *
 from SmartMoveFinder import *
 import pygame as p
 import os
-from multiprocessing import Process, Queue
 
 # our current path information:
 current_path = os.path.dirname(__file__)  # Where your .py file is located
@@ -32,6 +32,13 @@ SQ_SIZE = BOARD_HEIGHT // DIMENSION
 # for animation later on
 MAX_FPS = 15
 IMAGES = {}
+# the bitboard backend of the GameState generates the moves a lot faster,
+# set it to False to go back to the plain 8x8 list one
+USE_BITBOARDS = True
+# how long the AI can think about one move (in seconds) and how deep it can go,
+# it deepens one ply at a time and plays the move of the last finished depth
+AI_TIME_LIMIT = 5
+AI_MAX_DEPTH = 6
 
 
 """
@@ -59,7 +66,7 @@ def main():
     clock = p.time.Clock()
     screen.fill(p.Color("white"))
     moveLogFont = p.font.SysFont("Arail", 20, False, False)
-    gs = GameState()
+    gs = GameState(useBitboards=USE_BITBOARDS)
     validMoves = gs.getValidMoves()
     # moveMade: a flag varible that keep tracks if a valid move has been made
     # so we can generate another new set of valid moves
@@ -78,7 +85,9 @@ def main():
     playerOne = True  # for white side
     playerTwo = True  # for black side
     AIThinking = False
-    moveFinderProcess = None
+    # the AI process is started the first time it has to move and then kept
+    # for the whole game, it gets only the moves made since it last looked
+    engine = None
     moveUndone = False
     while running:
         humanTurn = (gs.whiteToMove and playerOne) or (not gs.whiteToMove and playerTwo)
@@ -129,11 +138,11 @@ def main():
                     animate = False
                     gameOver = False
                     if AIThinking:
-                        moveFinderProcess.terminate()
+                        engine.stop()
                         AIThinking = False
                     moveUndone = True
                 if e.key == p.K_r:  # reset the board when r is pressed
-                    gs = GameState()
+                    gs = GameState(useBitboards=USE_BITBOARDS)
                     validMoves = gs.getValidMoves()
                     sqSelected = ()
                     playerClicks = []
@@ -141,28 +150,28 @@ def main():
                     animate = False
                     gameOver = False
                     running = True
-                    if AIThinking:
-                        moveFinderProcess.terminate()  # threading error
-                        AIThinking = False
+                    if engine is not None:
+                        engine.newGame()
+                    AIThinking = False
                     moveUndone = False
         # handle the AI move finder
         if not gameOver and not humanTurn and not moveUndone:
+            if engine is None:
+                engine = EngineWorker(USE_BITBOARDS, AI_MAX_DEPTH, AI_TIME_LIMIT)
             if not AIThinking:
                 AIThinking = True
                 print("thinking..")
-                returnQueue = Queue()  # is used to pass data between threads
-                moveFinderProcess = Process(
-                    target=SmartMoveFinder.findBestMoveMinMax,
-                    args=(
-                        gs,
-                        validMoves,
-                        returnQueue,
-                    ),
-                )
-                moveFinderProcess.start()
-                if not moveFinderProcess.is_alive():
-                    AIMove = returnQueue.get()
+                engine.sync(gs)
+                engine.go()
+            else:
+                # don't wait for the answer, so the window keeps drawing meanwhile
+                AIMoveID = engine.poll()
+                if AIMoveID is not None:
                     print("done thinking")
+                    AIMove = None
+                    for move in validMoves:
+                        if move.moveID == AIMoveID:
+                            AIMove = move
                     if AIMove is None:
                         AIMove = SmartMoveFinder.findRandomMoves(validMoves)
                     gs.makeMove(AIMove)
@@ -190,8 +199,16 @@ def main():
                 else "White wins by chekmate"
             )
             drawEndGameText(screen, text)
+        elif gs.isDraw():
+            gameOver = True
+            if gs.halfmoveClock >= 100:
+                drawEndGameText(screen, "Draw by the fifty move rule")
+            else:
+                drawEndGameText(screen, "Draw by repetition")
         clock.tick(MAX_FPS)
         p.display.flip()
+    if engine is not None:
+        engine.close()
 
 
 """ responsible for the all the graphics needed for a current game state """
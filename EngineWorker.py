@@ -0,0 +1,151 @@
+"""
+The AI runs in its own process, so the window keeps drawing while it thinks.
+Instead of starting a new process for every move and sending it the whole
+GameState, one worker process lives as long as the game and keeps its own
+copy of the position. The UI only tells it what changed: the ids of the
+moves made since the last time, or how many moves were taken back. The
+worker answers every "go" with the id of the move it found, and a search can
+be stopped early through a number in shared memory: the id of the last search
+the UI doesn't want anymore.
+
+It doesn't import pygame, so it works for anything that wants to run the
+search in the background, not only for ChessMain.
+"""
+import queue
+from multiprocessing import Process, Queue, Value
+
+import ChessEngine
+import SmartMoveFinder
+
+
+class EngineWorker:
+    def __init__(
+        self, useBitboards=False, maxDepth=SmartMoveFinder.MAX_DEPTH, timeLimit=None
+    ):
+        self.commands = Queue()
+        self.results = Queue()
+        # every "go" gets a new number, and every search up to stoppedID should stop,
+        # so an answer to a search that was stopped (by an undo or a reset) can be
+        # told apart and thrown away, and a stop can't get lost on its way
+        self.searchID = 0
+        self.stoppedID = Value("l", 0)
+        self.process = Process(
+            target=workerLoop,
+            args=(
+                self.commands,
+                self.results,
+                self.stoppedID,
+                useBitboards,
+                maxDepth,
+                timeLimit,
+            ),
+            daemon=True,
+        )
+        self.process.start()
+        # the move ids the worker has played on its board, to know what to send it
+        self.moveIDs = []
+
+    """ make the position of the worker the same as gs, sending only the moves that differ """
+
+    def sync(self, gs):
+        moveIDs = [move.moveID for move in gs.moveLog]
+        same = 0
+        while (
+            same < len(self.moveIDs)
+            and same < len(moveIDs)
+            and self.moveIDs[same] == moveIDs[same]
+        ):
+            same += 1
+        if same < len(self.moveIDs):
+            self.commands.put(("undo", len(self.moveIDs) - same))
+        if same < len(moveIDs):
+            self.commands.put(("moves", moveIDs[same:]))
+        self.moveIDs = moveIDs
+
+    """ start searching the position of the worker, the answer comes from poll() """
+
+    def go(self):
+        self.searchID += 1
+        self.commands.put(("go", self.searchID))
+
+    """ ask the running search to stop, it still answers with the best move it had """
+
+    def stop(self):
+        self.stoppedID.value = self.searchID
+
+    """ stop thinking and go back to the starting position with an empty transposition table """
+
+    def newGame(self):
+        self.stop()
+        self.commands.put(("newgame",))
+        self.moveIDs = []
+
+    """
+    the answer of the last go() without waiting for it: None while the worker is
+    still thinking, otherwise the id of the move it found (-1 if it found none)
+    """
+
+    def poll(self):
+        while True:
+            try:
+                searchID, moveID = self.results.get_nowait()
+            except queue.Empty:
+                return None
+            if searchID == self.searchID:
+                return moveID
+
+    def close(self):
+        self.stop()
+        self.commands.put(("quit",))
+        self.process.join(1)
+        if self.process.is_alive():
+            self.process.terminate()
+
+
+""" what the search looks at to know if it should stop, like a multiprocessing.Event """
+
+
+class SearchStop:
+    def __init__(self, stoppedID, searchID):
+        self.stoppedID = stoppedID
+        self.searchID = searchID
+
+    def is_set(self):
+        return self.stoppedID.value >= self.searchID
+
+
+""" the main function of the worker process, it runs the commands one by one until "quit" """
+
+
+def workerLoop(commands, results, stoppedID, useBitboards, maxDepth, timeLimit):
+    gs = ChessEngine.GameState(useBitboards=useBitboards)
+    while True:
+        command = commands.get()
+        name = command[0]
+        if name == "moves":
+            for moveID in command[1]:
+                for move in gs.getValidMoves():
+                    if move.moveID == moveID:
+                        gs.makeMove(move)
+                        break
+        elif name == "undo":
+            for _ in range(command[1]):
+                gs.undoMove()
+        elif name == "go":
+            searchID = command[1]
+            validMoves = gs.getValidMoves()
+            info = SmartMoveFinder.findBestMoveMinMax(
+                gs,
+                validMoves,
+                None,
+                maxDepth,
+                timeLimit,
+                stopEvent=SearchStop(stoppedID, searchID),
+            )
+            move = info.bestMove
+            results.put((searchID, -1 if move is None else move.moveID))
+        elif name == "newgame":
+            gs = ChessEngine.GameState(useBitboards=useBitboards)
+            SmartMoveFinder.transpositionTable.clear()
+        elif name == "quit":
+            break
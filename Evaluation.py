@@ -0,0 +1,222 @@
+"""
+The static evaluation terms: how much every piece is worth and how much it
+likes every square. Those are what SmartMoveFinder.scoreBoard() scores, but
+since the score of a position only changes where the pieces moved, the
+GameState keeps the totals up to date by adding the difference of each move
+instead of scoring the whole board at every leaf of the search.
+The pawn structure (evaluatePawns()) isn't a running total, a pawn move can
+change it on the files around it, but it only depends on the pawns, so the
+search scores every pawn structure once and keeps it in a pawn hash table.
+
+All the scores here are in SCORE_UNITS per pawn (so a pawn is 10 and a square
+preference of 1 is a tenth of a pawn) to keep the running totals as exact ints.
+Positive scores are good for white and negative ones are good for black.
+"""
+
+# assign the king any value which means you can't really lose
+# your king as it would be a checkmate before that happened
+pieceScore = {"K": 0, "Q": 10, "R": 5, "B": 3, "N": 3, "p": 1}
+
+# this is just a way to give some squares some prefrence than other when moving the each piece
+knightScores = [
+    [1, 1, 1, 1, 1, 1, 1, 1],
+    [1, 2, 2, 2, 2, 2, 2, 1],
+    [1, 2, 3, 3, 3, 3, 2, 1],
+    [1, 2, 3, 4, 4, 3, 2, 1],
+    [1, 2, 3, 4, 4, 3, 2, 1],
+    [1, 2, 3, 3, 3, 3, 2, 1],
+    [1, 2, 2, 2, 2, 2, 2, 1],
+    [1, 1, 1, 1, 1, 1, 1, 1],
+]
+
+bishopScores = [
+    [4, 3, 2, 1, 1, 2, 3, 4],
+    [3, 4, 3, 2, 2, 3, 4, 3],
+    [2, 3, 4, 3, 3, 4, 3, 2],
+    [1, 2, 3, 4, 4, 3, 2, 1],
+    [1, 2, 3, 4, 4, 3, 2, 1],
+    [2, 3, 4, 3, 3, 4, 3, 2],
+    [3, 4, 3, 2, 2, 3, 4, 3],
+    [4, 3, 2, 1, 1, 2, 3, 4],
+]
+
+queenScores = [
+    [1, 1, 1, 3, 1, 1, 1, 1],
+    [1, 2, 3, 3, 3, 1, 1, 1],
+    [1, 4, 3, 3, 3, 4, 2, 1],
+    [1, 2, 3, 3, 3, 2, 2, 1],
+    [1, 2, 3, 3, 3, 2, 2, 1],
+    [1, 4, 3, 3, 3, 4, 2, 1],
+    [1, 1, 2, 3, 3, 1, 1, 1],
+    [1, 1, 1, 3, 1, 1, 1, 1],
+]
+
+rockScores = [
+    [4, 3, 4, 4, 4, 4, 3, 4],
+    [4, 4, 4, 4, 4, 4, 4, 4],
+    [1, 1, 2, 3, 3, 2, 1, 1],
+    [1, 2, 3, 4, 4, 3, 2, 1],
+    [1, 2, 3, 4, 4, 3, 2, 1],
+    [1, 1, 2, 3, 3, 2, 1, 1],
+    [4, 4, 4, 4, 4, 4, 4, 4],
+    [4, 3, 4, 4, 4, 4, 3, 4],
+]
+
+whitePawnScores = [
+    [8, 8, 8, 8, 8, 8, 8, 8],
+    [8, 8, 8, 8, 8, 8, 8, 8],
+    [5, 6, 6, 7, 7, 6, 6, 5],
+    [2, 3, 3, 5, 5, 3, 3, 2],
+    [1, 2, 3, 4, 4, 3, 2, 1],
+    [1, 1, 2, 3, 3, 2, 1, 1],
+    [1, 1, 1, 0, 0, 1, 1, 1],
+    [0, 0, 0, 0, 0, 0, 0, 0],
+]
+
+blackPawnScores = [
+    [0, 0, 0, 0, 0, 0, 0, 0],
+    [1, 1, 1, 0, 0, 1, 1, 1],
+    [1, 1, 2, 3, 3, 2, 1, 1],
+    [1, 2, 3, 4, 4, 3, 2, 1],
+    [2, 3, 3, 5, 5, 3, 3, 2],
+    [5, 6, 6, 7, 7, 6, 6, 5],
+    [8, 8, 8, 8, 8, 8, 8, 8],
+    [8, 8, 8, 8, 8, 8, 8, 8],
+]
+
+# map eaching of the pieces to the appropriate 2d array
+piecePositionScores = {
+    "N": knightScores,
+    "B": bishopScores,
+    "Q": queenScores,
+    "R": rockScores,
+    "bp": blackPawnScores,
+    "wp": whitePawnScores,
+}
+
+SCORE_UNITS = 10
+
+# the pawn structure, see evaluatePawns(): what every pawn on a file with
+# another pawn of its color loses, what a pawn without a pawn of its color on
+# the files next to it loses, and what a pawn nothing can stop anymore gets,
+# by how far it went (from its own side of the board, so 1 is where it started)
+DOUBLED_PAWN_PENALTY = 2
+ISOLATED_PAWN_PENALTY = 1
+passedPawnScores = [0, 1, 1, 2, 3, 5, 8, 0]
+
+# materialValues["bN"] is what a black knight adds to the material total
+materialValues = {}
+# positionValues["bN"][row * 8 + col] is what a black knight adds to the position total
+positionValues = {}
+for _color, _sign in (("w", 1), ("b", -1)):
+    for _piece in pieceScore:
+        _name = _color + _piece
+        materialValues[_name] = _sign * pieceScore[_piece] * SCORE_UNITS
+        if _piece == "K":
+            positionValues[_name] = [0] * 64
+        else:
+            _table = piecePositionScores[_name if _piece == "p" else _piece]
+            positionValues[_name] = [
+                _sign * _table[sq // 8][sq % 8] for sq in range(64)
+            ]
+materialValues["--"] = 0
+positionValues["--"] = [0] * 64
+# the piece values we started with, to go back to after setPieceScores()
+DEFAULT_PIECE_SCORE = dict(pieceScore)
+
+
+"""
+change the values of some pieces, in pawns like pieceScore (they can have
+fractions, like {"B": 3.25}). The GameStates keep their running totals, so
+they have to be evaluated again with evaluateBoard() after that
+"""
+
+
+def setPieceScores(scores):
+    pieceScore.update(scores)
+    for color, sign in (("w", 1), ("b", -1)):
+        for piece in pieceScore:
+            materialValues[color + piece] = sign * round(
+                pieceScore[piece] * SCORE_UNITS
+            )
+
+
+""" the (material, position) totals of a board, by walking all its squares """
+
+
+def evaluateBoard(board):
+    material = 0
+    position = 0
+    for row in range(8):
+        for col in range(8):
+            square = board[row][col]
+            if square != "--":
+                material += materialValues[square]
+                position += positionValues[square][row * 8 + col]
+    return material, position
+
+
+""" how much a move changes the (material, position) totals """
+
+
+def moveDelta(move):
+    startSq = move.moveID & 63
+    endSq = move.moveID >> 6 & 63
+    moved = move.pieceMoved
+    # the piece that lands on the end square, the new one if it's a promotion
+    landed = moved[0] + move.promotionChoice if move.isPawnPromotion else moved
+    material = materialValues[landed] - materialValues[moved]
+    position = positionValues[landed][endSq] - positionValues[moved][startSq]
+    captured = move.pieceCaptured
+    if captured != "--":
+        # the enpassant pawn isn't on the end square, but on the start row
+        capturedSq = move.startRow * 8 + move.endCol if move.isEnpassantMove else endSq
+        material -= materialValues[captured]
+        position -= positionValues[captured][capturedSq]
+    if move.isCastleMove:
+        rock = positionValues[moved[0] + "R"]
+        if move.endCol - move.startCol == 2:  # king side castle
+            position += rock[endSq - 1] - rock[endSq + 1]
+        else:  # queen side castle
+            position += rock[endSq + 1] - rock[endSq - 2]
+    return material, position
+
+
+"""
+the pawn structure of a board (white minus black, in SCORE_UNITS): the doubled,
+the isolated and the passed pawns. It only depends on where the pawns are, so
+the search can keep it by GameState.pawnKey
+"""
+
+
+def evaluatePawns(board):
+    # the rows of the pawns on every file
+    files = {"wp": [[] for _ in range(8)], "bp": [[] for _ in range(8)]}
+    for r in range(1, 7):  # there are no pawns on the first and the last rows
+        row = board[r]
+        for c in range(8):
+            if row[c][1] == "p":
+                files[row[c]][c].append(r)
+    score = 0
+    for color, sign in (("w", 1), ("b", -1)):
+        own = files[color + "p"]
+        enemy = files[("b" if color == "w" else "w") + "p"]
+        for c in range(8):
+            rows = own[c]
+            if not rows:
+                continue
+            score -= sign * DOUBLED_PAWN_PENALTY * (len(rows) - 1)
+            neighbours = range(max(c - 1, 0), min(c + 2, 8))
+            if not any(own[f] for f in neighbours if f != c):
+                score -= sign * ISOLATED_PAWN_PENALTY * len(rows)
+            for r in rows:
+                # passed: no enemy pawn in front of it on its file or the ones next to it
+                if color == "w":
+                    blocked = any(er < r for f in neighbours for er in enemy[f])
+                    advanced = 7 - r
+                else:
+                    blocked = any(er > r for f in neighbours for er in enemy[f])
+                    advanced = r
+                if not blocked:
+                    score += sign * passedPawnScores[advanced]
+    return score
@@ -0,0 +1,62 @@
+"""
+A small fixed size cache for the evaluation, keyed by a zobrist key. The
+search keeps two of them: one for the scores of the whole positions, keyed by
+GameState.zobristKey, as the same leaves come again and again through the
+iterations and the re-searches, and a pawn hash table for the pawn structure,
+keyed by GameState.pawnKey, as the pawns move much less than the pieces and
+thousands of the positions of a search share the same few pawn structures.
+
+Every key has one slot (the low bits of the key) and the newest entry always
+takes it, so the memory is fixed by the number of entries. An entry is a
+(key, score) tuple written in one go, so a search in another thread can
+only see a whole entry, never the key of one and the score of another.
+"""
+
+# how many entries the caches have when no size is given, a power of two
+DEFAULT_ENTRIES = 1 << 16
+
+
+class EvaluationCache:
+    def __init__(self, entries=DEFAULT_ENTRIES):
+        # a power of two, so finding the slot is just a mask
+        size = 1
+        while size * 2 <= entries:
+            size *= 2
+        self.mask = size - 1
+        self.entries = [None] * size
+        self.probes = 0
+        self.hits = 0
+        self.stores = 0
+
+    """ the score stored for the key, or None if there's nothing """
+
+    def probe(self, key):
+        self.probes += 1
+        entry = self.entries[key & self.mask]
+        if entry is not None and entry[0] == key:
+            self.hits += 1
+            return entry[1]
+        return None
+
+    def store(self, key, score):
+        self.stores += 1
+        self.entries[key & self.mask] = (key, score)
+
+    """ forget everything, the scores of the positions change with the piece values """
+
+    def clear(self):
+        self.entries = [None] * len(self.entries)
+        self.probes = 0
+        self.hits = 0
+        self.stores = 0
+
+    def hitRate(self):
+        return self.hits / self.probes if self.probes else 0.0
+
+    def capacity(self):
+        return len(self.entries)
+
+    """ how full the cache is, from 0 to 1 """
+
+    def fillRate(self):
+        return sum(1 for entry in self.entries if entry is not None) / len(self.entries)
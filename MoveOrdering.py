@@ -0,0 +1,94 @@
+"""
+Move ordering for the alpha-beta search. The sooner the best move of a node
+is tried, the sooner the rest of its moves get pruned, so before searching
+the moves of a node we sort them by how promising they look:
+ 1. the hash move: the best move the transposition table (or the last
+    iteration at the root) remembers for this position
+    (at the root, the moves that did best in the games of the position
+    index come next, see PositionIndex.py)
+ 2. captures and promotions, the most valuable victim first and then the
+    least valuable attacker (MVV-LVA), so QxP comes after PxQ
+ 3. the killer moves: quiet moves that caused a beta cutoff at the same ply
+    in another branch, as they often refute this position too
+ 4. the rest of the quiet moves by their history score: how often and how
+    deep each (from square, to square) pair caused a beta cutoff so far
+"""
+
+# how much each piece is worth as a victim or as an attacker
+victimValues = {"p": 1, "N": 3, "B": 3, "R": 5, "Q": 9, "K": 0}
+attackerValues = {"p": 1, "N": 3, "B": 3, "R": 5, "Q": 9, "K": 10}
+
+HASH_MOVE_SCORE = 1 << 30
+ROOT_HINT_SCORE = 1 << 27  # plus the hint, up to ROOT_HINT_LIMIT
+ROOT_HINT_LIMIT = (1 << 27) - 1
+CAPTURE_SCORE = 1 << 25  # plus the MVV-LVA score
+KILLER_SCORE = 1 << 24  # plus one for the newest killer
+# the history scores are halved when one of them gets this big, so they always
+# stay under the killers and the old cutoffs slowly matter less
+HISTORY_LIMIT = 1 << 20
+MAX_PLY = 128
+
+
+class MoveOrderer:
+    def __init__(self):
+        # two killer move ids for every ply, the newest one first
+        self.killers = [[-1, -1] for _ in range(MAX_PLY)]
+        # indexed by the (start square, end square) part of the move id
+        self.history = [0] * 4096
+        # how many beta cutoffs we had, and how many of them were by the first move
+        self.cutoffs = 0
+        self.firstMoveCutoffs = 0
+        # a weight for some of the root moves, the bigger the sooner it's tried
+        self.rootHints = {}
+
+    """ sort the moves of a node in place, the most promising first """
+
+    def orderMoves(self, moves, ply, hashMoveID=-1):
+        killers = self.killers[ply] if ply < MAX_PLY else (-1, -1)
+        history = self.history
+        hints = self.rootHints if ply == 0 else None
+
+        def score(move):
+            if move.moveID == hashMoveID:
+                return HASH_MOVE_SCORE
+            if hints and move.moveID in hints:
+                return ROOT_HINT_SCORE + min(hints[move.moveID], ROOT_HINT_LIMIT)
+            if move.isCapture or move.isPawnPromotion:
+                value = 0
+                if move.isCapture:
+                    value = 10 * victimValues[move.pieceCaptured[1]]
+                if move.isPawnPromotion:
+                    value += 10 * victimValues[move.promotionChoice]
+                return CAPTURE_SCORE + value - attackerValues[move.pieceMoved[1]]
+            if move.moveID == killers[0]:
+                return KILLER_SCORE + 1
+            if move.moveID == killers[1]:
+                return KILLER_SCORE
+            return history[move.moveID & 0xFFF]
+
+        moves.sort(key=score, reverse=True)
+        return moves
+
+    """ called when the moveIndex-th move of a node at the given ply and depth failed high """
+
+    def recordCutoff(self, move, ply, depth, moveIndex):
+        self.cutoffs += 1
+        if moveIndex == 0:
+            self.firstMoveCutoffs += 1
+        if move.isCapture or move.isPawnPromotion:
+            return  # those are already ordered first by MVV-LVA
+        if ply < MAX_PLY:
+            killers = self.killers[ply]
+            if killers[0] != move.moveID:
+                killers[1] = killers[0]
+                killers[0] = move.moveID
+        index = move.moveID & 0xFFF
+        # deeper cutoffs saved more work, so they count more
+        self.history[index] += depth * depth
+        if self.history[index] >= HISTORY_LIMIT:
+            self.history = [value // 2 for value in self.history]
+
+    """ how many of the beta cutoffs came from the first move tried, from 0 to 1 """
+
+    def firstMoveCutoffRate(self):
+        return self.firstMoveCutoffs / self.cutoffs if self.cutoffs else 0.0
@@ -0,0 +1,286 @@
+"""
+An opening book in the Polyglot format, so the AI plays the first moves of a
+game instantly instead of searching them. The book is a sorted array of
+16 byte entries, all big-endian:
+    key     8 bytes  the Polyglot hash of the position
+    move    2 bytes  to file (bits 0-2), to rank (3-5), from file (6-8),
+                     from rank (9-11) and the promotion piece (12-14:
+                     none, knight, bishop, rock, queen), castling is written
+                     as the king taking its own rock (e1h1, e1a1, e8h8, e8a8)
+    weight  2 bytes  how good the move is, moves are picked in proportion to it
+    learn   4 bytes  not used
+The file is memory mapped and binary searched, so opening it doesn't read it
+and a lookup only touches the few pages around the key.
+
+The Polyglot hash xors 781 random 64-bit numbers (the Random64 table of the
+Polyglot sources, in PolyglotRandoms.py): 768 for the pieces on the squares,
+4 for the castling rights, 8 for the enpassant file and 1 for white to move.
+With that table the books of other programs work here and ours work there.
+Another table can still be loaded with loadRandoms() from a file that has its
+781 numbers in hex (like the Random64 array of the Polyglot book.c).
+
+    python3 OpeningBook.py build games.pgn -o book.bin --plies 16
+    python3 OpeningBook.py probe book.bin --fen "<fen>"
+"""
+import argparse
+import mmap
+import os
+import itertools
+import random
+import re
+import struct
+from collections import defaultdict
+
+from ChessEngine import GameState
+from PGN import readGames
+from PolyglotRandoms import RANDOM64
+
+ENTRY = struct.Struct(">QHHI")
+ENTRY_SIZE = ENTRY.size  # 16 bytes
+RANDOMS_COUNT = 781
+# white king side, white queen side, black king side, black queen side
+RANDOM_CASTLE = 768
+RANDOM_ENPASSANT = 772  # plus the file
+RANDOM_TURN = 780
+# the Polyglot piece kinds: the black pawn is 0, the white pawn 1, the black knight 2...
+pieceKinds = {}
+for _i, _piece in enumerate("pNBRQK"):
+    pieceKinds["b" + _piece] = 2 * _i
+    pieceKinds["w" + _piece] = 2 * _i + 1
+# the Polyglot promotion pieces, 0 is no promotion
+promotionCodes = {"N": 1, "B": 2, "R": 3, "Q": 4}
+codePromotions = {code: piece for piece, code in promotionCodes.items()}
+defaultRandoms = RANDOM64
+
+
+""" read the 781 numbers of a Random64 table written in hex, like 0x9D39247E33776D41 """
+
+
+def loadRandoms(path):
+    with open(path) as f:
+        numbers = [
+            int(number, 16) for number in re.findall(r"0[xX]([0-9A-Fa-f]+)", f.read())
+        ]
+    if len(numbers) != RANDOMS_COUNT:
+        raise ValueError(
+            "%s has %d numbers, a Random64 table has %d"
+            % (path, len(numbers), RANDOMS_COUNT)
+        )
+    return numbers
+
+
+""" the Polyglot hash of the position of gs """
+
+
+def polyglotKey(gs, randoms=defaultRandoms):
+    key = 0
+    for r in range(8):
+        row = gs.board[r]
+        rank = 7 - r  # Polyglot counts the ranks from white's side
+        for c in range(8):
+            piece = row[c]
+            if piece != "--":
+                key ^= randoms[64 * pieceKinds[piece] + 8 * rank + c]
+    # our castling bits are WKS, BKS, WQS, BQS, Polyglot has them as K, Q, k, q
+    for i, right in enumerate((1, 4, 2, 8)):
+        if gs.castleRights & right:
+            key ^= randoms[RANDOM_CASTLE + i]
+    # the enpassant file only counts when a pawn of the side to move could take there
+    if gs.enpassantPossible != ():
+        r, c = gs.enpassantPossible
+        pawnRow, pawn = (r + 1, "wp") if gs.whiteToMove else (r - 1, "bp")
+        if (c > 0 and gs.board[pawnRow][c - 1] == pawn) or (
+            c < 7 and gs.board[pawnRow][c + 1] == pawn
+        ):
+            key ^= randoms[RANDOM_ENPASSANT + c]
+    if gs.whiteToMove:
+        key ^= randoms[RANDOM_TURN]
+    return key
+
+
+""" the Polyglot 16-bit move of a Move """
+
+
+def encodeMove(move):
+    endCol = move.endCol
+    if move.isCastleMove:
+        endCol = 7 if move.endCol == 6 else 0  # the king takes its own rock
+    code = (
+        endCol | (7 - move.endRow) << 3 | move.startCol << 6 | (7 - move.startRow) << 9
+    )
+    if move.isPawnPromotion:
+        code |= promotionCodes[move.promotionChoice] << 12
+    return code
+
+
+""" the move of validMoves that the Polyglot move stands for, or None """
+
+
+def decodeMove(code, validMoves):
+    endCol = code & 7
+    endRow = 7 - (code >> 3 & 7)
+    startCol = code >> 6 & 7
+    startRow = 7 - (code >> 9 & 7)
+    promotion = codePromotions.get(code >> 12 & 7)
+    for move in validMoves:
+        if move.startRow != startRow or move.startCol != startCol:
+            continue
+        if move.isCastleMove:
+            if move.endRow == endRow and (endCol == 7) == (move.endCol == 6):
+                return move
+        elif move.endRow == endRow and move.endCol == endCol:
+            if not move.isPawnPromotion or move.promotionChoice == promotion:
+                return move
+    return None
+
+
+"""
+the index of the first of count sorted entries of the given size, starting at
+offset in data, whose key is key or bigger (count if there's none). The key is
+the first 8 bytes of an entry, big-endian, like in the Polyglot books
+"""
+
+
+def firstEntryAtOrAfter(data, offset, count, size, key):
+    low, high = 0, count
+    while low < high:
+        middle = (low + high) // 2
+        if struct.unpack_from(">Q", data, offset + middle * size)[0] < key:
+            low = middle + 1
+        else:
+            high = middle
+    return low
+
+
+class OpeningBook:
+    def __init__(self, path, randoms=defaultRandoms):
+        self.path = path
+        self.randoms = randoms
+        self.file = open(path, "rb")
+        size = os.fstat(self.file.fileno()).st_size
+        self.count = size // ENTRY_SIZE
+        # an empty file can't be mapped, and it has nothing to find anyway
+        self.data = None
+        if self.count:
+            self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    """ all the (move code, weight) pairs of the book for the key, best first """
+
+    def lookup(self, key):
+        # the entries are sorted by their keys
+        first = firstEntryAtOrAfter(self.data, 0, self.count, ENTRY_SIZE, key)
+        found = []
+        for i in range(first, self.count):
+            entryKey, code, weight, _ = ENTRY.unpack_from(self.data, i * ENTRY_SIZE)
+            if entryKey != key:
+                break
+            found.append((code, weight))
+        return found
+
+    """ the (move, weight) pairs the book has for the position, only the legal ones """
+
+    def moves(self, gs, validMoves=None):
+        if validMoves is None:
+            validMoves = gs.getValidMoves()
+        found = []
+        for code, weight in self.lookup(polyglotKey(gs, self.randoms)):
+            move = decodeMove(code, validMoves)
+            if move is not None and weight > 0:
+                found.append((move, weight))
+        return found
+
+    """
+    a book move for the position, picked at random in proportion to the weights,
+    or the one with the biggest weight if randomChoice is False. None if the
+    position isn't in the book
+    """
+
+    def pickMove(self, gs, validMoves=None, randomChoice=True):
+        found = self.moves(gs, validMoves)
+        if not found:
+            return None
+        if not randomChoice:
+            return max(found, key=lambda item: item[1])[0]
+        moves, weights = zip(*found)
+        return random.choices(moves, weights)[0]
+
+    def close(self):
+        if self.data is not None:
+            self.data.close()
+        self.file.close()
+
+
+"""
+build a book from the first plies of every game in the PGN files. A move gets
+2 points for each game its side won and 1 for each draw, the moves of the
+losing side are left out. It returns how many games and entries it used
+"""
+
+
+def buildBook(pgnPaths, bookPath, plies=16, randoms=defaultRandoms):
+    weights = defaultdict(int)
+    games = 0
+    for path in pgnPaths:
+        for game in readGames(path):
+            gs = game.startingState()
+            result = game.result
+            games += 1
+            # it stops at an illegal or a broken move, the rest can't be trusted
+            for move in itertools.islice(game.moves(gs), plies):
+                if result == "1/2-1/2" or result == "*":
+                    points = 1
+                elif (result == "1-0") == gs.whiteToMove:
+                    points = 2
+                else:
+                    points = 0
+                if points:
+                    weights[(polyglotKey(gs, randoms), encodeMove(move))] += points
+    # the weights have to fit in 16 bits
+    scale = max(1, (max(weights.values(), default=0) + 65534) // 65535)
+    entries = sorted(
+        (key, code, max(1, weight // scale)) for (key, code), weight in weights.items()
+    )
+    # for the same key the best move comes first, like the other Polyglot books
+    entries.sort(key=lambda entry: (entry[0], -entry[2]))
+    with open(bookPath, "wb") as f:
+        for key, code, weight in entries:
+            f.write(ENTRY.pack(key, code, weight, 0))
+    return games, len(entries)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Polyglot opening books")
+    parser.add_argument(
+        "--randoms", help="a file with the 781 numbers of the Polyglot Random64 table"
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="build a book from PGN files")
+    build.add_argument("pgn", nargs="+")
+    build.add_argument("-o", "--output", default="book.bin")
+    build.add_argument("--plies", type=int, default=16, help="how deep into each game")
+    probe = commands.add_parser("probe", help="list the book moves of a position")
+    probe.add_argument("book")
+    probe.add_argument("--fen", default=None, help="the starting position if not given")
+    args = parser.parse_args()
+    randoms = loadRandoms(args.randoms) if args.randoms else defaultRandoms
+    if args.command == "build":
+        games, entries = buildBook(args.pgn, args.output, args.plies, randoms)
+        print("%d games, %d entries written to %s" % (games, entries, args.output))
+    else:
+        if args.fen:
+            gs = GameState.fromFEN(args.fen, underpromotions=True)
+        else:
+            gs = GameState(underpromotions=True)
+        book = OpeningBook(args.book, randoms)
+        found = book.moves(gs)
+        total = sum(weight for _, weight in found)
+        for move, weight in found:
+            print("%-6s %5d %5.1f%%" % (move, weight, 100 * weight / total))
+        if not found:
+            print("not in the book")
+        book.close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
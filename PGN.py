@@ -0,0 +1,414 @@
+"""
+Reading and writing games in PGN, the text format of about every chess
+database. The reader is a generator: it goes through the file line by line
+and keeps only the game it's reading, so a file of many gigabytes takes as
+much memory as its longest game. A game comes out as a PGNGame with its tag
+pairs, its moves in SAN and its result, and the SAN only gets resolved to
+the Moves of a GameState (with getValidMoves()) when they're asked for, so
+going through the headers of a big file doesn't play a single move. The
+comments, the NAGs ($1) and the variations are skipped. Files ending in .gz
+are read and written compressed.
+
+The writer gives the moves in full SAN: the piece, the file and/or the rank
+it came from when another piece of the same kind could go to the same square,
+x for the captures, =Q for the promotions and + or # for the checks and the
+mates, so it needs the position every move was played in.
+
+    python3 PGN.py games.pgn                    read everything, with the games per second
+    python3 PGN.py games.pgn --headers-only     only split the games, no moves played
+    python3 PGN.py games.pgn -o clean.pgn       write the games again as they were read
+"""
+import argparse
+import gzip
+import re
+import sys
+import time
+
+from ChessEngine import GameState, Move, STARTING_FEN
+
+RESULTS = ("1-0", "0-1", "1/2-1/2", "*")
+# no line of the movetext gets longer than this, like the PGN standard asks
+LINE_LENGTH = 80
+# the tokens of the movetext: comments, variations, NAGs, move numbers and the moves
+_tokens = re.compile(
+    r"\{[^}]*\}?|;[^\n]*|\(|\)|\$\d+|\d+\.+|1-0|0-1|1/2-1/2|\*|[^\s{}();$.]+"
+)
+_tagPair = re.compile(r'\[\s*(\w+)\s+"((?:[^"\\]|\\.)*)"\s*\]')
+
+
+""" one game of a PGN file """
+
+
+class PGNGame:
+    def __init__(self, headers=None, sanMoves=None, result="*"):
+        self.headers = headers if headers is not None else {}
+        self.sanMoves = sanMoves if sanMoves is not None else []
+        self.result = result
+        # the SAN of the first illegal move moves() found, None if there wasn't one
+        self.error = None
+
+    """ the GameState the game starts from, the one of the FEN tag if there's one """
+
+    def startingState(self, useBitboards=False):
+        fen = self.headers.get("FEN", STARTING_FEN)
+        # the game can have any promotion, so the underpromotions are generated too
+        return GameState.fromFEN(fen, useBitboards, underpromotions=True)
+
+    """
+    the moves of the game played on gs one by one (it's the starting position
+    if not given), every one is yielded before it's made. It stops at the first
+    move that isn't legal and puts its SAN in self.error
+    """
+
+    def moves(self, gs=None):
+        if gs is None:
+            gs = self.startingState()
+        self.error = None
+        for san in self.sanMoves:
+            move = moveFromSAN(san, gs.getValidMoves())
+            if move is None:
+                self.error = san
+                return
+            yield move
+            gs.makeMove(move)
+
+    """ the GameState after all the moves, with them in its moveLog """
+
+    def play(self, useBitboards=False):
+        gs = self.startingState(useBitboards)
+        for _ in self.moves(gs):
+            pass
+        return gs
+
+    def __str__(self):
+        return formatGame(self.headers, self.sanMoves, self.result)
+
+
+"""
+the games of a PGN file (a path or an open text file) one by one as
+PGNGames, without keeping the ones before
+"""
+
+
+def readGames(source):
+    if isinstance(source, str):
+        with _open(source, "r") as f:
+            yield from readGames(f)
+        return
+    headers = {}
+    movetext = []
+    # a {comment} can go over several lines, even blank ones
+    inComment = False
+    for line in source:
+        if line.startswith("%"):
+            continue  # an escaped line, for the programs that wrote the file
+        stripped = line.strip()
+        if inComment:
+            movetext.append(stripped)
+        elif stripped.startswith("["):
+            if movetext:  # a new game starts without a blank line before it
+                yield parseGame(headers, movetext)
+                headers, movetext = {}, []
+            for name, value in _tagPair.findall(stripped):
+                headers[name] = value.replace('\\"', '"').replace("\\\\", "\\")
+            continue
+        elif stripped:
+            movetext.append(stripped)
+        elif movetext:
+            yield parseGame(headers, movetext)
+            headers, movetext = {}, []
+        opened, closed = stripped.rfind("{"), stripped.rfind("}")
+        if opened != closed:  # both are -1 when the line has no braces
+            inComment = opened > closed
+    if movetext or headers:
+        yield parseGame(headers, movetext)
+
+
+""" a PGNGame from its headers and the lines of its movetext """
+
+
+def parseGame(headers, movetext):
+    sanMoves = []
+    result = headers.get("Result", "*")
+    variations = 0
+    for token in _tokens.findall("\n".join(movetext)):
+        first = token[0]
+        if first == "(":
+            variations += 1
+        elif first == ")":
+            variations = max(0, variations - 1)
+        elif variations or first in "{;$":
+            continue
+        elif token in RESULTS:
+            result = token
+        elif not first.isdigit():
+            sanMoves.append(token)
+    return PGNGame(headers, sanMoves, result)
+
+
+""" the move of validMoves written in SAN, like Nbd2, exd5, e8=Q or O-O, or None """
+
+
+def moveFromSAN(san, validMoves):
+    san = san.rstrip("+#!?")
+    if san in ("O-O", "0-0", "O-O-O", "0-0-0"):
+        endCol = 6 if len(san) == 3 else 2
+        for move in validMoves:
+            if move.isCastleMove and move.endCol == endCol:
+                return move
+        return None
+    promotion = None
+    if "=" in san:
+        san, promotion = san.split("=", 1)
+    elif san and san[-1] in "NBRQ" and san[0] in "abcdefgh":
+        san, promotion = san[:-1], san[-1]  # a promotion written like e8Q
+    if (
+        len(san) < 2
+        or san[-2] not in Move.fileToCols
+        or san[-1] not in Move.ranksToRows
+    ):
+        return None
+    endRow = Move.ranksToRows[san[-1]]
+    endCol = Move.fileToCols[san[-2]]
+    piece = san[0] if san[0] in "NBRQK" else "p"
+    hints = san[1 if piece != "p" else 0 : -2].replace("x", "")
+    for move in validMoves:
+        if (
+            move.pieceMoved[1] != piece
+            or move.endRow != endRow
+            or move.endCol != endCol
+            or move.isCastleMove
+        ):
+            continue
+        if move.isPawnPromotion and move.promotionChoice != (promotion or "Q"):
+            continue
+        # the file and/or the rank the piece came from, when it could be two pieces
+        if all(
+            (hint in Move.fileToCols and Move.fileToCols[hint] == move.startCol)
+            or (hint in Move.ranksToRows and Move.ranksToRows[hint] == move.startRow)
+            for hint in hints
+        ):
+            return move
+    return None
+
+
+"""
+the SAN of a move of gs, like Nbd2, exd5, e8=Q+ or O-O#, with the other
+valid moves to tell which piece moved when two of them could
+"""
+
+
+def moveToSAN(gs, move, validMoves):
+    if move.isCastleMove:
+        san = "O-O" if move.endCol == 6 else "O-O-O"
+    else:
+        endSquare = move.getRankFile(move.endRow, move.endCol)
+        piece = move.pieceMoved[1]
+        if piece == "p":
+            san = endSquare
+            if move.isCapture:
+                san = move.colsToFiles[move.startCol] + "x" + endSquare
+            if move.isPawnPromotion:
+                san += "=" + move.promotionChoice
+        else:
+            others = [
+                other
+                for other in validMoves
+                if other.pieceMoved == move.pieceMoved
+                and other.endRow == move.endRow
+                and other.endCol == move.endCol
+                and (other.startRow, other.startCol) != (move.startRow, move.startCol)
+            ]
+            hint = ""
+            if others:
+                if all(other.startCol != move.startCol for other in others):
+                    hint = move.colsToFiles[move.startCol]
+                elif all(other.startRow != move.startRow for other in others):
+                    hint = move.rowsToRanks[move.startRow]
+                else:
+                    hint = move.getRankFile(move.startRow, move.startCol)
+            san = piece + hint + ("x" if move.isCapture else "") + endSquare
+    gs.makeMove(move)
+    if gs.inCheck():
+        san += "#" if len(gs.getValidMoves()) == 0 else "+"
+    gs.undoMove()
+    return san
+
+
+"""
+the SAN of all the moves in the moveLog of gs. The moves are taken back and
+played again to see the position of each one, so gs ends as it was
+"""
+
+
+def moveLogToSAN(gs):
+    moves = list(gs.moveLog)
+    for _ in moves:
+        gs.undoMove()
+    sanMoves = []
+    for move in moves:
+        sanMoves.append(moveToSAN(gs, move, gs.getValidMoves()))
+        gs.makeMove(move)
+    return sanMoves
+
+
+"""
+a game as PGN text: the tag pairs (Event, Site, Date, Round, White, Black and
+Result come first, with "?" when they're missing), then the numbered moves,
+with comment after the last one, and the result
+"""
+
+
+def formatGame(headers, sanMoves, result="*", comment=None):
+    headers = dict(headers)
+    headers["Result"] = result
+    lines = []
+    for name in ("Event", "Site", "Date", "Round", "White", "Black", "Result"):
+        lines.append(_formatTag(name, headers.pop(name, "?")))
+    lines += [_formatTag(name, value) for name, value in headers.items()]
+    lines.append("")
+    # the move numbers follow the FEN, and a game can start with a black move
+    fields = headers.get("FEN", STARTING_FEN).split()
+    moveNumber = int(fields[5]) if len(fields) >= 6 else 1
+    whiteToMove = fields[1] == "w"
+    words = []
+    for i, san in enumerate(sanMoves):
+        if whiteToMove:
+            words.append("%d. %s" % (moveNumber, san))
+        elif i == 0:
+            words.append("%d... %s" % (moveNumber, san))
+        else:
+            words.append(san)
+        if not whiteToMove:
+            moveNumber += 1
+        whiteToMove = not whiteToMove
+    if comment:
+        words.append("{%s}" % comment.replace("}", ")"))
+    words.append(result)
+    line = ""
+    for word in words:
+        if line and len(line) + 1 + len(word) > LINE_LENGTH:
+            lines.append(line)
+            line = word
+        else:
+            line = word if not line else line + " " + word
+    lines.append(line)
+    return "\n".join(lines) + "\n\n"
+
+
+def _formatTag(name, value):
+    value = str(value).replace("\\", "\\\\").replace('"', '\\"')
+    return '[%s "%s"]' % (name, value)
+
+
+""" writes games one after the other to a PGN file, a path or an open text file """
+
+
+class PGNWriter:
+    def __init__(self, target):
+        self.ownFile = isinstance(target, str)
+        self.file = _open(target, "w") if self.ownFile else target
+        self.games = 0
+
+    def writeGame(self, headers, sanMoves, result="*", comment=None):
+        self.file.write(formatGame(headers, sanMoves, result, comment))
+        self.games += 1
+
+    """
+    the game of the moveLog of gs, the FEN tag is added when it didn't start
+    from the starting position
+    """
+
+    def writeGameState(self, gs, headers=None, result="*", comment=None):
+        headers = dict(headers or {})
+        sanMoves = moveLogToSAN(gs)
+        if "FEN" not in headers:
+            moves = list(gs.moveLog)
+            for _ in moves:
+                gs.undoMove()
+            fen = gs.toFEN()
+            for move in moves:
+                gs.makeMove(move)
+            if fen != STARTING_FEN:
+                headers["SetUp"] = "1"
+                headers["FEN"] = fen
+        self.writeGame(headers, sanMoves, result, comment)
+
+    def close(self):
+        if self.ownFile:
+            self.file.close()
+        else:
+            self.file.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _open(path, mode):
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8", errors="replace")
+    return open(path, mode, encoding="utf-8", errors="replace")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="read and write PGN files")
+    parser.add_argument("pgn", nargs="+")
+    parser.add_argument(
+        "--headers-only",
+        action="store_true",
+        help="only split the games, without playing their moves",
+    )
+    parser.add_argument("-o", "--output", help="write the games that were read here")
+    parser.add_argument(
+        "--no-bitboards",
+        action="store_true",
+        help="play the moves on the board alone, it's slower",
+    )
+    parser.add_argument(
+        "--every", type=int, default=10000, help="print the speed every so many games"
+    )
+    args = parser.parse_args()
+    writer = PGNWriter(args.output) if args.output else None
+    games = moves = broken = 0
+    start = time.perf_counter()
+    for path in args.pgn:
+        for game in readGames(path):
+            games += 1
+            if not args.headers_only:
+                gs = game.startingState(not args.no_bitboards)
+                played = sum(1 for _ in game.moves(gs))
+                moves += played
+                if game.error is not None:
+                    broken += 1
+                    print(
+                        "game %d: illegal move %s after %d plies"
+                        % (games, game.error, played),
+                        file=sys.stderr,
+                    )
+            if writer is not None:
+                writer.writeGame(game.headers, game.sanMoves, game.result)
+            if games % args.every == 0:
+                elapsed = time.perf_counter() - start
+                print("%d games, %.0f games/s" % (games, games / elapsed))
+    elapsed = time.perf_counter() - start
+    print(
+        "%d games, %d moves, %d with an illegal move, %.1fs, %.0f games/s, %.0f moves/s"
+        % (
+            games,
+            moves,
+            broken,
+            elapsed,
+            games / elapsed if elapsed > 0 else 0,
+            moves / elapsed if elapsed > 0 else 0,
+        )
+    )
+    if writer is not None:
+        writer.close()
+    return 1 if broken else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,224 @@
+"""
+Perft: count every leaf of the legal move tree down to a given depth and
+compare it with the known counts of some well studied positions. A wrong
+count means a bug in getValidMoves(), makeMove() or undoMove(), and "divide"
+splits the count by the root moves to find out which move has it. It also
+tells how many nodes per second the move generation does, so it's the first
+thing to run after touching the engine.
+
+    python3 Perft.py                      the whole suite up to depth 3
+    python3 Perft.py --depth 4 --bitboards
+    python3 Perft.py --position kiwipete --depth 3 --divide
+    python3 Perft.py --fen "<fen>" --depth 5 --processes 4
+"""
+import argparse
+import multiprocessing
+import time
+
+import ChessEngine
+
+# (name, FEN, the number of leaves at depth 1, 2, 3, ...)
+# the counts are the published ones, so they include the underpromotions
+positions = [
+    (
+        "startpos",
+        "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1",
+        [20, 400, 8902, 197281, 4865609],
+    ),
+    # castling in every way, pins, enpassant and promotions, all at once
+    (
+        "kiwipete",
+        "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+        [48, 2039, 97862, 4085603],
+    ),
+    # an endgame with enpassant captures that uncover a check along the rank
+    (
+        "endgame",
+        "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+        [14, 191, 2812, 43238, 674624],
+    ),
+    # promotions and captures of the castling rocks
+    (
+        "promotions",
+        "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",
+        [6, 264, 9467, 422333],
+    ),
+    (
+        "talkchess",
+        "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8",
+        [44, 1486, 62379, 2103487],
+    ),
+    (
+        "middlegame",
+        "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10",
+        [46, 2079, 89890, 3894594],
+    ),
+]
+
+DEFAULT_DEPTH = 3
+
+
+""" a GameState set up from a FEN string, ready for perft """
+
+
+def positionFromFEN(fen, useBitboards=False):
+    return ChessEngine.GameState.fromFEN(fen, useBitboards, underpromotions=True)
+
+
+""" the number of leaves of the legal move tree, depth plies down from here """
+
+
+def perft(gs, depth):
+    if depth == 0:
+        return 1
+    moves = gs.getValidMoves()
+    if depth == 1:
+        return len(moves)  # no need to make the last moves just to count them
+    nodes = 0
+    for move in moves:
+        gs.makeMove(move)
+        nodes += perft(gs, depth - 1)
+        gs.undoMove()
+    return nodes
+
+
+""" the perft count under each root move, as a list of (move, nodes) """
+
+
+def divide(gs, depth):
+    result = []
+    for move in gs.getValidMoves():
+        gs.makeMove(move)
+        result.append((move, perft(gs, depth - 1)))
+        gs.undoMove()
+    return result
+
+
+""" the perft of a single root move in a worker process, the position is rebuilt from the FEN """
+
+
+def _perftRootMove(job):
+    fen, useBitboards, depth, moveIndex = job
+    gs = positionFromFEN(fen, useBitboards)
+    move = gs.getValidMoves()[moveIndex]
+    gs.makeMove(move)
+    return perft(gs, depth - 1)
+
+
+"""
+divide() with the root moves shared among a pool of processes, as the python
+threads can't run the move generation in parallel. The moves come in the
+same order in every process, so a worker only needs the index of its move
+"""
+
+
+def parallelDivide(fen, depth, useBitboards=False, processes=None):
+    gs = positionFromFEN(fen, useBitboards)
+    moves = gs.getValidMoves()
+    jobs = [(fen, useBitboards, depth, i) for i in range(len(moves))]
+    with multiprocessing.Pool(processes) as pool:
+        counts = pool.map(_perftRootMove, jobs, chunksize=1)
+    return list(zip(moves, counts))
+
+
+""" run one perft, print the divide if asked, and return (nodes, seconds) """
+
+
+def runPerft(fen, depth, useBitboards=False, processes=1, showDivide=False):
+    start = time.perf_counter()
+    if depth > 1 and (processes is None or processes > 1):
+        result = parallelDivide(fen, depth, useBitboards, processes)
+    elif showDivide and depth > 0:
+        result = divide(positionFromFEN(fen, useBitboards), depth)
+    else:
+        result = None
+    if result is None:
+        nodes = perft(positionFromFEN(fen, useBitboards), depth)
+    else:
+        nodes = sum(count for _, count in result)
+    elapsed = time.perf_counter() - start
+    if showDivide and result is not None:
+        for move, count in sorted(result, key=lambda item: item[0].getChessNotation()):
+            print("%s: %d" % (move.getChessNotation(), count))
+        print()
+    return nodes, elapsed
+
+
+""" run the standard positions up to maxDepth and return True if every count matched """
+
+
+def runSuite(maxDepth, useBitboards=False, processes=1, names=None, showDivide=False):
+    allPassed = True
+    totalNodes = 0
+    totalTime = 0.0
+    for name, fen, expected in positions:
+        if names is not None and name not in names:
+            continue
+        for depth in range(1, min(maxDepth, len(expected)) + 1):
+            nodes, elapsed = runPerft(fen, depth, useBitboards, processes, showDivide)
+            totalNodes += nodes
+            totalTime += elapsed
+            passed = nodes == expected[depth - 1]
+            allPassed = allPassed and passed
+            print(
+                "%-10s depth %d: %10d nodes %8.2fs %9d nodes/s  %s"
+                % (
+                    name,
+                    depth,
+                    nodes,
+                    elapsed,
+                    nodes / elapsed if elapsed > 0 else 0,
+                    "ok" if passed else "FAILED, expected %d" % expected[depth - 1],
+                )
+            )
+    print(
+        "total: %d nodes in %.2fs, %d nodes/s, %s"
+        % (
+            totalNodes,
+            totalTime,
+            totalNodes / totalTime if totalTime > 0 else 0,
+            "all passed" if allPassed else "SOME FAILED",
+        )
+    )
+    return allPassed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="perft for the chess move generation")
+    parser.add_argument("--depth", type=int, default=DEFAULT_DEPTH)
+    parser.add_argument("--fen", help="run a single position instead of the suite")
+    parser.add_argument(
+        "--position",
+        action="append",
+        choices=[name for name, _, _ in positions],
+        help="run only this position of the suite, can be given more than once",
+    )
+    parser.add_argument(
+        "--divide", action="store_true", help="print the count under each root move"
+    )
+    parser.add_argument(
+        "--bitboards", action="store_true", help="use the bitboard move generation"
+    )
+    parser.add_argument(
+        "--processes",
+        type=int,
+        default=1,
+        help="split the root moves among this many processes (0 for one per cpu)",
+    )
+    args = parser.parse_args()
+    processes = args.processes or None
+    if args.fen:
+        nodes, elapsed = runPerft(
+            args.fen, args.depth, args.bitboards, processes, args.divide
+        )
+        print(
+            "depth %d: %d nodes %.2fs %d nodes/s"
+            % (args.depth, nodes, elapsed, nodes / elapsed if elapsed > 0 else 0)
+        )
+        return 0
+    passed = runSuite(args.depth, args.bitboards, processes, args.position, args.divide)
+    return 0 if passed else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,288 @@
+"""
+An index of the positions of a game collection: for every position the
+games reached, every move that was played from it, how many times and how
+those games ended. It answers "how often was this position reached and
+what scored best from it" for corpora far bigger than the memory.
+
+The file starts with a magic and then has fixed size entries sorted by the
+position key and the move, all big-endian:
+    key        8 bytes  the GameState.zobristKey of the position
+    move       2 bytes  the moveID of the move played from it
+    games      4 bytes  how many times it was played
+    white      4 bytes  how many of those games white won
+    draws      4 bytes
+    black      4 bytes  how many black won, the rest had no result
+It's memory mapped and binary searched like the opening book, so a lookup
+only reads the few pages around the key.
+
+The builder is an external sort: it counts the (position, move) pairs of the
+games in a dict until it has runEntries of them, writes them sorted to a
+temporary run file and starts over, and at the end merges all the runs into
+the index, adding up the pairs that are in more than one run. So the memory
+it needs is set by runEntries and not by the size of the corpus.
+
+The search uses it as a hint for the move ordering at the root: the moves
+that scored best in the games are tried first, see MoveOrderer.rootHints.
+
+    python3 PositionIndex.py build games.pgn -o positions.idx --plies 40
+    python3 PositionIndex.py probe positions.idx --fen "<fen>"
+"""
+import argparse
+import heapq
+import itertools
+import mmap
+import os
+import struct
+import tempfile
+import time
+
+from ChessEngine import GameState
+from OpeningBook import firstEntryAtOrAfter
+from PGN import readGames, moveToSAN
+
+MAGIC = b"PYCHPIDX"
+ENTRY = struct.Struct(">QHIIII")
+ENTRY_SIZE = ENTRY.size  # 26 bytes
+# how many (position, move) pairs the builder keeps in memory before it writes a run
+RUN_ENTRIES = 500000
+# the counters are 32 bits, they stop there
+MAX_COUNT = 0xFFFFFFFF
+# which counter a result goes to, after the games one
+resultCounters = {"1-0": 1, "1/2-1/2": 2, "0-1": 3}
+
+
+""" the (games, white wins, draws, black wins) summed over some entries """
+
+
+def addStats(first, second):
+    return tuple(min(MAX_COUNT, a + b) for a, b in zip(first, second))
+
+
+"""
+the score of the stats for the side to move, from 0 to 1, like a tournament:
+a win is 1 and a draw half. The games without a result don't count
+"""
+
+
+def scoreFor(stats, whiteToMove):
+    games, white, draws, black = stats
+    decided = white + draws + black
+    if decided == 0:
+        return 0.5
+    wins = white if whiteToMove else black
+    return (wins + draws / 2) / decided
+
+
+class PositionIndex:
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "rb")
+        size = os.fstat(self.file.fileno()).st_size
+        if size < len(MAGIC) or self.file.read(len(MAGIC)) != MAGIC:
+            self.file.close()
+            raise ValueError("%s isn't a position index" % path)
+        self.count = (size - len(MAGIC)) // ENTRY_SIZE
+        # an index without entries can't be mapped, and it has nothing to find anyway
+        self.data = None
+        if self.count:
+            self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    """ all the (moveID, (games, white wins, draws, black wins)) of the key """
+
+    def lookup(self, key):
+        # the entries are sorted by their keys, after the magic
+        first = firstEntryAtOrAfter(self.data, len(MAGIC), self.count, ENTRY_SIZE, key)
+        found = []
+        for i in range(first, self.count):
+            entry = ENTRY.unpack_from(self.data, len(MAGIC) + i * ENTRY_SIZE)
+            if entry[0] != key:
+                break
+            found.append((entry[1], entry[2:]))
+        return found
+
+    """ the stats of the position summed over its moves, None if no game reached it """
+
+    def positionStats(self, gs):
+        found = self.lookup(gs.zobristKey)
+        if not found:
+            return None
+        total = (0, 0, 0, 0)
+        for _, stats in found:
+            total = addStats(total, stats)
+        return total
+
+    """ the (move, stats) pairs of the position, only the legal ones, the most played first """
+
+    def moves(self, gs, validMoves=None):
+        if validMoves is None:
+            validMoves = gs.getValidMoves()
+        byID = {move.moveID: move for move in validMoves}
+        found = [
+            (byID[moveID], stats)
+            for moveID, stats in self.lookup(gs.zobristKey)
+            if moveID in byID
+        ]
+        found.sort(key=lambda item: item[1][0], reverse=True)
+        return found
+
+    """
+    a weight for every move of the position that was played in the games, for
+    the move ordering: 2 for each game the side that played it won and 1 for
+    each draw, like the book builder, plus one so the losing moves still come
+    before the ones that were never played
+    """
+
+    def hints(self, gs, validMoves=None):
+        hints = {}
+        for move, (games, white, draws, black) in self.moves(gs, validMoves):
+            wins = white if gs.whiteToMove else black
+            hints[move.moveID] = 2 * wins + draws + 1
+        return hints
+
+    def close(self):
+        if self.data is not None:
+            self.data.close()
+        self.file.close()
+
+
+"""
+build an index from the first plies (all of them when it's None) of every
+game in the PGN files. It returns how many games and entries it wrote
+"""
+
+
+def buildIndex(pgnPaths, indexPath, plies=None, runEntries=RUN_ENTRIES, verbose=True):
+    directory = os.path.dirname(os.path.abspath(indexPath))
+    games = 0
+    start = time.perf_counter()
+    with tempfile.TemporaryDirectory(dir=directory) as runDirectory:
+        runs = []
+        counts = {}
+        for path in pgnPaths:
+            for game in readGames(path):
+                games += 1
+                counter = resultCounters.get(game.result)
+                gs = game.startingState(useBitboards=True)
+                for move in itertools.islice(game.moves(gs), plies):
+                    pair = (gs.zobristKey, move.moveID)
+                    stats = counts.get(pair)
+                    if stats is None:
+                        stats = counts[pair] = [0, 0, 0, 0]
+                    stats[0] += 1
+                    if counter is not None:
+                        stats[counter] += 1
+                    if len(counts) >= runEntries:
+                        runs.append(_writeRun(counts, runDirectory, len(runs)))
+                        counts = {}
+                if verbose and games % 1000 == 0:
+                    elapsed = time.perf_counter() - start
+                    print(
+                        "%d games, %d runs, %.0f games/s"
+                        % (games, len(runs), games / elapsed)
+                    )
+        if counts:
+            runs.append(_writeRun(counts, runDirectory, len(runs)))
+        entries = _mergeRuns(runs, indexPath)
+    return games, entries
+
+
+""" write the counts sorted by key and move to a run file, it returns its path """
+
+
+def _writeRun(counts, directory, number):
+    path = os.path.join(directory, "run%05d" % number)
+    with open(path, "wb") as f:
+        for (key, moveID), stats in sorted(counts.items()):
+            f.write(ENTRY.pack(key, moveID, *(min(MAX_COUNT, n) for n in stats)))
+    return path
+
+
+def _readRun(path):
+    with open(path, "rb") as f:
+        while True:
+            # a few thousand entries at a time
+            chunk = f.read(ENTRY_SIZE * 4096)
+            if not chunk:
+                return
+            yield from ENTRY.iter_unpack(chunk)
+
+
+""" merge the sorted runs into the index, adding up the same pairs, it returns how many entries it wrote """
+
+
+def _mergeRuns(runs, indexPath):
+    entries = 0
+    with open(indexPath, "wb") as f:
+        f.write(MAGIC)
+        merged = heapq.merge(*(_readRun(path) for path in runs))
+        for (key, moveID), group in itertools.groupby(
+            merged, key=lambda entry: entry[:2]
+        ):
+            total = (0, 0, 0, 0)
+            for entry in group:
+                total = addStats(total, entry[2:])
+            f.write(ENTRY.pack(key, moveID, *total))
+            entries += 1
+    return entries
+
+
+def main():
+    parser = argparse.ArgumentParser(description="index the positions of PGN files")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="build an index from PGN files")
+    build.add_argument("pgn", nargs="+")
+    build.add_argument("-o", "--output", default="positions.idx")
+    build.add_argument(
+        "--plies",
+        type=int,
+        default=None,
+        help="how deep into each game, all of it if not given",
+    )
+    build.add_argument(
+        "--run-entries",
+        type=int,
+        default=RUN_ENTRIES,
+        help="how many pairs are kept in memory before a run is written",
+    )
+    probe = commands.add_parser("probe", help="show the stats of a position")
+    probe.add_argument("index")
+    probe.add_argument("--fen", default=None, help="the starting position if not given")
+    args = parser.parse_args()
+    if args.command == "build":
+        start = time.perf_counter()
+        games, entries = buildIndex(args.pgn, args.output, args.plies, args.run_entries)
+        print(
+            "%d games, %d entries written to %s in %.1fs"
+            % (games, entries, args.output, time.perf_counter() - start)
+        )
+        return 0
+    if args.fen:
+        gs = GameState.fromFEN(args.fen, underpromotions=True)
+    else:
+        gs = GameState(underpromotions=True)
+    index = PositionIndex(args.index)
+    total = index.positionStats(gs)
+    if total is None:
+        print("not in the index")
+    else:
+        print(
+            "%d games, white %d, draws %d, black %d"
+            % (total[0], total[1], total[2], total[3])
+        )
+        validMoves = gs.getValidMoves()
+        for move, stats in index.moves(gs, validMoves):
+            print(
+                "%-8s %7d games %5.1f%% %6.1f%% score"
+                % (
+                    moveToSAN(gs, move, validMoves),
+                    stats[0],
+                    100 * stats[0] / total[0],
+                    100 * scoreFor(stats, gs.whiteToMove),
+                )
+            )
+    index.close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
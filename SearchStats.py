@@ -0,0 +1,194 @@
+"""
+What one search did and where its time went: the nodes (and how many of them
+were in the quiescence search), the nodes per second, the beta cutoffs and
+how many of them came from the first move, the transposition table probes
+and hits, the probes and hits of the evaluation caches, and the time spent
+generating the moves, making and taking back the moves and evaluating the
+positions.
+
+The counters the search keeps anyway (the nodes, the cutoffs, the table
+and the cache probes) are only copied in at the end. The times need a clock
+around every call, so while a search is instrumented its GameState gets
+timed versions of makeMove(), undoMove(), getValidMoves() and
+getCaptureMoves() as attributes of the object, and its SearchInfo gets a
+timed evaluate. Once the search is done they're taken away again, so a
+search that doesn't collect stats runs the code it always ran and doesn't
+pay anything for it. Nothing is changed outside of the GameState and the
+SearchInfo of the search, so the searches of other threads aren't timed.
+The clock itself costs a little time, so the instrumented search is a bit
+slower than the numbers it reports.
+"""
+import json
+import time
+from contextlib import contextmanager
+
+# the GameState methods that are timed, and what their time counts as
+TIMED_METHODS = {
+    "getValidMoves": "moveGen",
+    "getCaptureMoves": "moveGen",
+    "makeMove": "makeUnmake",
+    "undoMove": "makeUnmake",
+}
+CATEGORIES = ("moveGen", "makeUnmake", "eval")
+
+
+class SearchStats:
+    def __init__(self):
+        self.nodes = 0
+        self.quiescenceNodes = 0
+        self.cutoffs = 0
+        self.firstMoveCutoffs = 0
+        self.ttProbes = 0
+        self.ttHits = 0
+        # the (probes, hits) of every evaluation cache, by its name
+        self.caches = {}
+        # the seconds and the number of calls of every category
+        self.times = dict.fromkeys(CATEGORIES, 0.0)
+        self.calls = dict.fromkeys(CATEGORIES, 0)
+        self.elapsed = 0.0
+        self.depth = 0
+        self.bestMove = None
+        self.score = 0
+        # the table and cache counters when the search started, they go on from search to search
+        self._ttStart = (0, 0)
+        self._cacheStart = {}
+
+    """ a function that calls function and adds its time to the category """
+
+    def timed(self, category, function):
+        times, calls = self.times, self.calls
+        clock = time.perf_counter
+
+        def wrapper(*args):
+            start = clock()
+            result = function(*args)
+            times[category] += clock() - start
+            calls[category] += 1
+            return result
+
+        return wrapper
+
+    """
+    time the moves and the evaluation while the with block runs: the methods
+    of gs, and the evaluate function of the SearchInfo. caches are the
+    evaluation caches to count the probes of, by their names
+    """
+
+    @contextmanager
+    def instrument(self, gs, table, info, caches=None):
+        self._ttStart = (table.probes, table.hits)
+        self._cacheStart = {
+            name: (cache.probes, cache.hits) for name, cache in (caches or {}).items()
+        }
+        evaluator = info.evaluate
+        for name, category in TIMED_METHODS.items():
+            setattr(gs, name, self.timed(category, getattr(gs, name)))
+        info.evaluate = self.timed("eval", evaluator)
+        try:
+            yield self
+        finally:
+            # without the attributes the methods of the class are found again
+            for name in TIMED_METHODS:
+                delattr(gs, name)
+            info.evaluate = evaluator
+
+    """ copy in what the search counted itself, from its SearchInfo, its transposition table and its caches """
+
+    def finish(self, info, table, caches=None):
+        self.nodes = info.nodes
+        self.quiescenceNodes = info.quiescenceNodes
+        self.cutoffs = info.ordering.cutoffs
+        self.firstMoveCutoffs = info.ordering.firstMoveCutoffs
+        self.ttProbes = table.probes - self._ttStart[0]
+        self.ttHits = table.hits - self._ttStart[1]
+        for name, cache in (caches or {}).items():
+            probes, hits = self._cacheStart.get(name, (0, 0))
+            self.caches[name] = (cache.probes - probes, cache.hits - hits)
+        self.elapsed = info.elapsed()
+        self.depth = info.depth
+        self.bestMove = info.bestMove
+        self.score = info.bestScore
+
+    def nps(self):
+        return self.nodes / self.elapsed if self.elapsed > 0 else 0.0
+
+    """ how many of the beta cutoffs came from the first move tried, from 0 to 1 """
+
+    def firstMoveCutoffRate(self):
+        return self.firstMoveCutoffs / self.cutoffs if self.cutoffs else 0.0
+
+    def ttHitRate(self):
+        return self.ttHits / self.ttProbes if self.ttProbes else 0.0
+
+    def cacheHitRate(self, name):
+        probes, hits = self.caches.get(name, (0, 0))
+        return hits / probes if probes else 0.0
+
+    """ the time of the search that isn't in any category: the search itself, the ordering... """
+
+    def otherTime(self):
+        return max(0.0, self.elapsed - sum(self.times.values()))
+
+    def asDict(self):
+        return {
+            "depth": self.depth,
+            "move": None if self.bestMove is None else self.bestMove.getChessNotation(),
+            "score": self.score,
+            "nodes": self.nodes,
+            "quiescenceNodes": self.quiescenceNodes,
+            "time": round(self.elapsed, 6),
+            "nps": round(self.nps()),
+            "cutoffs": self.cutoffs,
+            "firstMoveCutoffRate": round(self.firstMoveCutoffRate(), 4),
+            "ttProbes": self.ttProbes,
+            "ttHits": self.ttHits,
+            "ttHitRate": round(self.ttHitRate(), 4),
+            "caches": {
+                name: {
+                    "probes": probes,
+                    "hits": hits,
+                    "hitRate": round(self.cacheHitRate(name), 4),
+                }
+                for name, (probes, hits) in self.caches.items()
+            },
+            "times": {name: round(value, 6) for name, value in self.times.items()},
+            "calls": dict(self.calls),
+            "otherTime": round(self.otherTime(), 6),
+        }
+
+    def toJSON(self):
+        return json.dumps(self.asDict())
+
+    """ add the stats as one line of JSON at the end of the file """
+
+    def dump(self, path):
+        with open(path, "a") as file:
+            file.write(self.toJSON() + "\n")
+
+    def __str__(self):
+        elapsed = self.elapsed or 1e-9
+        split = ", ".join(
+            "%s %.0f%%" % (name, 100 * self.times[name] / elapsed)
+            for name in CATEGORIES
+        )
+        caches = "".join(
+            ", %s probes %d (hits %.0f%%)"
+            % (name, probes, 100 * self.cacheHitRate(name))
+            for name, (probes, hits) in self.caches.items()
+        )
+        return (
+            "nodes %d (quiescence %d), %d nodes/s, cutoffs %d (first move %.0f%%), "
+            "tt probes %d (hits %.0f%%)%s, time: %s, other %.0f%%"
+            % (
+                self.nodes,
+                self.quiescenceNodes,
+                self.nps(),
+                self.cutoffs,
+                100 * self.firstMoveCutoffRate(),
+                self.ttProbes,
+                100 * self.ttHitRate(),
+                caches,
+                split,
+                100 * self.otherTime() / elapsed,
+            )
+        )
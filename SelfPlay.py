@@ -0,0 +1,389 @@
+"""
+Engine against engine games without the window, to see if a change to the
+engine makes it play better. The games are shared among a pool of processes
+and each one is played with GameState and SmartMoveFinder directly. The two
+engines can have their own depth, time, nodes, transposition table size,
+opening book, tablebases and piece values, like
+    depth=4,time=1,nodes=50000,hash=32,book=0,tablebases=1,N=3.25,name=new
+Every opening of the openings file (one FEN per line, # for comments) is
+played twice, once with each engine as white. The result of every game is
+written as soon as it's over, one JSON line per game and/or as PGN, and the
+score so far is printed with the games per hour.
+
+    python3 SelfPlay.py --games 200 --processes 4 -a depth=4,name=new -b depth=3
+    python3 SelfPlay.py --openings openings.txt --pgn games.pgn --results games.jsonl
+"""
+import argparse
+import json
+import math
+import multiprocessing
+import random
+import time
+
+import Evaluation
+import SmartMoveFinder
+from ChessEngine import GameState, STARTING_FEN
+from PGN import formatGame, moveToSAN
+from TranspositionTable import TranspositionTable
+
+# a game that gets this long is called a draw
+MAX_PLIES = 400
+# the settings a config string can have, and how to read their values
+_configKeys = {
+    "name": ("name", str),
+    "depth": ("maxDepth", int),
+    "time": ("timeLimit", float),
+    "nodes": ("nodeLimit", int),
+    "hash": ("hashMB", int),
+    "book": ("useBook", lambda value: value not in ("0", "false", "no")),
+    "tablebases": ("useTablebases", lambda value: value not in ("0", "false", "no")),
+}
+
+
+""" the settings of one engine in the match """
+
+
+class EngineConfig:
+    def __init__(
+        self,
+        name="engine",
+        maxDepth=SmartMoveFinder.MAX_DEPTH,
+        timeLimit=None,
+        nodeLimit=None,
+        hashMB=SmartMoveFinder.TT_SIZE_MB,
+        useBook=True,
+        useTablebases=True,
+        pieceScores=None,
+    ):
+        self.name = name
+        self.maxDepth = maxDepth
+        self.timeLimit = timeLimit
+        self.nodeLimit = nodeLimit
+        self.hashMB = hashMB
+        self.useBook = useBook
+        self.useTablebases = useTablebases
+        # the piece values that differ from Evaluation.pieceScore, in pawns
+        self.pieceScores = pieceScores or {}
+
+    """ an EngineConfig from a string like "depth=4,time=0.5,N=3.2" """
+
+    @classmethod
+    def parse(cls, text, name="engine"):
+        config = cls(name)
+        for item in filter(None, text.split(",")):
+            key, _, value = item.partition("=")
+            key = key.strip()
+            if key in Evaluation.pieceScore and key != "K":
+                config.pieceScores[key] = float(value)
+            elif key in _configKeys:
+                attribute, kind = _configKeys[key]
+                setattr(config, attribute, kind(value.strip()))
+            else:
+                raise ValueError("unknown engine setting %r in %r" % (key, text))
+        return config
+
+    def __str__(self):
+        settings = ["depth=%d" % self.maxDepth]
+        if self.timeLimit is not None:
+            settings.append("time=%g" % self.timeLimit)
+        if self.nodeLimit is not None:
+            settings.append("nodes=%d" % self.nodeLimit)
+        for piece, value in sorted(self.pieceScores.items()):
+            settings.append("%s=%g" % (piece, value))
+        return "%s (%s)" % (self.name, ",".join(settings))
+
+
+""" the openings of a file, one FEN per line, an empty list if there's no file """
+
+
+def readOpenings(path):
+    if path is None:
+        return []
+    openings = []
+    with open(path) as f:
+        for line in f:
+            line = line.split("#", 1)[0].strip()
+            if line:
+                GameState.fromFEN(line)  # a broken FEN fails here, not in a worker
+                openings.append(line)
+    return openings
+
+
+""" if nobody can mate anymore: only the kings, or a king and a bishop or a knight against a king """
+
+
+def insufficientMaterial(board):
+    pieces = [piece[1] for row in board for piece in row if piece != "--"]
+    return len(pieces) == 2 or (len(pieces) == 3 and ("B" in pieces or "N" in pieces))
+
+
+# the state of each worker process: the configs and the transposition tables
+_engines = None
+_useBitboards = False
+_maxPlies = MAX_PLIES
+
+
+def _initWorker(engines, useBitboards, maxPlies):
+    global _engines, _useBitboards, _maxPlies
+    _useBitboards = useBitboards
+    _maxPlies = maxPlies
+    # each engine has its own transposition table, as they may score differently
+    _engines = [(config, TranspositionTable(config.hashMB)) for config in engines]
+
+
+""" the engine settings go into SmartMoveFinder and Evaluation before each search """
+
+
+def _useEngine(gs, config, table):
+    SmartMoveFinder.transpositionTable = table
+    SmartMoveFinder.USE_OPENING_BOOK = config.useBook
+    SmartMoveFinder.USE_TABLEBASES = config.useTablebases
+    pieceScores = dict(Evaluation.DEFAULT_PIECE_SCORE, **config.pieceScores)
+    if pieceScores != Evaluation.pieceScore:
+        Evaluation.setPieceScores(pieceScores)
+        SmartMoveFinder.clearEvaluationCaches()
+        # the totals were kept with the values of the other engine
+        gs.materialScore, gs.positionScore = Evaluation.evaluateBoard(gs.board)
+
+
+"""
+play one game, job is (game number, opening FEN, which engine is white). It
+returns a dict with the result, the reason, the moves and the search statistics
+"""
+
+
+def playGame(job):
+    number, fen, whiteEngine = job
+    random.seed(number)  # the book picks the same moves when a game is played again
+    start = time.perf_counter()
+    gs = GameState.fromFEN(fen, _useBitboards)
+    engines = [_engines[whiteEngine], _engines[1 - whiteEngine]]
+    for _, table in engines:
+        table.clear()
+    stats = [{"moves": 0, "nodes": 0, "depth": 0, "seconds": 0.0} for _ in engines]
+    sanMoves = []
+    validMoves = gs.getValidMoves()
+    result = reason = None
+    while result is None:
+        if len(validMoves) == 0:
+            if gs.checkmate:
+                result, reason = ("0-1" if gs.whiteToMove else "1-0"), "checkmate"
+            else:
+                result, reason = "1/2-1/2", "stalemate"
+        elif gs.halfmoveClock >= 100:
+            result, reason = "1/2-1/2", "fifty moves"
+        elif gs.isRepetition(2):
+            result, reason = "1/2-1/2", "threefold repetition"
+        elif gs.pieceCount <= 3 and insufficientMaterial(gs.board):
+            result, reason = "1/2-1/2", "insufficient material"
+        elif len(sanMoves) >= _maxPlies:
+            result, reason = "1/2-1/2", "move limit"
+        if result is not None:
+            break
+        side = 0 if gs.whiteToMove else 1
+        config, table = engines[side]
+        _useEngine(gs, config, table)
+        info = SmartMoveFinder.findBestMoveMinMax(
+            gs,
+            validMoves,
+            None,
+            config.maxDepth,
+            config.timeLimit,
+            config.nodeLimit,
+            verbose=False,
+        )
+        move = info.bestMove
+        if move is None:
+            move = SmartMoveFinder.findRandomMoves(validMoves)
+        stats[side]["moves"] += 1
+        stats[side]["nodes"] += info.nodes
+        stats[side]["depth"] += info.depth
+        stats[side]["seconds"] += info.elapsed()
+        sanMoves.append(moveToSAN(gs, move, validMoves))
+        gs.makeMove(move)
+        validMoves = gs.getValidMoves()
+    return {
+        "game": number,
+        "fen": fen,
+        "white": engines[0][0].name,
+        "black": engines[1][0].name,
+        "whiteEngine": whiteEngine,
+        "result": result,
+        "reason": reason,
+        "plies": len(sanMoves),
+        "moves": sanMoves,
+        "seconds": time.perf_counter() - start,
+        "stats": {"white": stats[0], "black": stats[1]},
+    }
+
+
+""" a game as PGN text, from what playGame() returns """
+
+
+def gameToPGN(game, engines, event="SelfPlay"):
+    headers = {
+        "Event": event,
+        "Date": time.strftime("%Y.%m.%d"),
+        "Round": str(game["game"] + 1),
+        "White": str(engines[game["whiteEngine"]]),
+        "Black": str(engines[1 - game["whiteEngine"]]),
+    }
+    if game["fen"] != STARTING_FEN:
+        headers["SetUp"] = "1"
+        headers["FEN"] = game["fen"]
+    headers["PlyCount"] = str(game["plies"])
+    return formatGame(headers, game["moves"], game["result"], game["reason"])
+
+
+"""
+the Elo difference of a score (wins + draws / 2 out of games) and the
+margin of its 95% confidence interval, from the spread of the game results
+"""
+
+
+def eloDifference(wins, draws, losses):
+    games = wins + draws + losses
+    if games == 0:
+        return 0.0, 0.0
+    score = (wins + draws / 2) / games
+    if score <= 0 or score >= 1:
+        return (math.inf if score >= 1 else -math.inf), math.inf
+    variance = (
+        wins * (1 - score) ** 2 + draws * (0.5 - score) ** 2 + losses * score**2
+    )
+    margin = 1.96 * math.sqrt(variance / games) / math.sqrt(games)
+
+    def elo(p):
+        p = min(max(p, 1e-9), 1 - 1e-9)
+        return -400 * math.log10(1 / p - 1)
+
+    return elo(score), (elo(score + margin) - elo(score - margin)) / 2
+
+
+"""
+play the match: the games are shared among the processes and the results are
+written as they come. It returns the (wins, draws, losses) of the first engine
+"""
+
+
+def runMatch(
+    engines,
+    games,
+    openings=None,
+    processes=None,
+    pgnPath=None,
+    resultsPath=None,
+    useBitboards=True,
+    maxPlies=MAX_PLIES,
+):
+    openings = openings or [STARTING_FEN]
+    # each opening twice, with the colors swapped
+    jobs = [(i, openings[i // 2 % len(openings)], i % 2) for i in range(games)]
+    pgnFile = open(pgnPath, "w") if pgnPath else None
+    resultsFile = open(resultsPath, "w") if resultsPath else None
+    wins = draws = losses = 0
+    start = time.perf_counter()
+    try:
+        with multiprocessing.Pool(
+            processes, _initWorker, (engines, useBitboards, maxPlies)
+        ) as pool:
+            for done, game in enumerate(pool.imap_unordered(playGame, jobs), 1):
+                if game["result"] == "1/2-1/2":
+                    draws += 1
+                elif (game["result"] == "1-0") == (game["whiteEngine"] == 0):
+                    wins += 1
+                else:
+                    losses += 1
+                if resultsFile:
+                    resultsFile.write(json.dumps(game) + "\n")
+                    resultsFile.flush()
+                if pgnFile:
+                    pgnFile.write(gameToPGN(game, engines))
+                    pgnFile.flush()
+                elapsed = time.perf_counter() - start
+                print(
+                    "game %d/%d: %s - %s %s (%s, %d plies, %.1fs)  %s %d-%d-%d  %.0f games/hour"
+                    % (
+                        done,
+                        games,
+                        game["white"],
+                        game["black"],
+                        game["result"],
+                        game["reason"],
+                        game["plies"],
+                        game["seconds"],
+                        engines[0].name,
+                        wins,
+                        draws,
+                        losses,
+                        3600 * done / elapsed,
+                    ),
+                    flush=True,
+                )
+    finally:
+        if pgnFile:
+            pgnFile.close()
+        if resultsFile:
+            resultsFile.close()
+    return wins, draws, losses
+
+
+def main():
+    parser = argparse.ArgumentParser(description="engine against engine games")
+    parser.add_argument(
+        "-a", "--engine-a", default="", help='the first engine, like "depth=4,name=new"'
+    )
+    parser.add_argument("-b", "--engine-b", default="", help="the second engine")
+    parser.add_argument("--games", type=int, default=20)
+    parser.add_argument("--openings", help="a file with one FEN per line")
+    parser.add_argument(
+        "--processes", type=int, default=0, help="0 for one per cpu (the default)"
+    )
+    parser.add_argument("--pgn", help="write the games here as PGN")
+    parser.add_argument("--results", help="write the games here as JSON lines")
+    parser.add_argument("--max-plies", type=int, default=MAX_PLIES)
+    parser.add_argument(
+        "--no-bitboards", action="store_true", help="use the 8x8 list move generation"
+    )
+    args = parser.parse_args()
+    engines = [
+        EngineConfig.parse(args.engine_a, "A"),
+        EngineConfig.parse(args.engine_b, "B"),
+    ]
+    if engines[0].name == engines[1].name:
+        engines[1].name += "2"
+    print("%s against %s" % tuple(engines))
+    start = time.perf_counter()
+    wins, draws, losses = runMatch(
+        engines,
+        args.games,
+        readOpenings(args.openings),
+        args.processes or None,
+        args.pgn,
+        args.results,
+        not args.no_bitboards,
+        args.max_plies,
+    )
+    elapsed = time.perf_counter() - start
+    difference, margin = eloDifference(wins, draws, losses)
+    games = wins + draws + losses
+    print(
+        "%s: +%d =%d -%d, %.1f%%, Elo %+.0f +- %.0f, %d games in %.0fs, %.0f games/hour"
+        % (
+            engines[0].name,
+            wins,
+            draws,
+            losses,
+            100 * (wins + draws / 2) / max(games, 1),
+            difference,
+            margin,
+            games,
+            elapsed,
+            3600 * games / elapsed if elapsed > 0 else 0,
+        )
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
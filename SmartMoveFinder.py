@@ -1,92 +1,115 @@
+import multiprocessing
+import os
 import random
+import time
+from multiprocessing import shared_memory
 
-# assign the king any value which means you can't really lose
-# your king as it would be a checkmate before that happened
-pieceScore = {"K": 0, "Q": 10, "R": 5, "B": 3, "N": 3, "p": 1}
-
-# this is just a way to give some squares some prefrence than other when moving the each piece
-knightScores = [
-    [1, 1, 1, 1, 1, 1, 1, 1],
-    [1, 2, 2, 2, 2, 2, 2, 1],
-    [1, 2, 3, 3, 3, 3, 2, 1],
-    [1, 2, 3, 4, 4, 3, 2, 1],
-    [1, 2, 3, 4, 4, 3, 2, 1],
-    [1, 2, 3, 3, 3, 3, 2, 1],
-    [1, 2, 2, 2, 2, 2, 2, 1],
-    [1, 1, 1, 1, 1, 1, 1, 1],
-]
-
-bishopScores = [
-    [4, 3, 2, 1, 1, 2, 3, 4],
-    [3, 4, 3, 2, 2, 3, 4, 3],
-    [2, 3, 4, 3, 3, 4, 3, 2],
-    [1, 2, 3, 4, 4, 3, 2, 1],
-    [1, 2, 3, 4, 4, 3, 2, 1],
-    [2, 3, 4, 3, 3, 4, 3, 2],
-    [3, 4, 3, 2, 2, 3, 4, 3],
-    [4, 3, 2, 1, 1, 2, 3, 4],
-]
-
-queenScores = [
-    [1, 1, 1, 3, 1, 1, 1, 1],
-    [1, 2, 3, 3, 3, 1, 1, 1],
-    [1, 4, 3, 3, 3, 4, 2, 1],
-    [1, 2, 3, 3, 3, 2, 2, 1],
-    [1, 2, 3, 3, 3, 2, 2, 1],
-    [1, 4, 3, 3, 3, 4, 2, 1],
-    [1, 1, 2, 3, 3, 1, 1, 1],
-    [1, 1, 1, 3, 1, 1, 1, 1],
-]
-
-rockScores = [
-    [4, 3, 4, 4, 4, 4, 3, 4],
-    [4, 4, 4, 4, 4, 4, 4, 4],
-    [1, 1, 2, 3, 3, 2, 1, 1],
-    [1, 2, 3, 4, 4, 3, 2, 1],
-    [1, 2, 3, 4, 4, 3, 2, 1],
-    [1, 1, 2, 3, 3, 2, 1, 1],
-    [4, 4, 4, 4, 4, 4, 4, 4],
-    [4, 3, 4, 4, 4, 4, 3, 4],
-]
-
-whitePawnScores = [
-    [8, 8, 8, 8, 8, 8, 8, 8],
-    [8, 8, 8, 8, 8, 8, 8, 8],
-    [5, 6, 6, 7, 7, 6, 6, 5],
-    [2, 3, 3, 5, 5, 3, 3, 2],
-    [1, 2, 3, 4, 4, 3, 2, 1],
-    [1, 1, 2, 3, 3, 2, 1, 1],
-    [1, 1, 1, 0, 0, 1, 1, 1],
-    [0, 0, 0, 0, 0, 0, 0, 0],
-]
-
-blackPawnScores = [
-    [0, 0, 0, 0, 0, 0, 0, 0],
-    [1, 1, 1, 0, 0, 1, 1, 1],
-    [1, 1, 2, 3, 3, 2, 1, 1],
-    [1, 2, 3, 4, 4, 3, 2, 1],
-    [2, 3, 3, 5, 5, 3, 3, 2],
-    [5, 6, 6, 7, 7, 6, 6, 5],
-    [8, 8, 8, 8, 8, 8, 8, 8],
-    [8, 8, 8, 8, 8, 8, 8, 8],
-]
-
-# map eaching of the pieces to the appropriate 2d array
-piecePositionScores = {
-    "N": knightScores,
-    "B": bishopScores,
-    "Q": queenScores,
-    "R": rockScores,
-    "bp": blackPawnScores,
-    "wp": whitePawnScores,
-}
+import Zobrist
+from ChessEngine import GameState
+from EvaluationCache import EvaluationCache
+from MoveOrdering import MoveOrderer, MAX_PLY
+from OpeningBook import OpeningBook, defaultRandoms, loadRandoms
+from PositionIndex import PositionIndex
+from SearchStats import SearchStats
+from Tablebase import Tablebases, DRAW, describe
+from TranspositionTable import TranspositionTable, EXACT, LOWER, UPPER, bufferSize
+
+# the piece values and the piece-square tables live in Evaluation, as the
+# GameState keeps their totals up to date on every move
+from Evaluation import (
+    pieceScore,
+    knightScores,
+    bishopScores,
+    queenScores,
+    rockScores,
+    whitePawnScores,
+    blackPawnScores,
+    piecePositionScores,
+    SCORE_UNITS,
+    evaluateBoard,
+    evaluatePawns,
+)
 
 CHECKMATE = 1000
 STALEMATE = 0
+# the scores above this are mates: CHECKMATE minus the plies from the root to the
+# checkmate, whether the search saw it or the tablebases know it, so the sooner the better
+MATE_SCORE = CHECKMATE - 300
 # represents how many moves the computer should look ahead
-# before deciding on its best move
+# before deciding on its best move, the iterative deepening stops there
+# even if it still has time left
 MAX_DEPTH = 3
-nextMove = None
+# how many nodes are searched between two looks at the clock
+NODES_BETWEEN_CHECKS = 256
+# how much memory the transposition table can take, in megabytes
+TT_SIZE_MB = 16
+transpositionTable = TranspositionTable(TT_SIZE_MB)
+# the selective search: moves that are searched less deep than the others.
+# Null move pruning: give the opponent a free move, and if a shallower search
+# still fails high then the position is so good that it isn't searched at all
+USE_NULL_MOVE = True
+NULL_MOVE_REDUCTION = 2
+NULL_MOVE_MIN_DEPTH = 3  # the depth left it needs
+# late move reductions: the quiet moves late in the ordering rarely turn out to be
+# the best, so they're searched one ply shallower first, and again at the full
+# depth only when that search says they might be better than alpha
+USE_LMR = True
+LMR_REDUCTION = 1
+LMR_MIN_MOVES = 3  # the first moves are always searched to the full depth
+LMR_MIN_DEPTH = 2  # not more than NULL_MOVE_MIN_DEPTH
+# the window of the null window searches, smaller than the smallest step of the scores
+NULL_WINDOW = 0.01
+# principal variation search: only the first move of a node gets the whole
+# (alpha, beta) window, the others are searched with a null window around alpha
+# to prove they're worse, and again with the whole window when they aren't
+USE_PVS = True
+# aspiration windows: every iteration after the first starts with a window this
+# wide (in pawns) on both sides of the score of the last one, and it's widened
+# and searched again when the score falls outside of it
+USE_ASPIRATION = True
+ASPIRATION_WINDOW = 0.5
+# the caches of the evaluation, see EvaluationCache.py: the scores of the
+# positions by their zobrist key and the pawn structures by their pawn key
+USE_EVALUATION_CACHE = True
+EVALUATION_CACHE_ENTRIES = 1 << 16
+evaluationCache = EvaluationCache(EVALUATION_CACHE_ENTRIES)
+# score the doubled, isolated and passed pawns, see Evaluation.evaluatePawns()
+USE_PAWN_STRUCTURE = True
+PAWN_HASH_ENTRIES = 1 << 14
+pawnHashTable = EvaluationCache(PAWN_HASH_ENTRIES)
+# how many processes the parallel search uses, None for one per cpu
+SEARCH_WORKERS = None
+# the table of each worker of the deterministic search, it's cleared before every
+# root move, so it's kept small: a root move is a small search
+ROOT_SPLIT_TT_SIZE_MB = 1
+# recompute the score from the whole board at every leaf and compare it with
+# the incremental one, it's slow so it's only for debugging
+DEBUG_EVALUATION = False
+# play the moves of the opening book while the game is in it, see OpeningBook.py
+USE_OPENING_BOOK = True
+OPENING_BOOK_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "book.bin")
+# a file with another Random64 table for the book keys, None for the Polyglot one
+OPENING_BOOK_RANDOMS = None
+# opened the first time it's needed
+openingBook = None
+# the endgame tables, see Tablebase.py, they're also looked up inside the search
+USE_TABLEBASES = True
+TABLEBASES_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "tablebases.bin"
+)
+tablebases = None
+# the most pieces a position of the tables has, 0 while there are no tables
+tablebasePieces = 0
+# try the root moves that did best in a game collection first, see PositionIndex.py
+USE_POSITION_INDEX = True
+POSITION_INDEX_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "positions.idx"
+)
+positionIndex = None
+# collect a SearchStats for every search, see SearchStats.py, it's cheap but not free
+COLLECT_SEARCH_STATS = False
+# the file the stats of every search are added to as a line of JSON, None for none
+SEARCH_STATS_PATH = None
 
 
 """
@@ -99,20 +122,610 @@ def findRandomMoves(validMoves):
     return validMoves[random.randint(0, len(validMoves) - 1)]
 
 
+""" a move of the opening book for the position, or None if there's no book or no move for it """
+
+
+def findBookMove(gs, validMoves):
+    global openingBook
+    if not USE_OPENING_BOOK:
+        return None
+    if openingBook is None:
+        if not os.path.exists(OPENING_BOOK_PATH):
+            return None
+        randoms = defaultRandoms
+        if OPENING_BOOK_RANDOMS is not None:
+            randoms = loadRandoms(OPENING_BOOK_RANDOMS)
+        openingBook = OpeningBook(OPENING_BOOK_PATH, randoms)
+    return openingBook.pickMove(gs, validMoves)
+
+
+""" the move ordering hints of the position index for the root moves, empty without an index """
+
+
+def findPositionHints(gs, validMoves):
+    global positionIndex
+    if not USE_POSITION_INDEX:
+        return {}
+    if positionIndex is None:
+        if not os.path.exists(POSITION_INDEX_PATH):
+            return {}
+        positionIndex = PositionIndex(POSITION_INDEX_PATH)
+    return positionIndex.hints(gs, validMoves)
+
+
+"""
+open the tablebases the first time, if there's a file for them, it's called
+before every search so USE_TABLEBASES can be changed between two searches
+"""
+
+
+def openTablebases():
+    global tablebases, tablebasePieces
+    if tablebases is None and USE_TABLEBASES and os.path.exists(TABLEBASES_PATH):
+        tablebases = Tablebases(TABLEBASES_PATH)
+    if USE_TABLEBASES and tablebases is not None:
+        tablebasePieces = tablebases.maxPieces
+    else:
+        tablebasePieces = 0
+
+
+""" the (move, value) the tablebases have for the position, or None if it isn't in them """
+
+
+def findTablebaseMove(gs, validMoves):
+    openTablebases()
+    if gs.pieceCount > tablebasePieces:
+        return None
+    return tablebases.bestMove(gs, validMoves)
+
+
+"""
+the score of a tablebase value for the side to move, ply plies from the
+root: like a mate the search found, CHECKMATE minus the plies from the root
+to the checkmate, as the value is a mate in value - 1 plies
+"""
+
+
+def tablebaseScore(value, ply):
+    if value == DRAW:
+        return STALEMATE
+    score = CHECKMATE - ply - (value - 1)
+    return score if value % 2 == 0 else -score
+
+
+"""
+the mate scores count the plies from the root, but the same position can be
+reached at another ply, so the transposition table keeps them counted from
+the position itself: scoreToTable() before storing, scoreFromTable() after probing
+"""
+
+
+def scoreToTable(score, ply):
+    if score >= MATE_SCORE:
+        return score + ply
+    if score <= -MATE_SCORE:
+        return score - ply
+    return score
+
+
+def scoreFromTable(score, ply):
+    if score >= MATE_SCORE:
+        return score - ply
+    if score <= -MATE_SCORE:
+        return score + ply
+    return score
+
+
+"""
+the budget of one search and what it has found so far, the search reads the
+limits from here and the caller gets it back as the result
+"""
+
+
+class SearchInfo:
+    def __init__(
+        self, maxDepth=MAX_DEPTH, timeLimit=None, nodeLimit=None, stopEvent=None
+    ):
+        self.maxDepth = maxDepth
+        self.timeLimit = timeLimit  # in seconds, None for no limit
+        self.nodeLimit = nodeLimit  # None for no limit
+        # a multiprocessing.Event (or anything with is_set()) another process can
+        # set to ask the search to stop, it's looked at with the clock
+        self.stopEvent = stopEvent
+        self.startTime = time.perf_counter()
+        self.deadline = None if timeLimit is None else self.startTime + timeLimit
+        self.nodes = 0
+        # the part of the nodes that were in the quiescence search
+        self.quiescenceNodes = 0
+        # the depth of the iteration that is running now
+        self.rootDepth = 0
+        # the result of the deepest iteration that was completed
+        self.depth = 0
+        self.bestMove = None
+        self.bestScore = 0
+        # set when the budget ran out in the middle of an iteration
+        self.stopped = False
+        # the killer moves and the history table live as long as the search
+        self.ordering = MoveOrderer()
+        # the length of the move log at the root, to know the ply of a node
+        self.rootPly = 0
+        # print the root moves as they get better and the result at the end
+        self.verbose = True
+        # the nodes searched by each process in a parallel search, None otherwise
+        self.workerNodes = None
+        # the SearchStats when they're collected, None otherwise
+        self.stats = None
+        # the static evaluation the search calls, the stats swap it for a timed one
+        self.evaluate = scoreBoard
+        # the line the search expects from the root, with bestMove first
+        self.pv = []
+        # the triangular PV table: the best line found so far from the node at each ply
+        self.pvTable = [[] for _ in range(MAX_PLY + 1)]
+
+    def elapsed(self):
+        return time.perf_counter() - self.startTime
+
+    """
+    stop the search by raising SearchAborted when the time or the nodes are used up,
+    or when we were asked to stop
+    """
+
+    def checkBudget(self):
+        if (
+            (self.nodeLimit is not None and self.nodes >= self.nodeLimit)
+            or (self.deadline is not None and time.perf_counter() >= self.deadline)
+            or (self.stopEvent is not None and self.stopEvent.is_set())
+        ):
+            self.stopped = True
+            raise SearchAborted()
+
+    def __str__(self):
+        elapsed = self.elapsed()
+        workers = ""
+        if self.workerNodes is not None:
+            workers = ", worker nodes %s" % self.workerNodes
+        return (
+            "depth %d, nodes %d, time %.2fs, %d nodes/s, first move cutoffs %.0f%%, best %s (%s), pv %s%s"
+            % (
+                self.depth,
+                self.nodes,
+                elapsed,
+                self.nodes / elapsed if elapsed > 0 else 0,
+                100 * self.ordering.firstMoveCutoffRate(),
+                self.bestMove,
+                self.bestScore,
+                " ".join(str(move) for move in self.pv),
+                workers,
+            )
+        )
+
+
+class SearchAborted(Exception):
+    pass
+
+
+"""
+this is a helper method to make the first calls for the actual algorithm.
+It searches one ply deeper at a time (iterative deepening) until maxDepth or
+until the time or the node budget is used up, so it always holds the move of
+the last iteration that was completed. The first iteration is always finished,
+so there's a move even with a tiny budget. A move of the opening book (unless
+useBook is False) or of the tablebases is played without searching at all
+(depth 0). onIteration, if given, is called with the SearchInfo after every
+depth that was completed. With collectStats (COLLECT_SEARCH_STATS unless it's
+given) info.stats has the SearchStats of the search. It returns the SearchInfo.
+"""
+
+
+def findBestMoveMinMax(
+    gs,
+    validMoves,
+    returnQueue=None,
+    maxDepth=MAX_DEPTH,
+    timeLimit=None,
+    nodeLimit=None,
+    stopEvent=None,
+    verbose=True,
+    useBook=True,
+    onIteration=None,
+    collectStats=None,
+):
+    info = SearchInfo(maxDepth, timeLimit, nodeLimit, stopEvent)
+    info.verbose = verbose
+    # the opening book and the tablebases know the move without a search
+    bookMove = findBookMove(gs, validMoves) if useBook else None
+    found = None if bookMove is not None else findTablebaseMove(gs, validMoves)
+    if bookMove is not None or found is not None:
+        if bookMove is not None:
+            info.bestMove = bookMove
+            message = "book move %s" % bookMove
+        else:
+            info.bestMove, value = found
+            info.bestScore = tablebaseScore(value, 0)
+            message = "tablebase move %s, %s" % (info.bestMove, describe(value))
+        info.pv = [info.bestMove]
+        if verbose:
+            print(message)
+        if returnQueue is not None:
+            returnQueue.put(info.bestMove)
+        return info
+    transpositionTable.newSearch()
+    info.rootPly = len(gs.moveLog)
+    validMoves = list(validMoves)
+    info.ordering.rootHints = findPositionHints(gs, validMoves)
+    if collectStats is None:
+        collectStats = COLLECT_SEARCH_STATS
+    if collectStats:
+        info.stats = SearchStats()
+        caches = {"evalCache": evaluationCache, "pawnHash": pawnHashTable}
+        with info.stats.instrument(gs, transpositionTable, info, caches):
+            _iterativeDeepening(gs, validMoves, info, onIteration)
+        info.stats.finish(info, transpositionTable, caches)
+        if SEARCH_STATS_PATH is not None:
+            info.stats.dump(SEARCH_STATS_PATH)
+    else:
+        _iterativeDeepening(gs, validMoves, info, onIteration)
+    if verbose:
+        print(info)
+        if info.stats is not None:
+            print(info.stats)
+    if returnQueue is not None:
+        returnQueue.put(info.bestMove)
+    return info
+
+
+""" the iterations of findBestMoveMinMax(), one ply deeper each, it fills info as it goes """
+
+
+def _iterativeDeepening(gs, validMoves, info, onIteration):
+    rootPly = info.rootPly
+    turnMultiplier = 1 if gs.whiteToMove else -1
+    if len(validMoves) == 0:
+        return
+    for depth in range(1, info.maxDepth + 1):
+        info.rootDepth = depth
+        try:
+            score = _aspirationSearch(gs, validMoves, depth, turnMultiplier, info)
+        except SearchAborted:
+            # take back the moves of the unfinished iteration
+            while len(gs.moveLog) > rootPly:
+                if gs.moveLog[-1] is None:
+                    gs.undoNullMove()
+                else:
+                    gs.undoMove()
+            break
+        # no move beats -CHECKMATE when every one of them gets mated, but
+        # we still have to play one
+        info.pv = info.pvTable[0] or [validMoves[0]]
+        info.depth = depth
+        info.bestMove = info.pv[0]
+        info.bestScore = score
+        if onIteration is not None:
+            onIteration(info)
+        if abs(score) >= MATE_SCORE:
+            break  # a forced mate was found
+
+
+"""
+one iteration of the root search: with USE_ASPIRATION it starts with a small
+window around the score of the last iteration, and each time the score falls
+outside of it that side is pushed twice as far and the root searched again
+"""
+
+
+def _aspirationSearch(gs, validMoves, depth, turnMultiplier, info):
+    if not USE_ASPIRATION or depth == 1 or abs(info.bestScore) >= MATE_SCORE:
+        return findMoveNegaMaxAlphaBeta(
+            gs, validMoves, depth, -CHECKMATE, CHECKMATE, turnMultiplier, info
+        )
+    delta = ASPIRATION_WINDOW
+    alpha = max(info.bestScore - delta, -CHECKMATE)
+    beta = min(info.bestScore + delta, CHECKMATE)
+    while True:
+        score = findMoveNegaMaxAlphaBeta(
+            gs, validMoves, depth, alpha, beta, turnMultiplier, info
+        )
+        delta *= 2
+        if score <= alpha and alpha > -CHECKMATE:
+            alpha = max(score - delta, -CHECKMATE)
+        elif score >= beta and beta < CHECKMATE:
+            beta = min(score + delta, CHECKMATE)
+        else:
+            return score
+
+
 """
-this is a helper method to make the first calls
-for the actual algorithm
+the parallel search, spread over a number of processes as the python threads
+can't search at the same time. There are two ways to split the work:
+ 1. deterministic: at every depth the best move of the last depth is searched
+    first, then the other root moves are shared among the workers and each
+    one is searched by itself with the score of the first move as its alpha,
+    starting from an empty transposition table. A move only takes over if it
+    beats that score (the first of the equal ones wins), so the move only
+    depends on the position and maxDepth, and the time and the node limits
+    (and stopEvent) aren't used
+ 2. otherwise Lazy SMP: every worker runs the whole iterative deepening on the
+    same position, and they all share one transposition table in shared memory,
+    so what one of them finds cuts the searches of the others short. The helpers
+    try the root moves in different orders so they don't all walk the same tree.
+    This process is the first worker and its move is the one played, unless a
+    helper got one iteration deeper. When stopEvent is set they all stop
+workers is SEARCH_WORKERS unless it's given. Like findBestMoveMinMax(),
+onIteration is called with the SearchInfo after every depth and verbose prints
+the result. It returns the SearchInfo, with the nodes of each worker in workerNodes
 """
 
 
-def findBestMoveMinMax(gs, validMoves, returnQueue):
-    global nextMove
-    nextMove = None
-    findMoveNegaMaxAlphaBeta(
-        gs, validMoves, MAX_DEPTH, -CHECKMATE, CHECKMATE, 1 if gs.whiteToMove else -1
+def findBestMoveParallel(
+    gs,
+    validMoves,
+    returnQueue=None,
+    maxDepth=MAX_DEPTH,
+    timeLimit=None,
+    nodeLimit=None,
+    workers=None,
+    deterministic=False,
+    stopEvent=None,
+    verbose=True,
+    onIteration=None,
+):
+    if workers is None:
+        workers = SEARCH_WORKERS
+    workers = workers or os.cpu_count() or 1
+    validMoves = list(validMoves)
+    # the book picks its moves at random, so the deterministic search doesn't use it
+    bookMove = None if deterministic else findBookMove(gs, validMoves)
+    found = None if bookMove is not None else findTablebaseMove(gs, validMoves)
+    if bookMove is not None:
+        info = SearchInfo(maxDepth, timeLimit, nodeLimit)
+        info.bestMove = bookMove
+        info.pv = [bookMove]
+    elif found is not None:
+        info = SearchInfo(maxDepth, timeLimit, nodeLimit)
+        info.bestMove, value = found
+        info.bestScore = tablebaseScore(value, 0)
+        info.pv = [info.bestMove]
+    elif deterministic:
+        info = _rootSplitSearch(gs, validMoves, maxDepth, workers, onIteration)
+    else:
+        info = _lazySMPSearch(
+            gs,
+            validMoves,
+            maxDepth,
+            timeLimit,
+            nodeLimit,
+            workers,
+            stopEvent,
+            onIteration,
+        )
+    if verbose:
+        print(info)
+    if returnQueue is not None:
+        returnQueue.put(info.bestMove)
+    return info
+
+
+def _rootSplitSearch(gs, validMoves, maxDepth, workers, onIteration=None):
+    info = SearchInfo(maxDepth)
+    if len(validMoves) == 0:
+        return info
+    nodesByWorker = {}
+
+    def collect(result):
+        score, line, nodes, worker, cutoffs, firstMoveCutoffs = result
+        info.nodes += nodes
+        nodesByWorker[worker] = nodesByWorker.get(worker, 0) + nodes
+        info.ordering.cutoffs += cutoffs
+        info.ordering.firstMoveCutoffs += firstMoveCutoffs
+        return score, line
+
+    with multiprocessing.Pool(workers, _initWorker, _workerPosition(gs)) as pool:
+        for depth in range(1, maxDepth + 1):
+            # the best move of the last depth goes first and sets the bar
+            if info.bestMove is not None:
+                validMoves.remove(info.bestMove)
+                validMoves.insert(0, info.bestMove)
+            first = (validMoves[0].moveID, depth, -CHECKMATE, CHECKMATE)
+            alpha, line = collect(pool.apply(_searchRootMove, (first,)))
+            jobs = [(move.moveID, depth, alpha, CHECKMATE) for move in validMoves[1:]]
+            scores, lines = [alpha], [line]
+            for result in pool.map(_searchRootMove, jobs, chunksize=1):
+                score, line = collect(result)
+                scores.append(score)
+                lines.append(line)
+            # the ones that didn't beat alpha only have an upper bound as their
+            # score, but they can't be the best anyway
+            best = 0
+            for i in range(1, len(scores)):
+                if scores[i] > scores[best]:
+                    best = i
+            info.depth = depth
+            info.bestMove = validMoves[best]
+            info.bestScore = scores[best]
+            info.pv = [info.bestMove] + lines[best]
+            if onIteration is not None:
+                onIteration(info)
+            if abs(info.bestScore) >= MATE_SCORE:
+                break
+    info.workerNodes = [nodesByWorker[worker] for worker in sorted(nodesByWorker)]
+    return info
+
+
+def _lazySMPSearch(
+    gs,
+    validMoves,
+    maxDepth,
+    timeLimit,
+    nodeLimit,
+    workers,
+    stopEvent=None,
+    onIteration=None,
+):
+    global transpositionTable
+    if workers == 1 or len(validMoves) == 0:
+        info = findBestMoveMinMax(
+            gs,
+            validMoves,
+            None,
+            maxDepth,
+            timeLimit,
+            nodeLimit,
+            stopEvent,
+            verbose=False,
+            useBook=False,
+            onIteration=onIteration,
+        )
+        info.workerNodes = [info.nodes]
+        return info
+    memory = shared_memory.SharedMemory(create=True, size=bufferSize(TT_SIZE_MB))
+    sharedTable = TranspositionTable(TT_SIZE_MB, memory.buf)
+    helpersStop = multiprocessing.Event()
+    ownTable = transpositionTable
+    try:
+        initArgs = _workerPosition(gs) + (memory.name, helpersStop)
+        with multiprocessing.Pool(workers - 1, _initWorker, initArgs) as pool:
+            helpers = [
+                pool.apply_async(_lazySMPHelper, (i, maxDepth, timeLimit, nodeLimit))
+                for i in range(1, workers)
+            ]
+            transpositionTable = sharedTable
+            try:
+                info = findBestMoveMinMax(
+                    gs,
+                    validMoves,
+                    None,
+                    maxDepth,
+                    timeLimit,
+                    nodeLimit,
+                    stopEvent,
+                    verbose=False,
+                    useBook=False,
+                    onIteration=onIteration,
+                )
+            finally:
+                transpositionTable = ownTable
+                helpersStop.set()  # we're done, so are the helpers
+            results = [helper.get() for helper in helpers]
+    finally:
+        sharedTable.release()
+        memory.close()
+        memory.unlink()
+    info.workerNodes = [info.nodes]
+    for depth, moveID, score, nodes in results:
+        info.nodes += nodes
+        info.workerNodes.append(nodes)
+        if depth > info.depth:
+            for move in validMoves:
+                if move.moveID == moveID:
+                    info.depth, info.bestMove, info.bestScore = depth, move, score
+                    info.pv = [move]
+    return info
+
+
+"""
+what a worker needs to set up the position of gs: the packed position, the
+options, and the halfmove clock with the keys of the positions since the last
+capture or pawn move, to find the repetitions
+"""
+
+
+def _workerPosition(gs):
+    history = gs.keyHistory[max(0, len(gs.keyHistory) - gs.halfmoveClock) :]
+    return (
+        gs.pack(),
+        gs.bitboards is not None,
+        gs.underpromotions,
+        (gs.halfmoveClock, history),
     )
-    returnQueue.put(nextMove)
-    print(returnQueue.get())
+
+
+"""
+the state of a worker process of the parallel search: its own copy of the
+position, and for Lazy SMP the shared transposition table and the stop event
+"""
+_workerGameState = None
+_workerMemory = None
+_workerStopEvent = None
+
+
+def _initWorker(
+    position, useBitboards, underpromotions, history, memoryName=None, stopEvent=None
+):
+    global _workerGameState, _workerMemory, _workerStopEvent, transpositionTable
+    _workerGameState = GameState.unpack(position, useBitboards, underpromotions)
+    _workerGameState.halfmoveClock, _workerGameState.keyHistory = history
+    _workerStopEvent = stopEvent
+    openTablebases()
+    if memoryName is not None:
+        _workerMemory = shared_memory.SharedMemory(name=memoryName)
+        transpositionTable = TranspositionTable(TT_SIZE_MB, _workerMemory.buf)
+    else:
+        transpositionTable = TranspositionTable(ROOT_SPLIT_TT_SIZE_MB)
+
+
+"""
+the score of one root move searched depth plies deep with the (alpha, beta) window,
+and the best line after it, for the deterministic search
+"""
+
+
+def _searchRootMove(job):
+    moveID, depth, alpha, beta = job
+    gs = _workerGameState
+    # nothing from the root moves this worker searched before, so the score
+    # doesn't depend on which worker got which move. The table of the worker
+    # is a small one, so clearing it costs next to nothing
+    transpositionTable.clear()
+    info = SearchInfo(depth)
+    info.rootDepth = depth
+    info.rootPly = len(gs.moveLog)
+    turnMultiplier = 1 if gs.whiteToMove else -1
+    for move in gs.getValidMoves():
+        if move.moveID == moveID:
+            gs.makeMove(move)
+            break
+    score = -findMoveNegaMaxAlphaBeta(
+        gs,
+        gs.getValidMoves(),
+        depth - 1,
+        -beta,
+        -alpha,
+        -turnMultiplier,
+        info,
+    )
+    gs.undoMove()
+    ordering = info.ordering
+    return (
+        score,
+        info.pvTable[1],
+        info.nodes,
+        os.getpid(),
+        ordering.cutoffs,
+        ordering.firstMoveCutoffs,
+    )
+
+
+""" one Lazy SMP helper: the whole search, with the root moves shuffled its own way """
+
+
+def _lazySMPHelper(index, maxDepth, timeLimit, nodeLimit):
+    gs = _workerGameState
+    moves = gs.getValidMoves()
+    random.Random(index).shuffle(moves)
+    info = findBestMoveMinMax(
+        gs,
+        moves,
+        None,
+        maxDepth,
+        timeLimit,
+        nodeLimit,
+        stopEvent=_workerStopEvent,
+        verbose=False,
+        useBook=False,
+        collectStats=False,
+    )
+    moveID = -1 if info.bestMove is None else info.bestMove.moveID
+    return info.depth, moveID, info.bestScore, info.nodes
 
 
 """
@@ -120,29 +733,207 @@ implementing the nega-max algorithm
 """
 
 
-def findMoveNegaMaxAlphaBeta(gs, validMoves, depth, alpha, beta, turnMultiplier):
-    global nextMove
+def findMoveNegaMaxAlphaBeta(gs, validMoves, depth, alpha, beta, turnMultiplier, info):
+    info.nodes += 1
+    # the first iteration always runs to the end, so we have at least one move
+    if info.nodes % NODES_BETWEEN_CHECKS == 0 and info.rootDepth > 1:
+        info.checkBudget()
+    ply = len(gs.moveLog) - info.rootPly
+    # the line from here is empty until a move beats alpha, whatever returns early
+    pvTable = info.pvTable
+    pvTable[ply] = []
+    # no moves left means a checkmate or a stalemate, and the later the mate the better
+    if len(validMoves) == 0:
+        return -(CHECKMATE - ply) if gs.inCheck() else STALEMATE
+    # a position that was already there, or fifty moves without a capture or a
+    # pawn move, is a draw, so there's no need to search it again
+    if ply > 0 and (gs.halfmoveClock >= 100 or gs.isRepetition()):
+        return STALEMATE
+    # the tablebases have the exact score of the few-piece endings
+    if gs.pieceCount <= tablebasePieces and ply > 0:
+        value = tablebases.probe(gs)
+        if value is not None:
+            return tablebaseScore(value, ply)
     if depth == 0:
-        return turnMultiplier * scoreBoard(gs)
-    # move ordering - could improve the algorithm a little bit
-    # random.shuffle(validMoves)
+        # don't stop in the middle of an exchange, play the captures out first
+        return quiescenceSearch(gs, alpha, beta, turnMultiplier, info)
+    # if this position was already searched at least as deep (through another
+    # move order or in an earlier search) reuse that result instead, but not at
+    # the root as we still need to find the move to play there. Not on the
+    # principal variation either (the nodes with more than a null window, give or
+    # take the rounding of the floats): the table has the score but not the line
+    # after it, so the PV would stop there. Its hash move is still tried first
+    alphaOrig = alpha
+    pvNode = beta - alpha > 2 * NULL_WINDOW
+    hashMoveID = -1
+    entry = transpositionTable.probe(gs.zobristKey)
+    if depth == info.rootDepth:
+        # the best move of the last iteration is the first one to try in this one
+        if info.bestMove is not None:
+            hashMoveID = info.bestMove.moveID
+    elif entry is not None:
+        entryDepth, bound, entryScore, hashMoveID = entry
+        entryScore = scoreFromTable(entryScore, ply)
+        if entryDepth >= depth and not pvNode:
+            if bound == EXACT:
+                return entryScore
+            elif bound == LOWER:
+                alpha = max(alpha, entryScore)
+            else:
+                beta = min(beta, entryScore)
+            if alpha >= beta:
+                return entryScore
+    # the selective search needs some depth left, and nothing is cut short in check
+    selective = depth >= LMR_MIN_DEPTH and not gs.inCheck()
+    if (
+        USE_NULL_MOVE
+        and selective
+        and depth >= NULL_MOVE_MIN_DEPTH
+        and ply > 0
+        and gs.moveLog[-1] is not None  # never two null moves in a row
+        and abs(beta) < MATE_SCORE
+        and turnMultiplier * info.evaluate(gs) >= beta
+        and hasPieces(gs)
+    ):
+        gs.makeNullMove()
+        score = -findMoveNegaMaxAlphaBeta(
+            gs,
+            gs.getValidMoves(),
+            depth - 1 - NULL_MOVE_REDUCTION,
+            -beta,
+            -beta + NULL_WINDOW,
+            -turnMultiplier,
+            info,
+        )
+        gs.undoNullMove()
+        if score >= beta:
+            return beta
+    # move ordering: the more often the first move is the best, the more we prune
+    info.ordering.orderMoves(validMoves, ply, hashMoveID)
     maxScore = -CHECKMATE
-    for move in validMoves:
+    bestMoveID = -1
+    for i, move in enumerate(validMoves):
         gs.makeMove(move)
         nextMoves = gs.getValidMoves()
-        score = -findMoveNegaMaxAlphaBeta(
-            gs, nextMoves, depth - 1, -beta, -alpha, -turnMultiplier
-        )
+        reduction = 0
+        if (
+            USE_LMR
+            and selective
+            and ply > 0
+            and i >= LMR_MIN_MOVES
+            and not move.isCapture
+            and not move.isPawnPromotion
+            and not gs.inCheck()
+        ):
+            reduction = LMR_REDUCTION
+        fullWindow = True
+        if i > 0 and (USE_PVS or reduction):
+            # after the first move, a null window is enough to prove a move is no better
+            score = -findMoveNegaMaxAlphaBeta(
+                gs,
+                nextMoves,
+                depth - 1 - reduction,
+                -alpha - NULL_WINDOW,
+                -alpha,
+                -turnMultiplier,
+                info,
+            )
+            if score > alpha and reduction:  # not so late after all
+                score = -findMoveNegaMaxAlphaBeta(
+                    gs,
+                    nextMoves,
+                    depth - 1,
+                    -alpha - NULL_WINDOW,
+                    -alpha,
+                    -turnMultiplier,
+                    info,
+                )
+            # it is better, so it needs its real score
+            fullWindow = alpha < score < beta
+        if fullWindow:
+            score = -findMoveNegaMaxAlphaBeta(
+                gs, nextMoves, depth - 1, -beta, -alpha, -turnMultiplier, info
+            )
         if score > maxScore:
             maxScore = score
-            if depth == MAX_DEPTH:
-                nextMove = move
-                print(move, score)
+            bestMoveID = move.moveID
         gs.undoMove()
         if maxScore > alpha:  # where the prunning happens
             alpha = maxScore
+            # the new best line from here: this move and the best line after it
+            pvTable[ply] = [move] + pvTable[ply + 1]
+            if ply == 0 and info.verbose:
+                print(move, score)
         if alpha >= beta:
+            info.ordering.recordCutoff(move, ply, depth, i)
             break
+    # a score at or below the original alpha is only an upper bound of the real one,
+    # and when we cut off at beta it's only a lower bound
+    if maxScore <= alphaOrig:
+        bound = UPPER
+    elif maxScore >= beta:
+        bound = LOWER
+    else:
+        bound = EXACT
+    transpositionTable.store(
+        gs.zobristKey, depth, bound, scoreToTable(maxScore, ply), bestMoveID
+    )
+    return maxScore
+
+
+"""
+if the side to move has a piece other than the pawns and the king. Without one
+it's often in zugzwang, where passing would be the best move if it could, so
+the null move would say the position is better than it is
+"""
+
+
+def hasPieces(gs):
+    return gs.nonPawnCount["w" if gs.whiteToMove else "b"] > 0
+
+
+"""
+the quiescence search: at the depth horizon we keep going, but only with the
+captures and promotions, until the position is quiet. The side to move can
+always "stand pat" and take the static score if every capture looks worse,
+and that score is also what cuts the search off early. When in check there's
+no standing pat, so all the evasions are searched instead
+"""
+
+
+def quiescenceSearch(gs, alpha, beta, turnMultiplier, info):
+    info.nodes += 1
+    info.quiescenceNodes += 1
+    if info.nodes % NODES_BETWEEN_CHECKS == 0 and info.rootDepth > 1:
+        info.checkBudget()
+    ply = len(gs.moveLog) - info.rootPly
+    # the captures that beat alpha go on the line too, standing pat ends it
+    pvTable = info.pvTable
+    pvTable[ply] = []
+    if gs.inCheck():
+        moves = gs.getValidMoves()
+        if len(moves) == 0:
+            return -(CHECKMATE - ply)  # checkmate
+        maxScore = -CHECKMATE
+    else:
+        maxScore = turnMultiplier * info.evaluate(gs)  # stand pat
+        if maxScore >= beta:
+            return maxScore
+        if maxScore > alpha:
+            alpha = maxScore
+        moves = gs.getCaptureMoves()
+    info.ordering.orderMoves(moves, ply)
+    for move in moves:
+        gs.makeMove(move)
+        score = -quiescenceSearch(gs, -beta, -alpha, -turnMultiplier, info)
+        gs.undoMove()
+        if score > maxScore:
+            maxScore = score
+            if maxScore > alpha:
+                alpha = maxScore
+                pvTable[ply] = [move] + pvTable[ply + 1]
+                if alpha >= beta:
+                    break
     return maxScore
 
 
@@ -164,22 +955,53 @@ def scoreBoard(gs):
             return CHECKMATE  # white wins
     elif gs.stalemate:
         return STALEMATE
-    score = 0
-    for row in range(len(gs.board)):
-        for col in range(len(gs.board[row])):
-            square = gs.board[row][col]
-            if square != "--":
-                pps = 0
-                fac = 0.1
-                color = square[0]
-                piece = square[1]
-                if piece != "K":
-                    pps += (
-                        piecePositionScores[piece if piece != "p" else square][row][col]
-                        * fac
-                    )
-                if color == "w":
-                    score += pieceScore[piece] + pps
-                elif color == "b":
-                    score -= pieceScore[piece] + pps
+    if DEBUG_EVALUATION:
+        checkIncrementalScores(gs)
+    if USE_EVALUATION_CACHE:
+        score = evaluationCache.probe(gs.zobristKey)
+        if score is not None:
+            return score
+    # the material and the piece-square scores are kept as running totals by
+    # makeMove() and undoMove(), so there's no need to walk the board here
+    score = gs.materialScore + gs.positionScore
+    if USE_PAWN_STRUCTURE:
+        pawns = pawnHashTable.probe(gs.pawnKey)
+        if pawns is None:
+            pawns = evaluatePawns(gs.board)
+            pawnHashTable.store(gs.pawnKey, pawns)
+        score += pawns
+    score /= SCORE_UNITS
+    if USE_EVALUATION_CACHE:
+        evaluationCache.store(gs.zobristKey, score)
     return score
+
+
+""" empty the evaluation caches, they have to be after the piece values change """
+
+
+def clearEvaluationCaches():
+    evaluationCache.clear()
+    pawnHashTable.clear()
+
+
+""" compare the running totals and the pawn key of the GameState with a full walk over the board """
+
+
+def checkIncrementalScores(gs):
+    if gs.pawnKey != Zobrist.hashPawns(gs):
+        raise AssertionError(
+            "incremental pawn key doesn't match the board after %s"
+            % [str(move) for move in gs.moveLog]
+        )
+    material, position = evaluateBoard(gs.board)
+    if (material, position) != (gs.materialScore, gs.positionScore):
+        raise AssertionError(
+            "incremental scores (%d, %d) don't match the board (%d, %d) after %s"
+            % (
+                gs.materialScore,
+                gs.positionScore,
+                material,
+                position,
+                [str(move) for move in gs.moveLog],
+            )
+        )
@@ -0,0 +1,620 @@
+"""
+Endgame tablebases for the few-piece endings where a short search just walks
+around: KQK, KRK, KPK, KBNK and any other lone king against a king with one
+or two pieces. Every legal position of such an ending gets the exact number
+of plies to the mate, so the AI plays them perfectly and without searching.
+
+The tables are built here by retrograde analysis: the mates are found first,
+then the positions one ply before a mate, then two plies before, and so on
+going backwards through the moves (the "unmoves"), until nothing changes.
+A position with the lone king to move is lost once all its moves are known
+to lose, and one with the strong side to move is won as soon as one of its
+moves reaches a lost position. Whatever is left is a draw. A capture by the
+lone king or a promotion leaves the table, so the smaller tables it goes to
+are built first.
+
+Every table has one byte per position, the index is
+    ((side to move * king squares + strong king) * 64 + lone king) * 64 + pieces...
+where the strong king is only on one corner of the board: the a1-d4 quarter,
+or the a-d half when there are pawns, the other positions are the same ones
+flipped. The strong side is always white in a table, a position where black
+is the strong side is probed upside down with the colors swapped. The value
+of a position is from the side to move's view:
+    0       a draw
+    255     not a legal position
+    v       a mate in v - 1 plies: the side to move wins if v is even and
+            gets mated if v is odd (1 means it's already checkmated)
+All the tables go in one file, a header with the name, the offset and the
+size of each table and then the tables themselves. The file is memory mapped,
+so a probe only reads the page it needs.
+
+    python3 Tablebase.py build                  KQK, KRK, KPK and KBNK in tablebases.bin
+    python3 Tablebase.py build KRBK -o more.bin
+    python3 Tablebase.py probe tablebases.bin --fen "<fen>"
+
+The tables with a bishop and a knight take a few minutes to build.
+"""
+import argparse
+import mmap
+import struct
+import time
+from collections import defaultdict
+from itertools import product
+
+from ChessEngine import GameState
+
+DRAW = 0
+INVALID = 255
+# the longest mate a byte can hold, in plies
+MAX_DISTANCE = 253
+MAGIC = b"PYCHESTB"
+HEADER = struct.Struct(">8sI")  # the magic and how many tables
+TABLE_ENTRY = struct.Struct(">8sQQ")  # the name, the offset and the size of a table
+# the pieces of the strong side after its king, in the order of the table names
+PIECE_ORDER = "QRBNP"
+# the materials nobody can mate with, they don't need a table
+TRIVIAL_DRAWS = ("KK", "KBK", "KNK")
+DEFAULT_TABLES = ("KQK", "KRK", "KPK", "KBNK")
+STRONG_TO_MOVE = 0
+WEAK_TO_MOVE = 1
+
+
+""" where a piece goes from each square by repeating steps, sliding or only one step """
+
+
+def _rays(steps, slide):
+    rays = []
+    for sq in range(64):
+        r, c = divmod(sq, 8)
+        squareRays = []
+        for dr, dc in steps:
+            ray = []
+            row, col = r + dr, c + dc
+            while 0 <= row < 8 and 0 <= col < 8:
+                ray.append(row * 8 + col)
+                if not slide:
+                    break
+                row, col = row + dr, col + dc
+            if ray:
+                squareRays.append(ray)
+        rays.append(squareRays)
+    return rays
+
+
+ROCK_STEPS = ((-1, 0), (1, 0), (0, -1), (0, 1))
+BISHOP_STEPS = ((-1, -1), (-1, 1), (1, -1), (1, 1))
+KNIGHT_STEPS = ((-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1))
+sliderRays = {
+    "R": _rays(ROCK_STEPS, True),
+    "B": _rays(BISHOP_STEPS, True),
+    "Q": _rays(ROCK_STEPS + BISHOP_STEPS, True),
+}
+kingTargets = [
+    [ray[0] for ray in rays] for rays in _rays(ROCK_STEPS + BISHOP_STEPS, False)
+]
+knightTargets = [[ray[0] for ray in rays] for rays in _rays(KNIGHT_STEPS, False)]
+# the same as bits, to test a square with one shift
+kingAttacks = [sum(1 << sq for sq in targets) for targets in kingTargets]
+knightAttacks = [sum(1 << sq for sq in targets) for targets in knightTargets]
+# the squares a white pawn attacks
+pawnAttacks = [
+    sum(1 << sq for sq in (s - 9, s - 7) if s >= 8 and abs((sq & 7) - (s & 7)) == 1)
+    for s in range(64)
+]
+# for every (from, to) pair: 1 on the same rank or file, 2 on the same diagonal,
+# 0 otherwise, and the bits of the squares between them
+lines = [0] * 4096
+between = [0] * 4096
+for _kind, _line in (("R", 1), ("B", 2)):
+    for _sq in range(64):
+        for _ray in sliderRays[_kind][_sq]:
+            _bits = 0
+            for _to in _ray:
+                lines[_sq * 64 + _to] = _line
+                between[_sq * 64 + _to] = _bits
+                _bits |= 1 << _to
+
+
+""" if the strong pieces, as (kind, square) pairs, attack the target square """
+
+
+def _attacked(target, strong, occupied):
+    for kind, sq in strong:
+        if kind == "K":
+            if kingAttacks[sq] >> target & 1:
+                return True
+        elif kind == "N":
+            if knightAttacks[sq] >> target & 1:
+                return True
+        elif kind == "P":
+            if pawnAttacks[sq] >> target & 1:
+                return True
+        else:
+            line = lines[sq * 64 + target]
+            if (
+                line
+                and (kind == "Q" or line == (1 if kind == "R" else 2))
+                and not between[sq * 64 + target] & occupied
+            ):
+                return True
+    return False
+
+
+""" the squares the strong piece could have come from, without a capture """
+
+
+def _unmoveTargets(kind, sq, occupied):
+    if kind == "P":
+        # the white pawns go up the board, so they come from below
+        targets = []
+        if sq + 8 < 56 and not occupied >> (sq + 8) & 1:
+            targets.append(sq + 8)
+            if sq >> 3 == 4 and not occupied >> (sq + 16) & 1:
+                targets.append(sq + 16)  # the two squares first move
+        return targets
+    if kind == "K":
+        return [t for t in kingTargets[sq] if not occupied >> t & 1]
+    if kind == "N":
+        return [t for t in knightTargets[sq] if not occupied >> t & 1]
+    targets = []
+    for ray in sliderRays[kind][sq]:
+        for t in ray:
+            if occupied >> t & 1:
+                break
+            targets.append(t)
+    return targets
+
+
+"""
+the name of the table for the strong pieces after the king, like "KBNK" for
+["N", "B"], and those pieces in the order of the name
+"""
+
+
+def tableName(pieces):
+    pieces = sorted(pieces, key=lambda piece: PIECE_ORDER.index(piece[0]))
+    return "K" + "".join(piece[0] for piece in pieces) + "K", pieces
+
+
+"""
+how the positions of one table are laid out: which squares the strong king
+can be on, how the other positions are flipped onto those, and the index
+"""
+
+
+class Layout:
+    def __init__(self, name):
+        if (
+            len(name) < 3
+            or name[0] != "K"
+            or name[-1] != "K"
+            or any(piece not in PIECE_ORDER for piece in name[1:-1])
+            or tableName(name[1:-1])[0] != name
+        ):
+            raise ValueError("not a table of a lone king: %r" % name)
+        self.name = name
+        self.pieces = list(name[1:-1])  # the pieces of the strong side after the king
+        self.hasPawns = "P" in self.pieces
+        flipCols = [sq ^ 7 for sq in range(64)]
+        flipRows = [sq ^ 56 for sq in range(64)]
+        if self.hasPawns:
+            # the pawns only go one way, so the board can only be mirrored left to right
+            self.kingSquares = [sq for sq in range(64) if sq & 7 < 4]
+            transforms = [list(range(64)), flipCols]
+        else:
+            self.kingSquares = [sq for sq in range(64) if sq & 7 < 4 and sq >> 3 >= 4]
+            transforms = [
+                list(range(64)),
+                flipCols,
+                flipRows,
+                [flipRows[sq] for sq in flipCols],
+            ]
+        self.kingSlots = [-1] * 64
+        for slot, sq in enumerate(self.kingSquares):
+            self.kingSlots[sq] = slot
+        # the first flip that takes each square of the strong king into kingSquares
+        self.transformOf = [
+            next(t for t in transforms if self.kingSlots[t[sq]] >= 0)
+            for sq in range(64)
+        ]
+        self.positionsPerSide = len(self.kingSquares) * 64 ** (len(self.pieces) + 1)
+        self.size = 2 * self.positionsPerSide
+
+    """
+    the index of a position: the side to move and the squares of the strong
+    king, the lone king and the other pieces in the order of the name
+    """
+
+    def index(self, side, squares):
+        t = self.transformOf[squares[0]]
+        index = side * len(self.kingSquares) + self.kingSlots[t[squares[0]]]
+        for sq in squares[1:]:
+            index = index * 64 + t[sq]
+        return index
+
+    """ the side to move and the squares of the position at the index """
+
+    def position(self, index):
+        squares = []
+        for _ in range(len(self.pieces) + 1):
+            index, sq = divmod(index, 64)
+            squares.append(sq)
+        side, slot = divmod(index, len(self.kingSquares))
+        squares.append(self.kingSquares[slot])
+        squares.reverse()
+        return side, squares
+
+
+"""
+the value of a position of a smaller table while building, given the strong
+pieces after the king as (kind, square) pairs
+"""
+
+
+def _subtableValue(subtables, side, strongKing, weakKing, pieces):
+    name, pieces = tableName(pieces)
+    if name in TRIVIAL_DRAWS:
+        return DRAW
+    layout, values = subtables[name]
+    return values[layout.index(side, [strongKing, weakKing] + [sq for _, sq in pieces])]
+
+
+""" the tables the captures and the promotions of the table go to """
+
+
+def dependencies(name):
+    pieces = name[1:-1]
+    names = set()
+    for i, piece in enumerate(pieces):
+        rest = pieces[:i] + pieces[i + 1 :]
+        names.add(tableName(rest)[0])
+        if piece == "P":
+            for promoted in "QRBN":
+                names.add(tableName(rest + promoted)[0])
+    return sorted(names - set(TRIVIAL_DRAWS))
+
+
+"""
+build one table by retrograde analysis, subtables has the (layout, values) of
+every table in dependencies(name). It returns (layout, values)
+"""
+
+
+def generate(name, subtables):
+    layout = Layout(name)
+    kinds = ["K"] + layout.pieces
+    values = bytearray(
+        layout.size
+    )  # a 0 is a draw once it's done, not known yet before
+    # the moves of each position with the lone king to move that aren't known to
+    # lose yet, it's lost when they get to 0
+    movesLeft = bytearray(layout.size)
+    # the longest mate the lone king can get into by capturing a piece
+    captureDistance = {}
+    # the positions to set at each distance to mate
+    pending = defaultdict(list)
+    index = -1
+    for side in (STRONG_TO_MOVE, WEAK_TO_MOVE):
+        for strongKing in layout.kingSquares:
+            for rest in product(range(64), repeat=len(kinds)):
+                index += 1
+                weakKing = rest[0]
+                squares = (strongKing,) + rest
+                occupied = 0
+                for sq in squares:
+                    occupied |= 1 << sq
+                if (
+                    bin(occupied).count("1") != len(squares)
+                    or kingAttacks[strongKing] >> weakKing & 1
+                    or any(
+                        kind == "P" and not 8 <= sq < 56
+                        for kind, sq in zip(layout.pieces, rest[1:])
+                    )
+                ):
+                    values[index] = INVALID
+                    continue
+                strong = list(zip(kinds, (strongKing,) + rest[1:]))
+                inCheck = _attacked(weakKing, strong, occupied)
+                if side == STRONG_TO_MOVE:
+                    if inCheck:
+                        values[index] = INVALID  # the lone king can't be in check there
+                        continue
+                    # a promotion wins if the smaller table says so
+                    best = None
+                    for j, (kind, sq) in enumerate(strong):
+                        if kind != "P" or sq >> 3 != 1 or occupied >> (sq - 8) & 1:
+                            continue
+                        for promoted in "QRBN":
+                            pieces = (
+                                strong[1:j] + [(promoted, sq - 8)] + strong[j + 1 :]
+                            )
+                            value = _subtableValue(
+                                subtables, WEAK_TO_MOVE, strongKing, weakKing, pieces
+                            )
+                            if (
+                                value % 2 == 1
+                                and value != INVALID
+                                and (best is None or value < best)
+                            ):
+                                best = value
+                    if best is not None:
+                        pending[best].append(index)
+                    continue
+                # the lone king to move: count its moves, and look up its captures
+                count = 0
+                worst = -1
+                canLose = True
+                withoutKing = occupied & ~(1 << weakKing)
+                for to in kingTargets[weakKing]:
+                    if kingAttacks[strongKing] >> to & 1:
+                        continue
+                    if not withoutKing >> to & 1:
+                        if not _attacked(to, strong, withoutKing):
+                            count += 1
+                        continue
+                    remaining = [piece for piece in strong[1:] if piece[1] != to]
+                    if _attacked(to, [strong[0]] + remaining, withoutKing):
+                        continue  # the piece is protected
+                    value = _subtableValue(
+                        subtables, STRONG_TO_MOVE, strongKing, to, remaining
+                    )
+                    if value == DRAW:
+                        canLose = False
+                    else:
+                        worst = max(worst, value - 1)
+                if not canLose:
+                    # an escape to a draw, this one never gets to 0
+                    movesLeft[index] = 128 + count
+                elif count:
+                    movesLeft[index] = count
+                    if worst >= 0:
+                        captureDistance[index] = worst
+                elif worst >= 0:
+                    pending[worst + 1].append(index)
+                elif inCheck:
+                    pending[0].append(index)  # checkmate
+    distance = 0
+    while pending:
+        if distance > MAX_DISTANCE:
+            raise ValueError("%s has mates longer than %d plies" % (name, MAX_DISTANCE))
+        for index in pending.pop(distance, ()):
+            if values[index]:
+                continue  # already found at a shorter distance
+            values[index] = distance + 1
+            side, squares = layout.position(index)
+            strongKing, weakKing = squares[0], squares[1]
+            occupied = 0
+            for sq in squares:
+                occupied |= 1 << sq
+            if side == WEAK_TO_MOVE:
+                # lost, so every move of the strong side that gets here wins
+                strong = [(kinds[0], strongKing)] + list(zip(kinds[1:], squares[2:]))
+                for j, (kind, sq) in enumerate(strong):
+                    for fromSq in _unmoveTargets(kind, sq, occupied):
+                        if kind == "K" and kingAttacks[fromSq] >> weakKing & 1:
+                            continue
+                        before = strong[:j] + [(kind, fromSq)] + strong[j + 1 :]
+                        if _attacked(
+                            weakKing, before, occupied & ~(1 << sq) | 1 << fromSq
+                        ):
+                            continue  # the lone king would have been in check
+                        # the strong king is the first square, the lone king the second
+                        fromSquares = list(squares)
+                        fromSquares[j + 1 if j else 0] = fromSq
+                        before = layout.index(STRONG_TO_MOVE, fromSquares)
+                        if not values[before]:
+                            pending[distance + 1].append(before)
+            else:
+                # won, so one more move of the lone king that loses
+                for fromSq in kingTargets[weakKing]:
+                    if occupied >> fromSq & 1 or kingAttacks[strongKing] >> fromSq & 1:
+                        continue
+                    before = layout.index(
+                        WEAK_TO_MOVE, [strongKing, fromSq] + squares[2:]
+                    )
+                    movesLeft[before] -= 1
+                    if movesLeft[before] == 0:
+                        pending[
+                            max(distance, captureDistance.get(before, -1)) + 1
+                        ].append(before)
+        distance += 1
+    return layout, values
+
+
+"""
+build the tables and the ones they depend on, and write them all in one file.
+It returns the names of the tables in the file
+"""
+
+
+def buildFile(names, path, verbose=True):
+    tables = {}
+
+    def build(name):
+        if name in tables:
+            return
+        for dependency in dependencies(name):
+            build(dependency)
+        start = time.perf_counter()
+        tables[name] = generate(name, tables)
+        if verbose:
+            values = tables[name][1]
+            longest = max(
+                (v - 1 for v in values if v not in (DRAW, INVALID)), default=0
+            )
+            wins = sum(1 for v in values if v != INVALID and v and v % 2 == 0)
+            losses = sum(1 for v in values if v != INVALID and v % 2 == 1)
+            draws = values.count(DRAW)
+            print(
+                "%-6s %9d positions, %d won, %d lost, %d drawn, longest mate %d plies, %.1fs"
+                % (
+                    name,
+                    wins + losses + draws,
+                    wins,
+                    losses,
+                    draws,
+                    longest,
+                    time.perf_counter() - start,
+                )
+            )
+
+    for name in names:
+        build(Layout(name).name)
+    offset = HEADER.size + TABLE_ENTRY.size * len(tables)
+    with open(path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, len(tables)))
+        for name, (layout, values) in tables.items():
+            f.write(TABLE_ENTRY.pack(name.encode(), offset, len(values)))
+            offset += len(values)
+        for layout, values in tables.values():
+            f.write(values)
+    return list(tables)
+
+
+""" the tables of a file made by buildFile(), memory mapped """
+
+
+class Tablebases:
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "rb")
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, count = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError("%s is not a tablebase file" % path)
+        # the name of each table -> (layout, offset)
+        self.tables = {}
+        for i in range(count):
+            name, offset, size = TABLE_ENTRY.unpack_from(
+                self.data, HEADER.size + i * TABLE_ENTRY.size
+            )
+            layout = Layout(name.rstrip(b"\0").decode())
+            if layout.size != size or offset + size > len(self.data):
+                self.close()
+                raise ValueError("the table %s of %s is broken" % (layout.name, path))
+            self.tables[layout.name] = (layout, offset)
+        # the most pieces a position can have to be in one of the tables
+        self.maxPieces = max((len(name) for name in self.tables), default=0)
+
+    """
+    the value of the position on the board (see the top of the file), None if
+    it isn't in the tables. The castling rights and the enpassant square
+    don't count, so the GameState has to check those itself
+    """
+
+    def probeBoard(self, board, whiteToMove):
+        white = []
+        black = []
+        for r in range(8):
+            row = board[r]
+            for c in range(8):
+                piece = row[c]
+                if piece != "--":
+                    (white if piece[0] == "w" else black).append(
+                        (piece[1].upper(), r * 8 + c)
+                    )
+        strongIsWhite = len(white) >= len(black)
+        strong, weak = (white, black) if strongIsWhite else (black, white)
+        kings = [sq for kind, sq in strong if kind == "K"]
+        if len(weak) != 1 or weak[0][0] != "K" or len(kings) != 1:
+            return None  # no lone king, or a king is missing
+        strongKing, weakKing = kings[0], weak[0][1]
+        if not strongIsWhite:
+            # upside down, so the black pieces become white ones going up the board
+            strong = [(kind, sq ^ 56) for kind, sq in strong]
+            strongKing, weakKing = strongKing ^ 56, weakKing ^ 56
+        name, pieces = tableName([piece for piece in strong if piece[0] != "K"])
+        if name in TRIVIAL_DRAWS:
+            return DRAW
+        table = self.tables.get(name)
+        if table is None:
+            return None
+        layout, offset = table
+        side = STRONG_TO_MOVE if whiteToMove == strongIsWhite else WEAK_TO_MOVE
+        squares = [strongKing, weakKing] + [sq for _, sq in pieces]
+        value = self.data[offset + layout.index(side, squares)]
+        return None if value == INVALID else value
+
+    """ the value of the position of gs, or None if it isn't in the tables """
+
+    def probe(self, gs):
+        if gs.castleRights:
+            return None
+        return self.probeBoard(gs.board, gs.whiteToMove)
+
+    """
+    the best move of the position by the tables: the fastest mate when winning,
+    a move that keeps the draw, or the longest way to get mated. It returns
+    (move, value of the position) or None if the position isn't in the tables
+    """
+
+    def bestMove(self, gs, validMoves):
+        if not validMoves or self.probe(gs) is None:
+            return None
+        best = None
+        for move in validMoves:
+            gs.makeMove(move)
+            value = self.probe(gs)
+            gs.undoMove()
+            if value is None:
+                return None
+            # what the move is worth to us, the bigger the better
+            if value == DRAW:
+                rank = 0
+            elif value % 2 == 1:
+                rank = 2 * MAX_DISTANCE - value  # they get mated
+            else:
+                rank = value - 2 * MAX_DISTANCE
+            if best is None or rank > best[0]:
+                best = (rank, move, DRAW if value == DRAW else value + 1)
+        return best[1], best[2]
+
+    def close(self):
+        self.data.close()
+        self.file.close()
+
+
+""" the value of a position in words """
+
+
+def describe(value):
+    if value is None:
+        return "not in the tables"
+    if value == DRAW:
+        return "draw"
+    if value % 2 == 0:
+        return "the side to move mates in %d plies" % (value - 1)
+    if value == 1:
+        return "checkmate"
+    return "the side to move gets mated in %d plies" % (value - 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="endgame tablebases")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="build tables into a file")
+    build.add_argument("tables", nargs="*", default=DEFAULT_TABLES)
+    build.add_argument("-o", "--output", default="tablebases.bin")
+    probe = commands.add_parser("probe", help="look up a position and its moves")
+    probe.add_argument("file")
+    probe.add_argument("--fen", required=True)
+    args = parser.parse_args()
+    if args.command == "build":
+        names = buildFile(args.tables, args.output)
+        print("%s written to %s" % (" ".join(names), args.output))
+        return 0
+    tablebases = Tablebases(args.file)
+    gs = GameState.fromFEN(args.fen)
+    print(describe(tablebases.probe(gs)))
+    for move in gs.getValidMoves():
+        gs.makeMove(move)
+        value = tablebases.probe(gs)
+        gs.undoMove()
+        print("  %-6s %s" % (move, describe(value)))
+    tablebases.close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
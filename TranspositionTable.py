@@ -0,0 +1,141 @@
+"""
+A fixed size transposition table for the search. It remembers the result of
+every position the negamax has searched, keyed by the GameState.zobristKey,
+so when the same position comes again through another move order we can
+reuse it instead of searching it from scratch.
+
+The whole table is one preallocated buffer, so its memory use is fixed by
+the size we ask for and it doesn't grow during the search. Every entry is
+two unsigned 64-bit words:
+    word 0: the zobrist key xor'ed with word 1 (so a half written entry won't match)
+    word 1: the packed data:
+        bits  0-15  the best move id + 1 (0 means no move)
+        bits 16-23  the depth it was searched to
+        bits 24-25  the bound type: EXACT, LOWER or UPPER
+        bits 26-31  the age (which search stored it)
+        bits 32-63  the score in hundredths, offset to be positive
+The entries go in buckets of two: the first slot keeps the deepest result
+and the second one always takes the newest one.
+
+The buffer can also be given from outside, like the buf of a
+multiprocessing.shared_memory.SharedMemory, so several search processes can
+share one table. There are no locks: two processes writing the same entry at
+once can only leave words that don't match the key, and that reads as empty.
+"""
+
+EXACT = 0  # the score is the real value of the position
+LOWER = 1  # the search failed high, so the real value is at least the score
+UPPER = 2  # the search failed low, so the real value is at most the score
+
+ENTRY_SIZE = 16  # bytes
+SCORE_SCALE = 100
+SCORE_OFFSET = 1 << 31
+
+
+""" how many bytes the table takes for the given size, a power of two up to sizeMB """
+
+
+def bufferSize(sizeMB):
+    # the number of buckets is a power of two, so finding a bucket is just a mask
+    buckets = 1
+    while buckets * 4 * ENTRY_SIZE <= sizeMB * 1024 * 1024:
+        buckets *= 2
+    return buckets * 2 * ENTRY_SIZE
+
+
+class TranspositionTable:
+    def __init__(self, sizeMB=16, buffer=None):
+        size = bufferSize(sizeMB)
+        self.bucketMask = size // (2 * ENTRY_SIZE) - 1
+        if buffer is None:
+            buffer = bytearray(size)
+        self.buffer = buffer
+        self.words = memoryview(buffer)[:size].cast("Q")
+        self.age = 0
+        # counters to size the table: how many times we looked and found something
+        self.probes = 0
+        self.hits = 0
+        self.stores = 0
+
+    """ forget everything, for a new game """
+
+    def clear(self):
+        self.words.cast("B")[:] = bytes(self.memoryUsage())
+        self.age = 0
+        self.probes = 0
+        self.hits = 0
+        self.stores = 0
+
+    """ called once per search, so the results of the old searches get replaced first """
+
+    def newSearch(self):
+        self.age = (self.age + 1) & 63
+
+    """ the (depth, bound, score, moveID) stored for the key, or None if there's nothing """
+
+    def probe(self, key):
+        self.probes += 1
+        words = self.words
+        index = (key & self.bucketMask) * 4
+        for slot in (index, index + 2):
+            data = words[slot + 1]
+            if data and words[slot] ^ data == key:
+                self.hits += 1
+                return (
+                    (data >> 16) & 0xFF,
+                    (data >> 24) & 3,
+                    ((data >> 32) - SCORE_OFFSET) / SCORE_SCALE,
+                    (data & 0xFFFF) - 1,
+                )
+        return None
+
+    def store(self, key, depth, bound, score, moveID=-1):
+        self.stores += 1
+        words = self.words
+        index = (key & self.bucketMask) * 4
+        data = (
+            (moveID + 1)
+            | depth << 16
+            | bound << 24
+            | self.age << 26
+            | (round(score * SCORE_SCALE) + SCORE_OFFSET) << 32
+        )
+        # the depth preferred slot takes it if it's the same position, if it's empty,
+        # if what's there is from an older search or if we searched deeper this time
+        old = words[index + 1]
+        if (
+            not old
+            or words[index] ^ old == key
+            or (old >> 26) & 63 != self.age
+            or depth >= (old >> 16) & 0xFF
+        ):
+            slot = index
+        else:
+            slot = index + 2
+        words[slot] = key ^ data
+        words[slot + 1] = data
+
+    """ how many of the probes found their position, from 0 to 1 """
+
+    def hitRate(self):
+        return self.hits / self.probes if self.probes else 0.0
+
+    """ the memory taken by the entries in bytes """
+
+    def memoryUsage(self):
+        return len(self.words) * 8
+
+    def capacity(self):
+        return (self.bucketMask + 1) * 2
+
+    """ how full the table is, from 0 to 1, looking at the first 1000 entries like the UCI hashfull """
+
+    def fillRate(self):
+        sample = min(self.capacity(), 1000)
+        used = sum(1 for i in range(sample) if self.words[i * 2 + 1])
+        return used / sample
+
+    """ let go of the buffer, a shared memory block can't be closed while we still look at it """
+
+    def release(self):
+        self.words.release()
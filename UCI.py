@@ -0,0 +1,390 @@
+"""
+A UCI front end, so the engine can play in the chess GUIs and the match
+managers that speak the Universal Chess Interface: it reads the commands
+from stdin and answers on stdout.
+
+The commands are read on the main thread and the search runs on a thread of
+its own, so "stop", "ponderhit" and "isready" are answered while it thinks.
+The search looks at its SearchControl with the clock, every
+NODES_BETWEEN_CHECKS nodes, and that's what stops it: a "stop", or the time
+it was given running out. While pondering or with "go infinite" the clock
+isn't running, and the best move is held back until "ponderhit" or "stop".
+After every depth an info line has the depth, the score, the nodes, the
+nodes per second and the principal variation from the transposition table.
+
+    python3 UCI.py
+"""
+import sys
+import threading
+import time
+
+import SmartMoveFinder
+from ChessEngine import GameState, STARTING_FEN
+from OpeningBook import loadRandoms
+from TranspositionTable import TranspositionTable
+
+ENGINE_NAME = "Python Chess Engine"
+# a search with no depth limit still stops there, it's the clock that stops it first
+MAX_SEARCH_DEPTH = 64
+# the moves left we think the clock has to last for when there's no movestogo
+MOVES_TO_GO = 30
+# kept back from every move for the time the GUI takes to get it, in seconds
+MOVE_OVERHEAD = 0.05
+# the most search processes the Threads option can ask for
+MAX_THREADS = 64
+
+
+"""
+what the search looks at to know if it should stop, like a threading.Event:
+a "stop" came or the time is up. The clock only starts when we aren't
+pondering, so a "ponderhit" starts it
+"""
+
+
+class SearchControl:
+    def __init__(self, timeLimit=None, pondering=False, infinite=False):
+        self.timeLimit = timeLimit
+        self.pondering = pondering
+        self.infinite = infinite
+        self.deadline = None
+        self.stopped = threading.Event()
+        # set when the best move can be sent, not before a ponderhit or a stop
+        self.canAnswer = threading.Event()
+        if not pondering:
+            self.startClock()
+
+    def startClock(self):
+        self.pondering = False
+        if self.timeLimit is not None:
+            self.deadline = time.perf_counter() + self.timeLimit
+        if not self.infinite:
+            self.canAnswer.set()
+
+    def stop(self):
+        self.stopped.set()
+        self.canAnswer.set()
+
+    def is_set(self):
+        return self.stopped.is_set() or (
+            self.deadline is not None and time.perf_counter() >= self.deadline
+        )
+
+
+""" the score as UCI has it: "cp <centipawns>" or "mate <moves>", negative when we get mated """
+
+
+def uciScore(score):
+    if abs(score) < SmartMoveFinder.MATE_SCORE:
+        return "cp %d" % round(score * 100)
+    # the mate scores are CHECKMATE minus the plies to the checkmate
+    plies = SmartMoveFinder.CHECKMATE - abs(score)
+    moves = (round(plies) + 1) // 2
+    return "mate %d" % (moves if score > 0 else -moves)
+
+
+"""
+the time for one move from the go parameters, None for no limit: all of
+movetime, or a share of the clock plus most of the increment
+"""
+
+
+def timeForMove(params, whiteToMove):
+    if "movetime" in params:
+        return max(0.01, params["movetime"] / 1000 - MOVE_OVERHEAD)
+    clock = params.get("wtime" if whiteToMove else "btime")
+    if clock is None:
+        return None
+    increment = params.get("winc" if whiteToMove else "binc", 0)
+    movesToGo = params.get("movestogo") or MOVES_TO_GO
+    limit = clock / movesToGo + increment * 3 / 4
+    # never more than half of what's left on the clock
+    limit = min(limit, clock / 2) / 1000 - MOVE_OVERHEAD
+    return max(0.01, limit)
+
+
+class UCIEngine:
+    def __init__(self, output=sys.stdout, useBitboards=True):
+        self.output = output
+        self.useBitboards = useBitboards
+        # more than one runs the Lazy SMP search of SmartMoveFinder.findBestMoveParallel()
+        self.threads = 1
+        # the GUI can send any promotion, so the underpromotions are generated too
+        self.gs = GameState(useBitboards, underpromotions=True)
+        self.outputLock = threading.Lock()
+        self.thread = None
+        self.control = None
+
+    def send(self, line):
+        with self.outputLock:
+            self.output.write(line + "\n")
+            self.output.flush()
+
+    """ run one command line, it returns False on "quit" """
+
+    def handle(self, line):
+        words = line.split()
+        if not words:
+            return True
+        command, args = words[0], words[1:]
+        if command == "uci":
+            self.send("id name %s" % ENGINE_NAME)
+            self.send("id author the %s authors" % ENGINE_NAME)
+            self.send(
+                "option name Hash type spin default %d min 1 max 1024"
+                % SmartMoveFinder.TT_SIZE_MB
+            )
+            self.send(
+                "option name Threads type spin default 1 min 1 max %d" % MAX_THREADS
+            )
+            self.send("option name Ponder type check default false")
+            self.send("option name OwnBook type check default true")
+            self.send(
+                "option name BookFile type string default %s"
+                % SmartMoveFinder.OPENING_BOOK_PATH
+            )
+            self.send("option name BookRandoms type string default <empty>")
+            self.send("option name Tablebases type check default true")
+            self.send(
+                "option name TablebaseFile type string default %s"
+                % SmartMoveFinder.TABLEBASES_PATH
+            )
+            self.send("option name SearchStatsFile type string default <empty>")
+            self.send("uciok")
+        elif command == "isready":
+            self.send("readyok")
+        elif command == "setoption":
+            self.stopSearch()
+            self.setOption(args)
+        elif command == "ucinewgame":
+            self.stopSearch()
+            SmartMoveFinder.transpositionTable.clear()
+            SmartMoveFinder.clearEvaluationCaches()
+        elif command == "position":
+            self.stopSearch()
+            self.setPosition(args)
+        elif command == "go":
+            self.stopSearch()
+            self.go(args)
+        elif command == "stop":
+            self.stopSearch()
+        elif command == "ponderhit":
+            if self.control is not None:
+                self.control.startClock()
+        elif command == "quit":
+            self.stopSearch()
+            return False
+        elif command not in ("debug", "register"):
+            self.send("info string unknown command %s" % command)
+        return True
+
+    """ setoption name <name> [value <value>], the names can have spaces """
+
+    def setOption(self, args):
+        text = " ".join(args)
+        name, _, value = text.partition(" value ")
+        name = name.replace("name ", "", 1).strip().lower()
+        value = value.strip()
+        if name == "hash":
+            try:
+                size = max(1, int(value))
+            except ValueError:
+                self.send("info string Hash needs a number, not %s" % value)
+            else:
+                # the parallel search sizes its shared table from TT_SIZE_MB
+                SmartMoveFinder.TT_SIZE_MB = size
+                SmartMoveFinder.transpositionTable = TranspositionTable(size)
+        elif name == "threads":
+            try:
+                self.threads = min(max(1, int(value)), MAX_THREADS)
+            except ValueError:
+                self.send("info string Threads needs a number, not %s" % value)
+        elif name == "ownbook":
+            SmartMoveFinder.USE_OPENING_BOOK = value.lower() == "true"
+        elif name == "bookfile":
+            SmartMoveFinder.OPENING_BOOK_PATH = value
+            SmartMoveFinder.openingBook = None  # opened again from the new file
+        elif name == "bookrandoms":
+            # the Random64 table of the book keys, the Polyglot one when it's empty
+            path = None if value in ("", "<empty>") else value
+            if path is not None:
+                try:
+                    loadRandoms(path)
+                except (OSError, ValueError) as error:
+                    self.send("info string %s" % error)
+                    return
+            SmartMoveFinder.OPENING_BOOK_RANDOMS = path
+            SmartMoveFinder.openingBook = None
+        elif name == "tablebases":
+            SmartMoveFinder.USE_TABLEBASES = value.lower() == "true"
+        elif name == "tablebasefile":
+            SmartMoveFinder.TABLEBASES_PATH = value
+            SmartMoveFinder.tablebases = None
+        elif name == "searchstatsfile":
+            # a line of JSON for every search, see SearchStats.py
+            path = None if value in ("", "<empty>") else value
+            SmartMoveFinder.SEARCH_STATS_PATH = path
+            SmartMoveFinder.COLLECT_SEARCH_STATS = path is not None
+        elif name != "ponder":  # the GUI tells us, but pondering is its call
+            self.send("info string unknown option %s" % name)
+
+    """ position [startpos | fen <fen>] [moves <move> ...] """
+
+    def setPosition(self, args):
+        if "moves" in args:
+            split = args.index("moves")
+            args, moves = args[:split], args[split + 1 :]
+        else:
+            moves = []
+        if args and args[0] == "fen":
+            fen = " ".join(args[1:])
+        else:
+            fen = STARTING_FEN
+        try:
+            gs = GameState.fromFEN(fen, self.useBitboards, underpromotions=True)
+        except ValueError as error:
+            self.send("info string %s" % error)
+            return
+        for notation in moves:
+            move = self.findMove(gs, notation)
+            if move is None:
+                self.send("info string illegal move %s" % notation)
+                break
+            gs.makeMove(move)
+        self.gs = gs
+
+    """ the valid move of gs written like e2e4 or e7e8q, or None """
+
+    def findMove(self, gs, notation):
+        for move in gs.getValidMoves():
+            if move.getChessNotation() == notation.lower():
+                return move
+        return None
+
+    """ start searching the position with the go parameters, on a thread of its own """
+
+    def go(self, args):
+        params = {}
+        searchMoves = []
+        flags = set()
+        i = 0
+        while i < len(args):
+            word = args[i]
+            if word in ("ponder", "infinite"):
+                flags.add(word)
+            elif word == "searchmoves":
+                while i + 1 < len(args) and not args[i + 1].isalpha():
+                    i += 1
+                    searchMoves.append(args[i])
+            elif i + 1 < len(args):
+                try:
+                    params[word] = int(args[i + 1])
+                except ValueError:
+                    pass
+                i += 1
+            i += 1
+        gs = self.gs
+        validMoves = gs.getValidMoves()
+        if searchMoves:
+            chosen = [move.getChessNotation() for move in validMoves]
+            validMoves = [
+                move
+                for move, notation in zip(validMoves, chosen)
+                if notation in searchMoves
+            ]
+        maxDepth = params.get("depth", MAX_SEARCH_DEPTH)
+        if "mate" in params:
+            maxDepth = min(maxDepth, 2 * params["mate"] - 1)
+        timeLimit = timeForMove(params, gs.whiteToMove)
+        infinite = "infinite" in flags
+        self.control = SearchControl(
+            None if infinite else timeLimit, "ponder" in flags, infinite
+        )
+        self.thread = threading.Thread(
+            target=self.search,
+            args=(validMoves, maxDepth, params.get("nodes"), self.control),
+            daemon=True,
+        )
+        self.thread.start()
+
+    """ the search thread: search, report every depth and send the best move """
+
+    def search(self, validMoves, maxDepth, nodeLimit, control):
+        gs = self.gs
+        if self.threads > 1:
+            info = SmartMoveFinder.findBestMoveParallel(
+                gs,
+                validMoves,
+                None,
+                maxDepth,
+                None,
+                nodeLimit,
+                workers=self.threads,
+                stopEvent=control,
+                verbose=False,
+                onIteration=self.sendInfo,
+            )
+        else:
+            info = SmartMoveFinder.findBestMoveMinMax(
+                gs,
+                validMoves,
+                None,
+                maxDepth,
+                None,
+                nodeLimit,
+                stopEvent=control,
+                verbose=False,
+                onIteration=self.sendInfo,
+            )
+        control.canAnswer.wait()
+        if info.bestMove is None:
+            self.send("bestmove 0000")
+            return
+        pv = info.pv
+        if len(pv) > 1:
+            self.send(
+                "bestmove %s ponder %s"
+                % (pv[0].getChessNotation(), pv[1].getChessNotation())
+            )
+        else:
+            self.send("bestmove %s" % info.bestMove.getChessNotation())
+
+    def sendInfo(self, info):
+        elapsed = info.elapsed()
+        self.send(
+            "info depth %d score %s nodes %d nps %d time %d hashfull %d pv %s"
+            % (
+                info.depth,
+                uciScore(info.bestScore),
+                info.nodes,
+                info.nodes / elapsed if elapsed > 0 else 0,
+                elapsed * 1000,
+                SmartMoveFinder.transpositionTable.fillRate() * 1000,
+                " ".join(move.getChessNotation() for move in info.pv),
+            )
+        )
+
+    """ stop the search if there's one, and wait until it has sent its move """
+
+    def stopSearch(self):
+        if self.thread is not None:
+            self.control.stop()
+            self.thread.join()
+            self.thread = None
+            self.control = None
+
+
+def main():
+    engine = UCIEngine()
+    # the commands are read through a file of their own: the processes of the
+    # parallel search are forked while this thread waits on it, and each one
+    # closes sys.stdin first, which would wait forever for this thread's lock
+    commands = open(sys.stdin.fileno(), closefd=False)
+    for line in iter(commands.readline, ""):
+        if not engine.handle(line):
+            break
+    engine.stopSearch()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
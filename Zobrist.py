@@ -0,0 +1,65 @@
+"""
+Zobrist hashing: every (piece, square) pair, the side to move, every set of
+castling rights and every enpassant file gets its own random 64-bit number.
+The key of a position is the xor of the numbers of everything that's in it,
+so when a move is made we only need to xor out what left and xor in what
+came, instead of hashing the whole board again.
+"""
+import random
+
+# a fixed seed, so the keys are the same on every run and in every process
+_random = random.Random(20862086)
+
+pieceKeys = {
+    piece: [_random.getrandbits(64) for _ in range(64)]
+    for piece in (color + name for color in "wb" for name in "pNBRQK")
+}
+# xor'ed in when it's black to move
+sideKey = _random.getrandbits(64)
+# one key for each of the 16 combinations of the castling rights, see castleIndex()
+castleKeys = [_random.getrandbits(64) for _ in range(16)]
+# one key for each file an enpassant capture can happen on
+enpassantKeys = [_random.getrandbits(64) for _ in range(8)]
+
+
+""" the castling rights as a number from 0 to 15: wks, bks, wqs, bqs are bits 0 to 3 """
+
+
+def castleIndex(castleRights):
+    return (
+        castleRights.wks
+        | castleRights.bks << 1
+        | castleRights.wqs << 2
+        | castleRights.bqs << 3
+    )
+
+
+""" the key of a GameState computed from scratch """
+
+
+def hashPosition(gs):
+    key = 0
+    for r in range(8):
+        for c in range(8):
+            piece = gs.board[r][c]
+            if piece != "--":
+                key ^= pieceKeys[piece][r * 8 + c]
+    if not gs.whiteToMove:
+        key ^= sideKey
+    key ^= castleKeys[gs.castleRights]
+    if gs.enpassantPossible != ():
+        key ^= enpassantKeys[gs.enpassantPossible[1]]
+    return key
+
+
+""" the key of the pawns of a GameState alone, with the same numbers as hashPosition() """
+
+
+def hashPawns(gs):
+    key = 0
+    for r in range(8):
+        for c in range(8):
+            piece = gs.board[r][c]
+            if piece[1] == "p":
+                key ^= pieceKeys[piece][r * 8 + c]
+    return key